@@ -12,6 +12,8 @@ import socket
 import subprocess
 import threading
 import base64
+import gzip
+import zlib
 import getpass
 import shutil
 from datetime import datetime
@@ -36,6 +38,13 @@ try:
 except ImportError:
     ENCRYPTION_AVAILABLE = False
 
+# MessagePack enables the compact binary upload envelope; JSON is used without it
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
 # Configuration
 CONFIG = {
     'server_base_url': 'http://localhost:8000/api',
@@ -44,6 +53,7 @@ CONFIG = {
     'max_retries': 3,
     'timeout': 10,
     'batch_size': 50,
+    'compress_threshold': 1024,  # gzip request bodies larger than this many bytes
     'install_dir': '/opt/system_monitor',
     'config_file': '/etc/system_monitor/config.json',
     'log_file': '/var/log/system_monitor/system_monitor.log',
@@ -110,6 +120,14 @@ class EncryptionManager:
         
         encrypted_bytes = self.fernet.encrypt(data)
         return base64.urlsafe_b64encode(encrypted_bytes).decode('utf-8')
+    
+    def encrypt_envelope_token(self, data):
+        """Encrypt zlib-compressed MessagePack and return the raw (unencoded) Fernet token"""
+        if not self.fernet:
+            raise ValueError("Encryption not initialized")
+        
+        token = self.fernet.encrypt(zlib.compress(msgpack.packb(data)))
+        return base64.urlsafe_b64decode(token)
 
 class Installer:
     """Handles installation of the monitoring agent"""
@@ -144,7 +162,8 @@ class Installer:
         requirements = [
             'psutil>=5.8.0',
             'requests>=2.25.0',
-            'cryptography>=3.4.0'
+            'cryptography>=3.4.0',
+            'msgpack>=1.0.0'
         ]
         
         try:
@@ -432,6 +451,7 @@ class ConfigManager:
             'max_retries': CONFIG['max_retries'],
             'timeout': CONFIG['timeout'],
             'batch_size': CONFIG['batch_size'],
+            'compress_threshold': CONFIG['compress_threshold'],
             'setup_time': datetime.utcnow().isoformat()
         }
         
@@ -524,6 +544,7 @@ class SystemMonitor:
         self.agent_active = True
         self.last_status_check = 0
         self.status_check_interval = 600  # Check every 10 minutes
+        self.wire_format = 'json'  # Negotiated with the server in check_agent_status
         
         # Endpoint URLs
         self.logs_url = f"{self.config['server_base_url']}/logs/upload_logs/"
@@ -531,6 +552,36 @@ class SystemMonitor:
         self.processes_url = f"{self.config['server_base_url']}/processes/upload_processes/"
         self.config_url = f"{self.config['server_base_url']}/agents/config_by_hostname/"
 
+    def post_json(self, url, payload):
+        """POST a JSON payload, gzip-compressing it when it is large enough to be worth it"""
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        
+        if len(body) > self.config.get('compress_threshold', CONFIG['compress_threshold']):
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        
+        return requests.post(url, data=body, headers=headers, timeout=self.config['timeout'])
+    
+    def post_envelope(self, data, timestamp):
+        """POST encrypted logs as a version 1 MessagePack envelope"""
+        envelope = msgpack.packb({
+            'v': 1,
+            'hostname': self.config['hostname'],
+            'username': self.config['username'],
+            'timestamp': timestamp,
+            'codec': 'msgpack+zlib',
+            'token': self.encryption_mgr.encrypt_envelope_token(data)
+        })
+        
+        logging.debug(f"Sending {len(envelope)} byte log envelope")
+        return requests.post(
+            self.logs_url,
+            data=envelope,
+            headers={'Content-Type': 'application/octet-stream'},
+            timeout=self.config['timeout']
+        )
+    
     def check_agent_status(self):
         """Check if agent is active and approved on server"""
         current_time = time.time()
@@ -554,6 +605,10 @@ class SystemMonitor:
                 self.agent_active = is_active and is_approved
                 self.last_status_check = current_time
                 
+                # Use the binary envelope only when both sides support it
+                wire_formats = config_data.get('wire_formats', ['json'])
+                self.wire_format = 'msgpack-v1' if MSGPACK_AVAILABLE and 'msgpack-v1' in wire_formats else 'json'
+                
                 if not self.agent_active:
                     logging.info(f"Agent status: Active={is_active}, Approved={is_approved}")
                 
@@ -621,13 +676,9 @@ class SystemMonitor:
             return False
 
         try:
-            response = requests.post(
-                self.metrics_url,
-                json=metrics_data,
-                timeout=self.config['timeout']
-            )
+            response = self.post_json(self.metrics_url, metrics_data)
 
-            if response.status_code == 200:
+            if response.status_code in (200, 202):
                 logging.info("Metrics sent successfully")
                 return True
             else:
@@ -701,13 +752,9 @@ class SystemMonitor:
             return False
 
         try:
-            response = requests.post(
-                self.processes_url,
-                json=process_data,
-                timeout=self.config['timeout']
-            )
+            response = self.post_json(self.processes_url, process_data)
 
-            if response.status_code == 200:
+            if response.status_code in (200, 202):
                 logging.info("Processes sent successfully")
                 return True
             else:
@@ -1249,27 +1296,26 @@ class SystemMonitor:
             # Try with encryption first
             if self.encryption_mgr:
                 try:
-                    # Encrypt the data
-                    encrypted_data = self.encryption_mgr.encrypt_data(data)
-                    
-                    # Prepare payload with encrypted_data field
-                    payload = {
-                        'hostname': self.config['hostname'],
-                        'username': self.config['username'],
-                        'timestamp': timestamp,
-                        'encrypted_data': encrypted_data
-                    }
-                    
-                    logging.debug(f"Sending encrypted log payload")
-                    
-                    # Send to server
-                    response = requests.post(
-                        self.logs_url,
-                        json=payload,
-                        timeout=self.config['timeout']
-                    )
+                    if self.wire_format == 'msgpack-v1':
+                        response = self.post_envelope(data, timestamp)
+                    else:
+                        # Encrypt the data
+                        encrypted_data = self.encryption_mgr.encrypt_data(data)
+                        
+                        # Prepare payload with encrypted_data field
+                        payload = {
+                            'hostname': self.config['hostname'],
+                            'username': self.config['username'],
+                            'timestamp': timestamp,
+                            'encrypted_data': encrypted_data
+                        }
+                        
+                        logging.debug(f"Sending encrypted log payload")
+                        
+                        # Send to server
+                        response = self.post_json(self.logs_url, payload)
                     
-                    if response.status_code == 200:
+                    if response.status_code in (200, 202):
                         logging.info("Logs sent successfully (encrypted)")
                         self.error_count = 0
                         return True
@@ -1277,6 +1323,10 @@ class SystemMonitor:
                         logging.warning("Agent not authorized. Registration may be pending approval.")
                         self.agent_active = False
                         return False
+                    elif response.status_code == 415:
+                        logging.warning("Server rejected the binary envelope, switching back to JSON")
+                        self.wire_format = 'json'
+                        return False
                     elif response.status_code == 400:
                         error_text = response.text
                         logging.warning(f"Encrypted upload failed (400): {error_text}")
@@ -1298,13 +1348,9 @@ class SystemMonitor:
                 'logs': data if isinstance(data, list) else [data]
             }
             
-            response = requests.post(
-                self.logs_url,
-                json=payload_unencrypted,
-                timeout=self.config['timeout']
-            )
+            response = self.post_json(self.logs_url, payload_unencrypted)
             
-            if response.status_code == 200:
+            if response.status_code in (200, 202):
                 logging.info("Logs sent successfully (unencrypted)")
                 self.error_count = 0
                 return True
@@ -2,7 +2,7 @@
 import React, { useState, useEffect } from 'react';
 import { getAlerts, resolveAlert, unresolveAlert, deleteAlert, addAlertNote, bulkResolveAlerts, bulkUnresolveAlerts, bulkDeleteAlerts, getAgents } from '../services/api';
 import AlertItem from './AlertItem';
-import { Filter, CheckSquare, Square, RefreshCw, ChevronLeft, ChevronRight, MoreHorizontal } from 'lucide-react';
+import { Filter, CheckSquare, Square, RefreshCw, ChevronLeft, ChevronRight } from 'lucide-react';
 
 const AlertsPanel = () => {
     const [alerts, setAlerts] = useState([]);
@@ -17,11 +17,13 @@ const AlertsPanel = () => {
     const [selectedAlerts, setSelectedAlerts] = useState(new Set());
     const [bulkAction, setBulkAction] = useState('');
 
+    // cursor is the page being shown (null = newest); next/previous come from the API
     const [pagination, setPagination] = useState({
-        current: 1,
+        cursor: null,
+        page: 1,
         pageSize: 20,
         total: 0,
-        totalPages: 0,
+        totalIsEstimate: false,
         next: null,
         previous: null
     });
@@ -30,7 +32,7 @@ const AlertsPanel = () => {
         loadData();
         const interval = setInterval(loadAlerts, 30000);
         return () => clearInterval(interval);
-    }, [filters, pagination.current]);
+    }, [filters, pagination.cursor, pagination.pageSize]);
 
     const loadData = async () => {
         await Promise.all([loadAgents(), loadAlerts()]);
@@ -48,30 +50,30 @@ const AlertsPanel = () => {
     const loadAlerts = async () => {
         try {
             setLoading(true);
-            const response = await getAlerts(filters, pagination.current, pagination.pageSize);
+            const response = await getAlerts(filters, pagination.cursor, pagination.pageSize);
             console.log('Alerts response:', response);
 
             setAlerts(response.alerts || []);
-            setPagination(response.pagination || {
-                current: 1,
-                pageSize: 20,
+            setPagination(prev => ({
+                ...prev,
                 total: 0,
-                totalPages: 0,
+                totalIsEstimate: false,
                 next: null,
-                previous: null
-            });
+                previous: null,
+                ...response.pagination,
+                pageSize: prev.pageSize
+            }));
             setSelectedAlerts(new Set());
         } catch (error) {
             console.error('Failed to load alerts:', error);
             setAlerts([]);
-            setPagination({
-                current: 1,
-                pageSize: 20,
+            setPagination(prev => ({
+                ...prev,
                 total: 0,
-                totalPages: 0,
+                totalIsEstimate: false,
                 next: null,
                 previous: null
-            });
+            }));
         } finally {
             setLoading(false);
         }
@@ -227,10 +229,11 @@ const AlertsPanel = () => {
         }
     };
 
-    const handlePageChange = (newPage) => {
+    const handlePageChange = (direction) => {
         setPagination(prev => ({
             ...prev,
-            current: newPage
+            cursor: direction === 'next' ? prev.next : prev.previous,
+            page: direction === 'next' ? prev.page + 1 : Math.max(1, prev.page - 1)
         }));
     };
 
@@ -238,7 +241,8 @@ const AlertsPanel = () => {
         setPagination(prev => ({
             ...prev,
             pageSize: parseInt(newSize),
-            current: 1
+            cursor: null,
+            page: 1
         }));
     };
 
@@ -249,42 +253,6 @@ const AlertsPanel = () => {
         critical: 'red'
     };
 
-    const getPageNumbers = () => {
-        const pages = [];
-        const totalPages = pagination.totalPages;
-        const currentPage = pagination.current;
-
-        if (totalPages <= 7) {
-            for (let i = 1; i <= totalPages; i++) {
-                pages.push(i);
-            }
-        } else {
-            if (currentPage <= 4) {
-                for (let i = 1; i <= 5; i++) {
-                    pages.push(i);
-                }
-                pages.push('...');
-                pages.push(totalPages);
-            } else if (currentPage >= totalPages - 3) {
-                pages.push(1);
-                pages.push('...');
-                for (let i = totalPages - 4; i <= totalPages; i++) {
-                    pages.push(i);
-                }
-            } else {
-                pages.push(1);
-                pages.push('...');
-                for (let i = currentPage - 1; i <= currentPage + 1; i++) {
-                    pages.push(i);
-                }
-                pages.push('...');
-                pages.push(totalPages);
-            }
-        }
-
-        return pages;
-    };
-
     const isAllOnCurrentPageSelected = alerts.length > 0 && selectedAlerts.size === alerts.length;
 
     return (
@@ -310,7 +278,7 @@ const AlertsPanel = () => {
                             value={filters.level}
                             onChange={(e) => {
                                 setFilters({ ...filters, level: e.target.value });
-                                setPagination(prev => ({ ...prev, current: 1 }));
+                                setPagination(prev => ({ ...prev, cursor: null, page: 1 }));
                             }}
                             className="border border-gray-300 rounded-lg px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-transparent"
                         >
@@ -325,7 +293,7 @@ const AlertsPanel = () => {
                             value={filters.resolved}
                             onChange={(e) => {
                                 setFilters({ ...filters, resolved: e.target.value });
-                                setPagination(prev => ({ ...prev, current: 1 }));
+                                setPagination(prev => ({ ...prev, cursor: null, page: 1 }));
                             }}
                             className="border border-gray-300 rounded-lg px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-transparent"
                         >
@@ -338,7 +306,7 @@ const AlertsPanel = () => {
                             value={filters.agent}
                             onChange={(e) => {
                                 setFilters({ ...filters, agent: e.target.value });
-                                setPagination(prev => ({ ...prev, current: 1 }));
+                                setPagination(prev => ({ ...prev, cursor: null, page: 1 }));
                             }}
                             className="border border-gray-300 rounded-lg px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-transparent"
                         >
@@ -437,44 +405,27 @@ const AlertsPanel = () => {
             </div>
 
             {/* Pagination */}
-            {pagination.totalPages > 1 && (
+            {(pagination.next || pagination.previous) && (
                 <div className="flex flex-col sm:flex-row justify-between items-center gap-4 pt-4 border-t border-gray-200">
                     <div className="text-sm text-gray-600">
-                        Showing {((pagination.current - 1) * pagination.pageSize) + 1} to{' '}
-                        {Math.min(pagination.current * pagination.pageSize, pagination.total)} of{' '}
-                        {pagination.total} alerts
+                        Page {pagination.page} of {pagination.totalIsEstimate ? '~' : ''}{pagination.total} alerts
                     </div>
 
                     <div className="flex items-center space-x-1">
                         <button
-                            onClick={() => handlePageChange(pagination.current - 1)}
+                            onClick={() => handlePageChange('previous')}
                             disabled={!pagination.previous}
                             className="p-2 rounded-lg border border-gray-300 hover:bg-gray-50 disabled:opacity-50 disabled:cursor-not-allowed transition-colors duration-200"
                         >
                             <ChevronLeft className="w-4 h-4" />
                         </button>
 
-                        {getPageNumbers().map((page, index) => (
-                            page === '...' ? (
-                                <span key={`ellipsis-${index}`} className="px-3 py-2 text-gray-500">
-                                    <MoreHorizontal className="w-4 h-4" />
-                                </span>
-                            ) : (
-                                <button
-                                    key={page}
-                                    onClick={() => handlePageChange(page)}
-                                    className={`px-3 py-2 rounded-lg text-sm font-medium transition-colors duration-200 ${pagination.current === page
-                                        ? 'bg-blue-600 text-white'
-                                        : 'border border-gray-300 text-gray-700 hover:bg-gray-50'
-                                        }`}
-                                >
-                                    {page}
-                                </button>
-                            )
-                        ))}
+                        <span className="px-3 py-2 rounded-lg text-sm font-medium bg-blue-600 text-white">
+                            {pagination.page}
+                        </span>
 
                         <button
-                            onClick={() => handlePageChange(pagination.current + 1)}
+                            onClick={() => handlePageChange('next')}
                             disabled={!pagination.next}
                             className="p-2 rounded-lg border border-gray-300 hover:bg-gray-50 disabled:opacity-50 disabled:cursor-not-allowed transition-colors duration-200"
                         >
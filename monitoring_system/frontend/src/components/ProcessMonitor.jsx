@@ -9,6 +9,8 @@ const ProcessMonitor = () => {
     const [loading, setLoading] = useState(false);
     const [currentPage, setCurrentPage] = useState(1);
     const [pageSize, setPageSize] = useState(50);
+    const [sort, setSort] = useState('-memory');
+    const [nameFilter, setNameFilter] = useState('');
 
     useEffect(() => {
         loadAgents();
@@ -18,7 +20,7 @@ const ProcessMonitor = () => {
         if (selectedAgent) {
             loadProcesses();
         }
-    }, [selectedAgent, currentPage, pageSize]);
+    }, [selectedAgent, currentPage, pageSize, sort, nameFilter]);
 
     const loadAgents = async () => {
         try {
@@ -46,7 +48,7 @@ const ProcessMonitor = () => {
 
         try {
             setLoading(true);
-            const data = await getProcesses(selectedAgent, currentPage, pageSize);
+            const data = await getProcesses(selectedAgent, currentPage, pageSize, { sort, name: nameFilter });
             console.log('Process data:', data);
             setProcessData(data);
         } catch (error) {
@@ -66,6 +68,16 @@ const ProcessMonitor = () => {
         setCurrentPage(1);
     };
 
+    const handleSortChange = (newSort) => {
+        setSort(newSort);
+        setCurrentPage(1);
+    };
+
+    const handleNameFilterChange = (value) => {
+        setNameFilter(value);
+        setCurrentPage(1);
+    };
+
     const formatBytes = (bytes) => {
         if (bytes === 0) return '0 B';
         const k = 1024;
@@ -98,6 +110,29 @@ const ProcessMonitor = () => {
                         ))}
                     </select>
 
+                    {processData && (
+                        <input
+                            type="text"
+                            value={nameFilter}
+                            onChange={(e) => handleNameFilterChange(e.target.value)}
+                            placeholder="Filter by name"
+                            className="border rounded-lg px-3 py-2"
+                        />
+                    )}
+
+                    {processData && (
+                        <select
+                            value={sort}
+                            onChange={(e) => handleSortChange(e.target.value)}
+                            className="border rounded-lg px-3 py-2"
+                        >
+                            <option value="-memory">Memory (high first)</option>
+                            <option value="-cpu">CPU (high first)</option>
+                            <option value="pid">PID</option>
+                            <option value="name">Name</option>
+                        </select>
+                    )}
+
                     {processData && (
                         <select
                             value={pageSize}
@@ -200,7 +235,7 @@ const ProcessMonitor = () => {
                                                     {formatBytes(process.memory_usage || 0)}
                                                 </td>
                                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
-                                                    {process.username || 'Unknown'}
+                                                    {process.user || process.username || 'Unknown'}
                                                 </td>
                                             </tr>
                                         ))
@@ -216,10 +251,10 @@ const ProcessMonitor = () => {
                         </div>
                     </div>
 
-                    {/* Top Memory Processes with Pagination */}
+                    {/* All Processes, sorted, filtered and paged by the server */}
                     <div className="bg-white rounded-lg shadow border">
                         <div className="p-4 border-b flex justify-between items-center">
-                            <h2 className="text-lg font-semibold">Top Memory Processes</h2>
+                            <h2 className="text-lg font-semibold">Processes ({processData.count || 0})</h2>
                             <div className="flex items-center space-x-4">
                                 <span className="text-sm text-gray-600">
                                     Page {currentPage} of {processData.total_pages || 1}
@@ -248,8 +283,8 @@ const ProcessMonitor = () => {
                                     </tr>
                                 </thead>
                                 <tbody className="bg-white divide-y divide-gray-200">
-                                    {processData.top_memory_processes && processData.top_memory_processes.length > 0 ? (
-                                        processData.top_memory_processes.map((process, index) => (
+                                    {processData.processes && processData.processes.length > 0 ? (
+                                        processData.processes.map((process, index) => (
                                             <tr key={index} className="hover:bg-gray-50">
                                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
                                                     {process.pid || 'N/A'}
@@ -270,14 +305,14 @@ const ProcessMonitor = () => {
                                                     {formatPercentage(process.cpu_percent)}
                                                 </td>
                                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
-                                                    {process.username || 'Unknown'}
+                                                    {process.user || process.username || 'Unknown'}
                                                 </td>
                                             </tr>
                                         ))
                                     ) : (
                                         <tr>
                                             <td colSpan="5" className="px-6 py-4 text-center text-gray-500">
-                                                No memory process data available
+                                                No processes match
                                             </td>
                                         </tr>
                                     )}
@@ -238,11 +238,17 @@ export const getRegistrationRequests = async () => {
 };
 
 // Processes
-export const getProcesses = async (hostname, page = 1, pageSize = 50) => {
+// query: sort ("cpu", "memory", "pid", "name"; "-" prefix = descending)
+// and the user, name, status and is_root filters, all applied server-side
+export const getProcesses = async (hostname, page = 1, pageSize = 50, query = {}) => {
   try {
-    const response = await api.get("/processes/list/", {
-      params: { hostname, page, page_size: pageSize },
+    const params = { hostname, page, page_size: pageSize, ...query };
+    Object.keys(params).forEach((key) => {
+      if (params[key] === undefined || params[key] === null || params[key] === "") {
+        delete params[key];
+      }
     });
+    const response = await api.get("/processes/list/", { params });
     return response.data;
   } catch (error) {
     console.error("Error fetching processes:", error);
@@ -254,20 +260,26 @@ export const getProcesses = async (hostname, page = 1, pageSize = 50) => {
       page: 1,
       page_size: pageSize,
       total_pages: 0,
+      count: 0,
       top_cpu_processes: [],
-      top_memory_processes: [],
+      processes: [],
       load_average: [],
     };
   }
 };
 
 // Alerts
-export const getAlerts = async (filters = {}, page = 1, pageSize = 20) => {
+const cursorFromLink = (link) =>
+  link ? new URL(link, window.location.origin).searchParams.get("cursor") : null;
+
+// Alerts are keyset-paginated: pass the cursor from a previous response's
+// next/previous link (null for the newest page) instead of a page number
+export const getAlerts = async (filters = {}, cursor = null, pageSize = 20) => {
   try {
-    console.log("📄 Fetching alerts with filters:", filters, "page:", page);
+    console.log("📄 Fetching alerts with filters:", filters, "cursor:", cursor);
 
     const params = {
-      page,
+      cursor,
       page_size: pageSize,
       ...filters,
     };
@@ -284,17 +296,16 @@ export const getAlerts = async (filters = {}, page = 1, pageSize = 20) => {
 
     if (data && data.results !== undefined) {
       console.log(
-        `✅ Found ${data.results.length} alerts on page ${page} of ${data.count} total`
+        `✅ Found ${data.results.length} alerts of ${data.count_is_estimate ? "~" : ""}${data.count} total`
       );
       return {
         alerts: data.results,
         pagination: {
-          current: page,
           pageSize: pageSize,
           total: data.count,
-          totalPages: Math.ceil(data.count / pageSize),
-          next: data.next,
-          previous: data.previous,
+          totalIsEstimate: data.count_is_estimate,
+          next: cursorFromLink(data.next),
+          previous: cursorFromLink(data.previous),
         },
       };
     } else {
@@ -313,10 +324,9 @@ export const getAlerts = async (filters = {}, page = 1, pageSize = 20) => {
       return {
         alerts: alertsArray,
         pagination: {
-          current: 1,
           pageSize: alertsArray.length,
           total: alertsArray.length,
-          totalPages: 1,
+          totalIsEstimate: false,
           next: null,
           previous: null,
         },
@@ -327,10 +337,9 @@ export const getAlerts = async (filters = {}, page = 1, pageSize = 20) => {
     return {
       alerts: [],
       pagination: {
-        current: 1,
         pageSize: 20,
         total: 0,
-        totalPages: 0,
+        totalIsEstimate: false,
         next: null,
         previous: null,
       },
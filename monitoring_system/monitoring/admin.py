@@ -1,6 +1,11 @@
+import json
+from django.conf import settings
 from django.contrib import admin
 from .models import MonitoringAgent, SystemLog, Alert, UserSession, AgentRegistrationRequest
 from django.utils import timezone
+from django.utils.html import format_html
+from .logstorage import rehydrate
+from .utils import alert_cooldown, agent_identity_cache
 
 @admin.register(MonitoringAgent)
 class MonitoringAgentAdmin(admin.ModelAdmin):
@@ -13,11 +18,15 @@ class MonitoringAgentAdmin(admin.ModelAdmin):
 
     def activate_agents(self, request, queryset):
         updated = queryset.update(is_active=True)
+        for hostname in queryset.values_list('hostname', flat=True):
+            agent_identity_cache.invalidate(hostname)
         self.message_user(request, f"Activated {updated} agents")
     activate_agents.short_description = "Activate selected agents"
 
     def deactivate_agents(self, request, queryset):
         updated = queryset.update(is_active=False)
+        for hostname in queryset.values_list('hostname', flat=True):
+            agent_identity_cache.invalidate(hostname)
         self.message_user(request, f"Deactivated {updated} agents")
     deactivate_agents.short_description = "Deactivate selected agents"
 
@@ -127,9 +136,21 @@ class SystemLogAdmin(admin.ModelAdmin):
     list_display = ('agent', 'timestamp', 'created_at')
     list_filter = ('timestamp', 'created_at', 'agent')
     search_fields = ('agent__hostname', 'data')
-    readonly_fields = ('timestamp', 'created_at')
+    readonly_fields = ('timestamp', 'created_at', 'entry')
+    exclude = ('payload', 'payload_dictionary')
     date_hierarchy = 'timestamp'
 
+    def get_search_fields(self, request):
+        # Compressed rows have no `data` to search
+        if settings.SYSTEMLOG_COMPRESSION:
+            return ('agent__hostname',)
+        return self.search_fields
+
+    def entry(self, obj):
+        # Decoded whether stored as JSON, stripped or compressed
+        return format_html('<pre>{}</pre>', json.dumps(rehydrate([obj])[0], indent=2))
+    entry.short_description = 'Entry'
+
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
     list_display = ('title', 'agent', 'level', 'triggered_at', 'resolved')
@@ -140,12 +161,14 @@ class AlertAdmin(admin.ModelAdmin):
     actions = ['mark_resolved', 'mark_unresolved']
 
     def mark_resolved(self, request, queryset):
+        fingerprints = list(queryset.filter(resolved=False).values_list('fingerprint', flat=True))
         updated = queryset.update(resolved=True, resolved_at=timezone.now())
+        alert_cooldown.forget(fingerprints)
         self.message_user(request, f"Marked {updated} alerts as resolved")
     mark_resolved.short_description = "✅ Mark selected alerts as resolved"
 
     def mark_unresolved(self, request, queryset):
-        updated = queryset.update(resolved=False, resolved_at=None)
+        updated = Alert.reopen(queryset)
         self.message_user(request, f"Marked {updated} alerts as unresolved")
     mark_unresolved.short_description = "❌ Mark selected alerts as unresolved"
 
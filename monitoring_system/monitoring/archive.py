@@ -0,0 +1,290 @@
+"""Cold archive of old SystemLog rows in compressed, time-indexed segment files
+
+`archive_logs` moves rows older than a cutoff into one segment per agent per
+UTC day under SYSTEMLOG_ARCHIVE_DIR:
+
+    systemlog/<agent_id>/<YYYY-MM-DD>.jsonl.zst   records, one JSON per line
+    systemlog/<agent_id>/<YYYY-MM-DD>.idx.json    sidecar time index
+
+A segment is a sequence of independently compressed frames of at most
+ARCHIVE_FRAME_ROWS records in timestamp order. The index lists each frame's
+byte range, first/last timestamp and row ids, so a time range is read by
+decompressing only the frames that overlap it, one frame at a time.
+
+Rows are deleted only after their frame and index are on disk. The index
+records the archived ids, so a run interrupted before the delete skips
+those rows next time and just deletes them.
+"""
+import os
+import json
+import zlib
+import heapq
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction
+from .logstorage import rehydrate
+from .models import SystemLog
+
+# zstd when available; gzip members otherwise (the index records which)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+ARCHIVE_FRAME_ROWS = 256
+INDEX_VERSION = 1
+EXTENSIONS = {'zstd': '.jsonl.zst', 'gzip': '.jsonl.gz'}
+
+
+def archive_root():
+    return os.path.join(settings.SYSTEMLOG_ARCHIVE_DIR, 'systemlog')
+
+
+def _agent_dir(agent_id):
+    return os.path.join(archive_root(), str(agent_id))
+
+
+def _index_path(agent_id, day):
+    return os.path.join(_agent_dir(agent_id), f'{day.isoformat()}.idx.json')
+
+
+def _segment_path(agent_id, day, codec):
+    return os.path.join(_agent_dir(agent_id), f'{day.isoformat()}{EXTENSIONS[codec]}')
+
+
+def _compress(codec, raw):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=settings.SYSTEMLOG_ARCHIVE_LEVEL).compress(raw)
+    compressor = zlib.compressobj(level=9, wbits=31)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def _decompress(codec, frame):
+    if codec == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError('zstandard is required to read zstd archive segments')
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return zlib.decompress(frame, wbits=31)
+
+
+def load_index(agent_id, day):
+    """A segment's index, or None if the agent has no segment for that day"""
+    try:
+        with open(_index_path(agent_id, day)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path, value):
+    # Write-then-rename, so readers never see a half-written file
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(value, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _append_frame(agent_id, day, index, records):
+    """Append one compressed frame of (timestamp, id, record) to a segment and update its index"""
+    path = _segment_path(agent_id, day, index['codec'])
+    raw = b''.join(json.dumps(record, separators=(',', ':')).encode() + b'\n' for _, _, record in records)
+    frame = _compress(index['codec'], raw)
+
+    mode = 'r+b' if os.path.exists(path) else 'wb'
+    with open(path, mode) as f:
+        # Bytes past the indexed size are a frame whose index update never happened
+        f.truncate(index['size'])
+        f.seek(index['size'])
+        f.write(frame)
+        f.flush()
+        os.fsync(f.fileno())
+
+    index['frames'].append({
+        'offset': index['size'],
+        'length': len(frame),
+        'first': records[0][0].isoformat(),
+        'last': records[-1][0].isoformat(),
+        'count': len(records),
+        'ids': [pk for _, pk, _ in records],
+    })
+    index['size'] += len(frame)
+    _write_json(_index_path(agent_id, day), index)
+
+
+def _update_horizon(newest):
+    """Remember the newest archived timestamp, so readers know when to look here"""
+    current = archive_horizon()
+    if current is None or newest > current:
+        _write_json(os.path.join(archive_root(), 'horizon.json'), {'newest': newest.isoformat()})
+
+
+def archive_horizon():
+    """Newest archived SystemLog timestamp, or None if nothing is archived"""
+    try:
+        with open(os.path.join(archive_root(), 'horizon.json')) as f:
+            return datetime.fromisoformat(json.load(f)['newest'])
+    except FileNotFoundError:
+        return None
+
+
+def _record(log, entry):
+    return {
+        'id': log.id,
+        'agent_id': log.agent_id,
+        'timestamp': log.timestamp.isoformat(),
+        'created_at': log.created_at.isoformat(),
+        'data': entry,
+    }
+
+
+def archive_logs(cutoff, agent_ids=None, progress=None):
+    """Move SystemLog rows with timestamp < cutoff into segment files; returns rows moved
+
+    Entries are written fully decoded (decompressed, stripped values put
+    back), so segments don't depend on any other table. progress, if
+    given, is called with the running total after every frame.
+    """
+    codec = 'zstd' if ZSTD_AVAILABLE else 'gzip'
+    old = SystemLog.objects.filter(timestamp__lt=cutoff)
+    if agent_ids:
+        old = old.filter(agent_id__in=agent_ids)
+    moved = 0
+    newest = None
+
+    for agent_id in old.order_by().values_list('agent_id', flat=True).distinct():
+        os.makedirs(_agent_dir(agent_id), exist_ok=True)
+        rows = old.filter(agent_id=agent_id).order_by('timestamp', 'id')
+        while True:
+            # Every batch is deleted below, so the next one starts at the front again
+            batch = list(rows[:ARCHIVE_FRAME_ROWS])
+            if not batch:
+                break
+
+            by_day = {}
+            for log, entry in zip(batch, rehydrate(batch)):
+                by_day.setdefault(log.timestamp.date(), []).append((log.timestamp, log.id, _record(log, entry)))
+            for day, records in by_day.items():
+                index = load_index(agent_id, day) or {
+                    'version': INDEX_VERSION, 'codec': codec, 'agent_id': agent_id,
+                    'day': day.isoformat(), 'size': 0, 'frames': [],
+                }
+                archived = {pk for frame in index['frames'] for pk in frame['ids']}
+                records = [record for record in records if record[1] not in archived]
+                if records:
+                    _append_frame(agent_id, day, index, records)
+
+            # Only now that the frames (and the horizon readers go by) are on disk may the rows go
+            newest = max(newest or batch[-1].timestamp, batch[-1].timestamp)
+            _update_horizon(newest)
+            with transaction.atomic():
+                SystemLog.objects.filter(id__in=[log.id for log in batch]).delete()
+            moved += len(batch)
+            if progress:
+                progress(moved)
+    return moved
+
+
+def _read_frame(agent_id, day, index, frame):
+    with open(_segment_path(agent_id, day, index['codec']), 'rb') as f:
+        f.seek(frame['offset'])
+        raw = _decompress(index['codec'], f.read(frame['length']))
+    return [json.loads(line) for line in raw.splitlines()]
+
+
+def _record_key(record):
+    return datetime.fromisoformat(record['timestamp']), record['id']
+
+
+def _frames(start, end, agent_id=None):
+    """(agent_id, day, index, frame, first, last) for every frame overlapping [start, end)"""
+    root = archive_root()
+    agents = [agent_id] if agent_id is not None else [
+        int(name) for name in (os.listdir(root) if os.path.isdir(root) else []) if name.isdigit()
+    ]
+    for agent in agents:
+        day = start.date()
+        while day <= end.date():
+            index = load_index(agent, day)
+            for frame in (index or {}).get('frames', []):
+                first = datetime.fromisoformat(frame['first'])
+                last = datetime.fromisoformat(frame['last'])
+                if last >= start and first < end:
+                    yield agent, day, index, frame, first, last
+            day += timedelta(days=1)
+
+
+def archived_records(start, end, agent_id=None, reverse=False):
+    """Archived records with start <= timestamp < end, streamed in (timestamp, id) order
+
+    Newest first unless reverse. Frames are only opened when the merge
+    reaches their time range, so memory holds the frames overlapping the
+    current position rather than whole segments.
+    """
+    frames = list(_frames(start, end, agent_id))
+    # Frames in the order their first record can come up
+    if reverse:
+        frames.sort(key=lambda item: item[4])
+    else:
+        frames.sort(key=lambda item: item[5], reverse=True)
+
+    heap = []
+    sign = 1 if reverse else -1
+
+    def push(record):
+        timestamp, pk = _record_key(record)
+        if start <= timestamp < end:
+            # Order key for a min-heap: ascending as is, descending via negated epoch microseconds
+            epoch = (timestamp - datetime(1970, 1, 1, tzinfo=timestamp.tzinfo)) // timedelta(microseconds=1)
+            heapq.heappush(heap, (sign * epoch, sign * pk, record))
+
+    position = 0
+    while position < len(frames) or heap:
+        # Open every frame that could hold a record ahead of the heap's best
+        while position < len(frames):
+            agent, day, index, frame, first, last = frames[position]
+            boundary = first if reverse else last
+            if heap:
+                best = _record_key(heap[0][2])[0]
+                if (boundary > best) if reverse else (boundary < best):
+                    break
+            for record in _read_frame(agent, day, index, frame):
+                push(record)
+            position += 1
+        if not heap:
+            break
+        yield heapq.heappop(heap)[2]
+
+
+def count_archived(start, end, agent_id=None):
+    """Archived records with start <= timestamp < end; only boundary frames are decompressed"""
+    total = 0
+    for agent, day, index, frame, first, last in _frames(start, end, agent_id):
+        if first >= start and last < end:
+            total += frame['count']
+        else:
+            total += sum(
+                1 for record in _read_frame(agent, day, index, frame)
+                if start <= _record_key(record)[0] < end
+            )
+    return total
+
+
+def record_to_log(record, agents=None):
+    """Unsaved SystemLog standing for an archived record, for serializers
+
+    agents, an {id: MonitoringAgent} map, saves a query per record.
+    """
+    log = SystemLog(
+        id=record['id'],
+        agent_id=record['agent_id'],
+        timestamp=datetime.fromisoformat(record['timestamp']),
+        created_at=datetime.fromisoformat(record['created_at']),
+        data=record['data'],
+    )
+    if agents and log.agent_id in agents:
+        log.agent = agents[log.agent_id]
+    log.extract_hot_fields()
+    return log
@@ -0,0 +1,134 @@
+"""One HostMetric row per sample, whichever endpoint reports it
+
+Agents report resource usage twice per cycle: upload_metrics sends real
+totals and upload_logs carries percentages in resource_anomalies, a few
+seconds apart. A sample from one path is merged into the row of the nearest
+sample from the other path that hasn't been merged with one yet, if it is at
+most HOST_METRIC_MATCH_SECONDS away; otherwise it gets a row of its own, so
+samples from the same path never replace each other whatever the agent's
+interval. The row keeps the first sample's timestamp; `merged_timestamp`
+records the other one, so a sample sent again is recognized and not stored
+twice. The agent's `metric_source` is the authoritative path:
+
+- its samples overwrite the fields they carry, and each goes through the
+  threshold checks once, with the merged row's values
+- samples from the other path only fill in fields the row lacks (e.g. the
+  totals a log-sourced row doesn't have). A row that gets no authoritative
+  sample is checked on its own once the authoritative path has reported a
+  later sample, or after HOST_METRIC_MATCH_WAIT seconds if it reports none
+
+New rows are folded into the rollups, and rows whose values change are
+swapped into their rollup buckets.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from .models import HostMetric, MonitoringAgent
+from .rollups import replace_samples, update_rollups
+
+# Fields each upload path actually measures
+SOURCE_FIELDS = {
+    'metrics': [
+        'cpu_usage', 'memory_usage', 'memory_total', 'memory_used',
+        'disk_usage', 'disk_total', 'disk_used', 'network_sent', 'network_received',
+    ],
+    'logs': ['cpu_usage', 'memory_usage', 'disk_usage', 'network_sent', 'network_received'],
+}
+
+
+def _partner(rows, sample, source, window):
+    """The unmerged row from the other path nearest to sample, within window"""
+    candidates = [
+        row for row in rows
+        if row.source != source and row.merged_timestamp is None
+        and abs(row.timestamp - sample.timestamp) <= window
+    ]
+    return min(candidates, key=lambda row: abs(row.timestamp - sample.timestamp), default=None)
+
+
+def store_samples(agent, samples, source):
+    """Merge unsaved HostMetric samples from one upload path into the sample rows
+
+    Returns (rows, evaluate): the stored row for every sample, in order, and
+    the rows that are due for threshold checks, which may include earlier
+    rows that never got an authoritative sample.
+    """
+    if not samples:
+        return [], []
+    fields = SOURCE_FIELDS[source]
+    window = timedelta(seconds=settings.HOST_METRIC_MATCH_SECONDS)
+    timestamps = [sample.timestamp for sample in samples]
+
+    with transaction.atomic():
+        # Serializes this agent's metric writes, and reads its current setting
+        authority = MonitoringAgent.objects.select_for_update().values_list(
+            'metric_source', flat=True
+        ).get(id=agent.id)
+        authoritative = authority == source
+
+        rows = list(HostMetric.objects.filter(
+            agent_id=agent.id,
+            timestamp__gte=min(timestamps) - window,
+            timestamp__lte=max(timestamps) + window
+        ))
+
+        stored, created, changes, evaluate = [], [], {}, []
+        for sample in samples:
+            row = next((row for row in rows if sample.timestamp in (row.timestamp, row.merged_timestamp)), None)
+            repeated = row is not None
+            if row is None:
+                row = _partner(rows, sample, source, window)
+                if row is not None:
+                    row.merged_timestamp = sample.timestamp
+
+            if row is None:
+                sample.source = source
+                sample.evaluated = authoritative
+                rows.append(sample)
+                created.append(sample)
+                row = sample
+            else:
+                if authoritative:
+                    updates = fields
+                else:
+                    updates = [field for field in fields if field not in SOURCE_FIELDS[row.source]]
+                if row.pk is not None and row.pk not in changes:
+                    changes[row.pk] = ({field: getattr(row, field) for field in SOURCE_FIELDS['metrics']}, row)
+                for field in updates:
+                    setattr(row, field, getattr(sample, field))
+                if authoritative:
+                    row.source = source
+                    if not repeated:
+                        row.evaluated = True
+
+            # A sample sent again was checked the first time
+            if authoritative and not repeated:
+                evaluate.append(row)
+            stored.append(row)
+
+        HostMetric.objects.bulk_create(created)
+        if changes:
+            HostMetric.objects.bulk_update(
+                [row for old, row in changes.values()],
+                SOURCE_FIELDS['metrics'] + ['source', 'merged_timestamp', 'evaluated']
+            )
+        update_rollups(created)
+        replace_samples([
+            (old, row) for old, row in changes.values()
+            if any(getattr(row, field) != value for field, value in old.items())
+        ])
+
+        # Rows the authoritative path has left behind, or has been silent about for too long
+        newest = max(timestamps)
+        cutoff = newest - timedelta(seconds=settings.HOST_METRIC_MATCH_WAIT)
+        latest_authoritative = max(timestamps) if authoritative else HostMetric.objects.filter(
+            agent_id=agent.id, source=authority, timestamp__gte=cutoff
+        ).order_by('-timestamp').values_list('timestamp', flat=True).first()
+        if latest_authoritative is not None:
+            cutoff = max(cutoff, latest_authoritative - window)
+        orphans = list(HostMetric.objects.filter(agent_id=agent.id, evaluated=False, timestamp__lt=cutoff))
+        if orphans:
+            HostMetric.objects.filter(id__in=[row.id for row in orphans]).update(evaluated=True)
+            evaluate.extend(orphans)
+
+    return stored, evaluate
@@ -0,0 +1,118 @@
+"""Queue-backed ingest for agent uploads (used when settings.INGEST_ASYNC is on)"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import IngestJob
+
+logger = logging.getLogger(__name__)
+
+
+def requeue_stale_jobs():
+    """Hand out jobs again whose worker died while processing them"""
+    cutoff = timezone.now() - timedelta(seconds=settings.INGEST_JOB_TIMEOUT)
+    return IngestJob.objects.filter(
+        status='processing',
+        started_at__lt=cutoff
+    ).update(status='pending')
+
+
+def claim_jobs(batch_size=10):
+    """Claim up to batch_size pending jobs for this worker, skipping ones waiting for a retry"""
+    now = timezone.now()
+    due = Q(not_before__isnull=True) | Q(not_before__lte=now)
+
+    if connection.features.has_select_for_update_skip_locked:
+        # Postgres: concurrent workers skip rows another worker has locked
+        with transaction.atomic():
+            jobs = list(
+                IngestJob.objects.select_for_update(skip_locked=True)
+                .filter(due, status='pending')
+                .order_by('id')[:batch_size]
+            )
+            IngestJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                status='processing',
+                started_at=now,
+                attempts=F('attempts') + 1
+            )
+        for job in jobs:
+            job.status = 'processing'
+            job.attempts += 1
+        return jobs
+
+    # SQLite fallback: a conditional update decides which worker wins each row
+    claimed = []
+    candidates = IngestJob.objects.filter(due, status='pending').order_by('id').values_list('id', flat=True)
+    for job_id in list(candidates[:batch_size]):
+        won = IngestJob.objects.filter(id=job_id, status='pending').update(
+            status='processing',
+            started_at=now,
+            attempts=F('attempts') + 1
+        )
+        if won:
+            claimed.append(job_id)
+    return list(IngestJob.objects.filter(id__in=claimed).order_by('id'))
+
+
+def process_job(job):
+    """Run the same processing the synchronous upload endpoints do"""
+    from .serializers import MetricUploadSerializer
+    from .views import SystemLogViewSet, HostMetricViewSet, ProcessViewSet
+
+    agent = job.agent
+    payload = job.payload
+
+    if job.kind == 'logs':
+        view = SystemLogViewSet()
+        log_entries = view._extract_log_entries(agent, payload)
+        return view._save_log_batch(agent, log_entries)
+
+    if job.kind == 'metrics':
+        serializer = MetricUploadSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+        metric = HostMetricViewSet()._save_metric(agent, serializer.validated_data)
+        return {'metric_id': metric.id}
+
+    if job.kind == 'processes':
+        process_data = payload.get('process_system_activity') or payload.get('processes')
+        snapshot = ProcessViewSet()._save_process_snapshot(agent, process_data)
+        return {'snapshot_id': snapshot.id if snapshot else None}
+
+    raise ValueError(f"Unknown ingest job kind: {job.kind}")
+
+
+def run_job(job):
+    """Process a claimed job, deleting it on success and recording failures"""
+    try:
+        result = process_job(job)
+    except Exception as e:
+        # attempts was already bumped when the job was claimed
+        attempts = job.attempts
+        give_up = attempts >= settings.INGEST_MAX_ATTEMPTS
+        delay = timedelta(seconds=settings.INGEST_RETRY_DELAY * 2 ** (attempts - 1))
+        IngestJob.objects.filter(id=job.id).update(
+            status='failed' if give_up else 'pending',
+            last_error=str(e),
+            not_before=None if give_up else timezone.now() + delay
+        )
+        logger.error(f"Ingest job {job.id} ({job.kind}) failed on attempt {attempts}: {e}")
+        return False
+
+    IngestJob.objects.filter(id=job.id).delete()
+    logger.info(f"Processed ingest job {job.id} ({job.kind}): {result}")
+    return True
+
+
+def drain_queue(batch_size=10):
+    """Process pending jobs until the queue is empty, returning the number handled"""
+    handled = 0
+    requeue_stale_jobs()
+    while True:
+        jobs = claim_jobs(batch_size)
+        if not jobs:
+            return handled
+        for job in jobs:
+            run_job(job)
+            handled += 1
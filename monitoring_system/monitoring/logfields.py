@@ -0,0 +1,103 @@
+"""Typed SystemLog columns: backfill of older rows and the /logs/query/ predicates"""
+import json
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, F, Max
+from rest_framework.exceptions import ValidationError
+from .logstorage import stored_data
+from .models import SystemLog
+
+LOOKUPS = ('gt', 'gte', 'lt', 'lte')
+
+
+def backfill_hot_fields(batch_size=2000, progress=None):
+    """Fill the typed columns of rows stored before they existed; returns rows updated
+
+    Rows are read in primary-key order, batch_size at a time. A row whose
+    columns are all still NULL is re-extracted, so the command can be
+    interrupted and rerun.
+    """
+    columns = list(SystemLog.HOT_FIELDS)
+    pending = SystemLog.objects.filter(**{f'{column}__isnull': True for column in columns})
+    last_id = 0
+    updated = 0
+    while True:
+        rows = list(pending.filter(pk__gt=last_id).order_by('pk').only(
+            'id', 'data', 'payload', 'payload_dictionary'
+        )[:batch_size])
+        if not rows:
+            break
+        decompressors = {}
+        for row in rows:
+            row.extract_hot_fields(stored_data(row, decompressors))
+        with transaction.atomic():
+            SystemLog.objects.bulk_update(rows, columns)
+        last_id = rows[-1].pk
+        updated += len(rows)
+        if progress:
+            progress(updated)
+    return updated
+
+
+def parse_predicates(params):
+    """Filter kwargs from `<field>` / `<field>__<gt|gte|lt|lte>` query params
+
+    Boolean columns only take an exact `true`/`false`. Unknown fields are
+    ignored so they can sit next to other query params.
+    """
+    filters = {}
+    for param, raw in params.items():
+        column, _, lookup = param.partition('__')
+        if column not in SystemLog.HOT_FIELDS:
+            continue
+        if isinstance(SystemLog._meta.get_field(column), BooleanField):
+            if lookup or raw.lower() not in ('true', 'false'):
+                raise ValidationError({param: 'Expected field=true or field=false'})
+            filters[column] = raw.lower() == 'true'
+            continue
+        if lookup and lookup not in LOOKUPS:
+            raise ValidationError({param: f"Unsupported lookup, use one of: {', '.join(LOOKUPS)}"})
+        try:
+            filters[param] = int(raw)
+        except ValueError:
+            raise ValidationError({param: 'Expected an integer'})
+    return filters
+
+
+def filter_logs(queryset, params):
+    """Apply the hot-field predicates and an optional `contains` JSON document
+
+    `contains` is a JSON object matched with @> against `data`, served by the
+    GIN jsonb_path_ops index on Postgres. It is refused while
+    SYSTEMLOG_COMPRESSION is on: compressed rows have no `data` to match, so
+    the result would silently leave them out.
+    """
+    queryset = queryset.filter(**parse_predicates(params))
+    contains = params.get('contains')
+    if contains:
+        if settings.SYSTEMLOG_COMPRESSION:
+            raise ValidationError({'contains': 'Not available while SYSTEMLOG_COMPRESSION is on'})
+        if not connection.features.supports_json_field_contains:
+            raise ValidationError({'contains': 'JSON containment is not supported by this database'})
+        try:
+            document = json.loads(contains)
+        except ValueError:
+            raise ValidationError({'contains': 'Expected a JSON object'})
+        if not isinstance(document, dict):
+            raise ValidationError({'contains': 'Expected a JSON object'})
+        queryset = queryset.filter(data__contains=document)
+    return queryset
+
+
+def summarize_by_agent(queryset):
+    """Per-host match count, latest match and peak value of each integer column"""
+    peaks = {
+        f'max_{column}': Max(column)
+        for column, field in ((c, SystemLog._meta.get_field(c)) for c in SystemLog.HOT_FIELDS)
+        if not isinstance(field, BooleanField)
+    }
+    return list(
+        queryset.order_by().values('agent_id', hostname=F('agent__hostname'))
+        .annotate(matches=Count('id'), last_seen=Max('timestamp'), **peaks)
+        .order_by('-matches')
+    )
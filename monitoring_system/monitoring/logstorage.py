@@ -0,0 +1,236 @@
+"""How SystemLog.data is stored: optionally without the values kept elsewhere
+
+With SYSTEMLOG_STRIP_NORMALIZED on, upload_logs removes from the stored
+entry every value that another row already holds exactly:
+
+- the SystemLog.HOT_FIELDS values, which the row's own typed columns hold
+- users_logged_in.users, held by the UserSession rows
+
+and records what it removed under data['_normalized']. rehydrate() puts
+the values back, so readers always see the entry as the agent sent it.
+A value is only removed if rebuilding it from the other row gives back the
+same JSON, so stripped rows read back exactly.
+
+With SYSTEMLOG_COMPRESSION on, the stored entry is then zstd-compressed into
+SystemLog.payload (data stays NULL), using the newest LogCompressionDictionary
+if `train_log_dictionary` has made one. stored_data() and rehydrate() decode
+it again.
+"""
+import json
+import logging
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .models import SystemLog, UserSession, LogCompressionDictionary
+
+# Compression is optional; without zstandard entries are stored as JSON
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+NORMALIZED_KEY = SystemLog.NORMALIZED_KEY
+
+
+def _same(a, b):
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+def _get(data, section, key):
+    values = data.get(section)
+    if isinstance(values, dict) and key in values:
+        return True, values[key]
+    return False, None
+
+
+# Both copy the section they change, so `data` can be a shallow copy
+
+def _pop(data, section, key):
+    values = {name: value for name, value in data[section].items() if name != key}
+    if values:
+        data[section] = values
+    else:
+        del data[section]
+
+
+def _put(data, section, key, value):
+    values = data.get(section, {})
+    if isinstance(values, dict):
+        data[section] = {**values, key: value}
+
+
+def session_user(session):
+    """users_logged_in.users entry a stored UserSession stands for"""
+    return {
+        'name': session.username,
+        'terminal': session.terminal,
+        'host': session.host,
+        'started': session.login_time.timestamp(),
+        'pid': session.pid,
+    }
+
+
+def stored_sessions(agent, keys):
+    """{(username, pid, login_time): UserSession} for the agent's stored sessions among keys"""
+    if not keys:
+        return {}
+    rows = UserSession.objects.filter(
+        agent=agent,
+        username__in={key[0] for key in keys},
+        login_time__gte=min(key[2] for key in keys)
+    ).only('id', 'username', 'terminal', 'host', 'login_time', 'pid')
+    found = {}
+    for session in rows:
+        key = (session.username, session.pid, session.login_time)
+        if key in keys:
+            found[key] = session
+    return found
+
+
+def strip_normalized(system_log, sessions=None):
+    """Remove from system_log.data what its columns and sessions hold
+
+    system_log must already have its hot fields extracted; sessions are the
+    stored UserSession rows for its users_logged_in.users, in order (None
+    when any of them isn't stored).
+    """
+    original = system_log.data
+    if not isinstance(original, dict) or NORMALIZED_KEY in original:
+        return
+    data = dict(original)
+    refs = {}
+
+    stripped_column = False
+    for column, (section, key) in SystemLog.HOT_FIELDS.items():
+        present, value = _get(data, section, key)
+        if present and _same(value, getattr(system_log, column)):
+            _pop(data, section, key)
+            stripped_column = True
+    if stripped_column:
+        refs['columns'] = 1
+
+    present, users = _get(data, 'users_logged_in', 'users')
+    if present and users and sessions and len(sessions) == len(users) and all(
+        _same(user, session_user(session)) for user, session in zip(users, sessions)
+    ):
+        _pop(data, 'users_logged_in', 'users')
+        refs['sessions'] = [session.pk for session in sessions]
+
+    if refs:
+        data[NORMALIZED_KEY] = refs
+        system_log.data = data
+
+
+# Dictionary rows never change, so each worker keeps them loaded
+_dictionaries = {}
+
+
+def load_dictionary(dictionary_id):
+    """zstandard.ZstdCompressionDict for a LogCompressionDictionary id"""
+    if dictionary_id not in _dictionaries:
+        data = LogCompressionDictionary.objects.values_list('data', flat=True).get(id=dictionary_id)
+        _dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(bytes(data))
+    return _dictionaries[dictionary_id]
+
+
+def encode_entry(entry):
+    return json.dumps(entry, separators=(',', ':')).encode()
+
+
+def compress_logs(system_logs):
+    """Move the entries of unsaved SystemLogs into zstd payloads if SYSTEMLOG_COMPRESSION is on"""
+    if not settings.SYSTEMLOG_COMPRESSION or not system_logs:
+        return
+    if not ZSTD_AVAILABLE:
+        logger.warning("SYSTEMLOG_COMPRESSION is on but zstandard is not installed; storing JSON")
+        return
+
+    dictionary_id = LogCompressionDictionary.objects.order_by('-id').values_list('id', flat=True).first()
+    compressor = zstandard.ZstdCompressor(
+        level=settings.SYSTEMLOG_COMPRESSION_LEVEL,
+        dict_data=load_dictionary(dictionary_id) if dictionary_id else None,
+    )
+    for system_log in system_logs:
+        system_log.payload = compressor.compress(encode_entry(system_log.data))
+        system_log.payload_dictionary_id = dictionary_id
+        system_log.data = None
+
+
+def train_dictionary(samples=2000, size=32768):
+    """New LogCompressionDictionary trained on the newest stored entries
+
+    Returns (dictionary, stats) where stats has the sample count and the raw,
+    zstd and zstd-with-dictionary byte totals of the samples. Raises
+    zstandard.ZstdError if there are too few samples to train on.
+    """
+    rows = SystemLog.objects.order_by('-id').only('id', 'data', 'payload', 'payload_dictionary')[:samples]
+    decompressors = {}
+    encoded = [encode_entry(stored_data(row, decompressors)) for row in rows]
+    trained = zstandard.train_dictionary(size, encoded)
+    dictionary = LogCompressionDictionary.objects.create(data=trained.as_bytes(), sample_count=len(encoded))
+
+    level = settings.SYSTEMLOG_COMPRESSION_LEVEL
+    plain = zstandard.ZstdCompressor(level=level)
+    with_dictionary = zstandard.ZstdCompressor(level=level, dict_data=trained)
+    return dictionary, {
+        'samples': len(encoded),
+        'raw': sum(len(entry) for entry in encoded),
+        'zstd': sum(len(plain.compress(entry)) for entry in encoded),
+        'zstd_dictionary': sum(len(with_dictionary.compress(entry)) for entry in encoded),
+    }
+
+
+def stored_data(log, decompressors=None):
+    """The entry as stored: `data`, or the decoded payload of a compressed row
+
+    decompressors, a dict, lets a batch reuse one decompressor per dictionary.
+    """
+    if log.payload is None:
+        return log.data
+    if not ZSTD_AVAILABLE:
+        raise ImproperlyConfigured('zstandard is required to read compressed SystemLog payloads')
+    decompressors = {} if decompressors is None else decompressors
+    dictionary_id = log.payload_dictionary_id
+    if dictionary_id not in decompressors:
+        decompressors[dictionary_id] = zstandard.ZstdDecompressor(
+            dict_data=load_dictionary(dictionary_id) if dictionary_id else None
+        )
+    return json.loads(decompressors[dictionary_id].decompress(log.payload))
+
+
+def rehydrate(logs):
+    """The full entry of each log, in order: decompressed, with stripped values put back
+
+    Referenced UserSession rows are read with one query for the whole
+    batch. Values whose row no longer exists stay missing.
+    """
+    decompressors = {}
+    stored = [stored_data(log, decompressors) for log in logs]
+    stripped = [data[NORMALIZED_KEY] for data in stored
+                if isinstance(data, dict) and NORMALIZED_KEY in data]
+    session_ids = {pk for refs in stripped for pk in refs.get('sessions', ())}
+    sessions = UserSession.objects.in_bulk(session_ids) if session_ids else {}
+
+    entries = []
+    for log, data in zip(logs, stored):
+        if not isinstance(data, dict) or NORMALIZED_KEY not in data:
+            entries.append(data)
+            continue
+        data = dict(data)
+        refs = data.pop(NORMALIZED_KEY)
+
+        if refs.get('columns'):
+            for column, (section, key) in SystemLog.HOT_FIELDS.items():
+                value = getattr(log, column)
+                if value is not None and not _get(data, section, key)[0]:
+                    _put(data, section, key, value)
+
+        if 'sessions' in refs:
+            _put(data, 'users_logged_in', 'users', [
+                session_user(sessions[pk]) for pk in refs['sessions'] if pk in sessions
+            ])
+
+        entries.append(data)
+    return entries
@@ -0,0 +1,26 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from monitoring.archive import archive_logs, archive_root
+
+
+class Command(BaseCommand):
+    help = 'Move old SystemLog rows into compressed per-agent, per-day archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SYSTEMLOG_ARCHIVE_AFTER_DAYS,
+                            help=f'Archive rows older than N days (default: {settings.SYSTEMLOG_ARCHIVE_AFTER_DAYS})')
+        parser.add_argument('--agent', type=int, action='append', dest='agents', help='Only archive this agent id (repeatable)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        def progress(moved):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {moved} rows')
+
+        moved = archive_logs(cutoff, agent_ids=options['agents'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} system logs older than {cutoff:%Y-%m-%d %H:%M} to {archive_root()}'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from monitoring.logfields import backfill_hot_fields
+
+
+class Command(BaseCommand):
+    help = 'Fill the typed hot-field columns of SystemLog rows stored before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows read and updated per batch (default: 2000)')
+
+    def handle(self, *args, **options):
+        def progress(updated):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {updated} rows')
+
+        updated = backfill_hot_fields(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} system logs'))
@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from monitoring.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild HostMetric rollups from raw metrics, picking up late and out-of-order samples'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48, help='Rebuild buckets covering the last N hours (default: 48)')
+        parser.add_argument('--all', action='store_true', help='Rebuild every bucket from all stored metrics')
+        parser.add_argument('--agent', type=int, action='append', dest='agents', help='Only rebuild this agent id (repeatable)')
+
+    def handle(self, *args, **options):
+        since = None if options['all'] else timezone.now() - timedelta(hours=options['hours'])
+        built = rebuild_rollups(since=since, agent_ids=options['agents'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {built} metric rollups'))
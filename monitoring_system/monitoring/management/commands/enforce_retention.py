@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from monitoring.partitions import (
+    supports_partitioning, partitioned_models, is_partitioned, drop_expired_partitions
+)
+from monitoring.purge import retention_tasks, run_pending_purges
+
+
+class Command(BaseCommand):
+    help = 'Purge rows past their RETENTION_POLICIES age and resume unfinished purges (e.g. agent deletions)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resume-only', action='store_true', help='Only resume unfinished purge tasks')
+
+    def handle(self, *args, **options):
+        if not options['resume_only']:
+            # Whole expired partitions go first; the chunked purge then only sees stragglers
+            if supports_partitioning():
+                for model, config in partitioned_models():
+                    table = model._meta.db_table
+                    if is_partitioned(table):
+                        dropped = drop_expired_partitions(table, config)
+                        self.stdout.write(f'{table}: dropped {len(dropped)} expired partitions')
+            retention_tasks()
+
+        def progress(task):
+            self.stdout.write(f'  {task.model} ({task.reason}): {task.deleted} rows deleted, up to id {task.last_id}')
+
+        tasks = run_pending_purges(progress=progress)
+        deleted = sum(task.deleted for task in tasks)
+        self.stdout.write(self.style.SUCCESS(f'Finished {len(tasks)} purge tasks, {deleted} rows deleted'))
@@ -0,0 +1,35 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from monitoring.partitions import (
+    supports_partitioning, partitioned_models, is_partitioned,
+    ensure_partitions, drop_expired_partitions
+)
+from monitoring.purge import purge
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming time partitions and drop expired ones (see settings.TIME_PARTITIONS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-drop', action='store_true', help='Only create partitions, keep expired data')
+
+    def handle(self, *args, **options):
+        for model, config in partitioned_models():
+            table = model._meta.db_table
+
+            if not (supports_partitioning() and is_partitioned(table)):
+                # Plain table (e.g. SQLite): retention means deleting old rows, in chunks
+                if not options['no_drop']:
+                    cutoff = timezone.now() - timedelta(days=config['retention_days'])
+                    task = purge(model, {'timestamp__lt': cutoff.isoformat()}, reason='retention')
+                    self.stdout.write(f'{table}: not partitioned, deleted {task.deleted} rows older than {cutoff:%Y-%m-%d}')
+                continue
+
+            created = ensure_partitions(table, config)
+            self.stdout.write(f'{table}: created {len(created)} partitions')
+            if not options['no_drop']:
+                dropped = drop_expired_partitions(table, config)
+                self.stdout.write(f'{table}: dropped {len(dropped)} expired partitions')
+
+        self.stdout.write(self.style.SUCCESS('Partition maintenance complete'))
@@ -0,0 +1,62 @@
+import time
+import signal
+import multiprocessing
+from django.core.management.base import BaseCommand
+from django.db import connections
+from monitoring.ingest import drain_queue
+
+
+def worker_loop(batch_size, poll_interval, once):
+    """Drain the ingest queue, sleeping while it is empty"""
+    # Never share the parent's database connection across a fork
+    connections.close_all()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    while True:
+        handled = drain_queue(batch_size)
+        if once:
+            return handled
+        if not handled:
+            time.sleep(poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Process queued agent uploads (used when INGEST_ASYNC is enabled)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1)')
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs claimed per round trip (default: 10)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = options['batch_size']
+        poll_interval = options['poll_interval']
+        once = options['once']
+
+        if workers == 1:
+            self.stdout.write('Starting ingest worker...')
+            handled = worker_loop(batch_size, poll_interval, once)
+            self.stdout.write(self.style.SUCCESS(f'Processed {handled} ingest jobs'))
+            return
+
+        self.stdout.write(f'Starting {workers} ingest worker processes...')
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=worker_loop, args=(batch_size, poll_interval, once), daemon=True)
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping ingest workers...')
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+
+        self.stdout.write(self.style.SUCCESS('Ingest workers stopped'))
@@ -0,0 +1,87 @@
+import io
+import zlib
+import logging
+from django.conf import settings
+from django.http import JsonResponse
+
+# zstd support is optional
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _gunzip(body, limit):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = decompressor.decompress(body, limit + 1)
+    if len(data) > limit or decompressor.unconsumed_tail:
+        raise BodyTooLarge()
+    # zlib returns what it could decode from a cut-off stream without complaint
+    if not decompressor.eof:
+        raise ValueError('truncated gzip stream')
+    if decompressor.unused_data:
+        raise ValueError(f'{len(decompressor.unused_data)} bytes after the gzip stream')
+    return data
+
+
+def _unzstd(body, limit):
+    # Frames that declare their size are decoded into a buffer of that size
+    if zstandard.frame_content_size(body) > limit:
+        raise BodyTooLarge()
+    try:
+        # Fails on a truncated frame or anything after it
+        return zstandard.ZstdDecompressor().decompress(body, max_output_size=limit, allow_extra_data=False)
+    except zstandard.ZstdError:
+        # Frames without a size fail the same way once they outgrow max_output_size
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body))
+        if len(reader.read(limit + 1)) > limit:
+            raise BodyTooLarge()
+        raise
+
+
+class RequestDecompressionMiddleware:
+    """Transparently decompress gzip (and zstd, if installed) request bodies"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.decoders = {'gzip': _gunzip}
+        if ZSTD_AVAILABLE:
+            self.decoders['zstd'] = _unzstd
+
+    def __call__(self, request):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding or encoding == 'identity':
+            return self.get_response(request)
+
+        decoder = self.decoders.get(encoding)
+        if decoder is None:
+            return JsonResponse(
+                {'error': f'Unsupported Content-Encoding: {encoding}'},
+                status=415
+            )
+
+        limit = settings.MAX_DECOMPRESSED_REQUEST_SIZE
+        try:
+            body = decoder(request.read(), limit)
+        except BodyTooLarge:
+            logger.warning(f"Rejected {encoding} request body larger than {limit} bytes once decompressed")
+            return JsonResponse({'error': 'Decompressed request body too large'}, status=413)
+        except Exception as e:
+            logger.warning(f"Failed to decompress {encoding} request body: {e}")
+            return JsonResponse({'error': 'Invalid compressed request body'}, status=400)
+
+        # Swap in the decompressed body so Django and DRF parse it as usual
+        request._body = body
+        request._stream = io.BytesIO(body)
+        request._read_started = False
+        request.META['CONTENT_LENGTH'] = str(len(body))
+        del request.META['HTTP_CONTENT_ENCODING']
+
+        return self.get_response(request)
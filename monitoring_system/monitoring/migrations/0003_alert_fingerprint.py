@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:22
+
+import hashlib
+from django.db import migrations, models
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """Fingerprint the newest open rule-raised alert per agent/title/type"""
+    Alert = apps.get_model('monitoring', 'Alert')
+    seen = set()
+    open_alerts = Alert.objects.filter(resolved=False).exclude(alert_type='system').order_by('-triggered_at', '-id')
+    for alert in open_alerts.iterator():
+        fingerprint = hashlib.sha1(f"{alert.agent_id}:{alert.alert_type}:{alert.title}".encode()).hexdigest()
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        Alert.objects.filter(id=alert.id).update(fingerprint=fingerprint)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_ingestjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=40),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolved', False), models.Q(('fingerprint', ''), _negated=True)), fields=('fingerprint',), name='unique_open_alert_fingerprint'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:22
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_sessions(apps, schema_editor):
+    """Keep the oldest row of each (agent, username, pid, login_time) group"""
+    UserSession = apps.get_model('monitoring', 'UserSession')
+    duplicates = (
+        UserSession.objects.values('agent', 'username', 'pid', 'login_time')
+        .annotate(keep_id=Min('id'), rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates.iterator():
+        UserSession.objects.filter(
+            agent=group['agent'],
+            username=group['username'],
+            pid=group['pid'],
+            login_time=group['login_time'],
+        ).exclude(id=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0003_alert_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usersession',
+            constraint=models.UniqueConstraint(fields=('agent', 'username', 'pid', 'login_time'), name='unique_user_session'),
+        ),
+    ]
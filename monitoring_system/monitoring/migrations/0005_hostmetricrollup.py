@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_usersession_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostMetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('5m', '5 minutes'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket', models.DateTimeField()),
+                ('sample_count', models.IntegerField(default=0)),
+                ('last_timestamp', models.DateTimeField()),
+                ('cpu_usage_min', models.FloatField(default=0.0)),
+                ('cpu_usage_max', models.FloatField(default=0.0)),
+                ('cpu_usage_avg', models.FloatField(default=0.0)),
+                ('cpu_usage_last', models.FloatField(default=0.0)),
+                ('memory_usage_min', models.FloatField(default=0.0)),
+                ('memory_usage_max', models.FloatField(default=0.0)),
+                ('memory_usage_avg', models.FloatField(default=0.0)),
+                ('memory_usage_last', models.FloatField(default=0.0)),
+                ('disk_usage_min', models.FloatField(default=0.0)),
+                ('disk_usage_max', models.FloatField(default=0.0)),
+                ('disk_usage_avg', models.FloatField(default=0.0)),
+                ('disk_usage_last', models.FloatField(default=0.0)),
+                ('network_sent_min', models.FloatField(default=0.0)),
+                ('network_sent_max', models.FloatField(default=0.0)),
+                ('network_sent_avg', models.FloatField(default=0.0)),
+                ('network_sent_last', models.FloatField(default=0.0)),
+                ('network_received_min', models.FloatField(default=0.0)),
+                ('network_received_max', models.FloatField(default=0.0)),
+                ('network_received_avg', models.FloatField(default=0.0)),
+                ('network_received_last', models.FloatField(default=0.0)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_rollups', to='monitoring.monitoringagent')),
+            ],
+            options={
+                'ordering': ['-bucket'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hostmetricrollup',
+            constraint=models.UniqueConstraint(fields=('agent', 'resolution', 'bucket'), name='unique_metric_rollup_bucket'),
+        ),
+    ]
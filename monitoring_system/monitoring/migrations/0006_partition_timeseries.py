@@ -0,0 +1,107 @@
+"""Rebuild SystemLog and HostMetric as tables range-partitioned on timestamp (Postgres only)
+
+Everything this migration does is spelled out here rather than taken from
+monitoring.partitions or settings, so it keeps doing the same thing however
+those change later. `manage.py manage_partitions` maintains the partitions
+from then on; it recognizes the ones created here by their bounds.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import migrations
+
+# Model -> (interval, days of existing rows that get their own partitions, intervals created ahead)
+PARTITIONS = {
+    'SystemLog': ('day', 30, 7),
+    'HostMetric': ('week', 90, 2),
+}
+INTERVALS = {'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+
+
+def partition_start(timestamp, interval):
+    start = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def convert_to_partitioned(cursor, qn, table, interval, history_days, premake):
+    """Rebuild a plain table as a partitioned one, keeping rows, ids, indexes and FKs
+
+    The primary key becomes (id, timestamp) since Postgres requires the
+    partition key in every unique constraint; ids still come from one
+    table-wide sequence, so Django can keep treating id as the pk.
+    """
+    legacy = f'{table}_legacy'
+    sequence = f'{table}_id_seq'
+
+    cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", [table])
+    index_defs = [definition for name, definition in cursor.fetchall() if name != f'{table}_pkey']
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [table]
+    )
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}')
+    # No INCLUDING IDENTITY: before Postgres 17 partitioned tables can't
+    # have identity columns, so id gets a plain sequence default below
+    cursor.execute(
+        f'CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS) '
+        f'PARTITION BY RANGE ("timestamp")'
+    )
+    # Catches rows outside the partitioned window, e.g. from long-offline agents
+    cursor.execute(f'CREATE TABLE {qn(table + "_default")} PARTITION OF {qn(table)} DEFAULT')
+
+    now = datetime.now(dt_timezone.utc)
+    step = INTERVALS[interval]
+    start = partition_start(now - timedelta(days=history_days), interval)
+    last = partition_start(now, interval) + step * premake
+    while start <= last:
+        cursor.execute(
+            f'CREATE TABLE {qn(f"{table}_p{start:%Y%m%d}")} PARTITION OF {qn(table)} '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [start.isoformat(), (start + step).isoformat()]
+        )
+        start += step
+
+    cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)}')
+    cursor.execute(f'DROP TABLE {qn(legacy)}')
+
+    # Recreate the sequence, keys and indexes under their original names now that they are free
+    cursor.execute(f'CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.id')
+    cursor.execute(
+        f"SELECT setval(%s, COALESCE((SELECT MAX(id) FROM {qn(table)}), 0) + 1, false)",
+        [sequence]
+    )
+    cursor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval(%s)", [sequence])
+    cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + "_pkey")} PRIMARY KEY (id, "timestamp")')
+    for definition in index_defs:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+
+def partition_tables(apps, schema_editor):
+    # Postgres only: other databases keep plain tables (see monitoring.partitions)
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model_name, (interval, history_days, premake) in PARTITIONS.items():
+            table = apps.get_model('monitoring', model_name)._meta.db_table
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+            if cursor.fetchone()[0] != 'p':
+                convert_to_partitioned(cursor, qn, table, interval, history_days, premake)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0005_hostmetricrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0007_purgetask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['agent', 'triggered_at'], name='monitoring__agent_i_445545_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['triggered_at'], name='monitoring__trigger_743dcf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['agent', 'login_time'], name='monitoring__agent_i_b02b0b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['login_time'], name='monitoring__login_t_e0f8aa_idx'),
+        ),
+    ]
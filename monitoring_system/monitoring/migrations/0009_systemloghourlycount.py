@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:54
+
+from datetime import timedelta, timezone as dt_timezone
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def seed_log_counts(apps, schema_editor):
+    # Only the last day matters to the dashboard; counters grow from ingest after this
+    SystemLog = apps.get_model('monitoring', 'SystemLog')
+    SystemLogHourlyCount = apps.get_model('monitoring', 'SystemLogHourlyCount')
+    since = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    rows = SystemLog.objects.filter(timestamp__gte=since).values(
+        'agent_id', hour=TruncHour('timestamp', tzinfo=dt_timezone.utc)
+    ).annotate(count=Count('id')).order_by()
+    SystemLogHourlyCount.objects.bulk_create(
+        [SystemLogHourlyCount(agent_id=row['agent_id'], hour=row['hour'], count=row['count']) for row in rows],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SystemLogHourlyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_counts', to='monitoring.monitoringagent')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='monitoring__hour_ee27b0_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='systemloghourlycount',
+            constraint=models.UniqueConstraint(fields=('agent', 'hour'), name='unique_log_count_hour'),
+        ),
+        migrations.RunPython(seed_log_counts, migrations.RunPython.noop),
+    ]
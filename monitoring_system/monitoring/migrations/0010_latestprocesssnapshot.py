@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def seed_latest_snapshots(apps, schema_editor):
+    # One (agent, timestamp) index lookup per agent, run after the index exists
+    MonitoringAgent = apps.get_model('monitoring', 'MonitoringAgent')
+    ProcessSnapshot = apps.get_model('monitoring', 'ProcessSnapshot')
+    LatestProcessSnapshot = apps.get_model('monitoring', 'LatestProcessSnapshot')
+    latest = []
+    for agent_id in MonitoringAgent.objects.values_list('id', flat=True):
+        snapshot = ProcessSnapshot.objects.filter(agent_id=agent_id).order_by('-timestamp').first()
+        if snapshot:
+            latest.append(LatestProcessSnapshot(
+                agent_id=agent_id,
+                timestamp=snapshot.timestamp,
+                processes=snapshot.processes,
+                history_at=snapshot.timestamp
+            ))
+    LatestProcessSnapshot.objects.bulk_create(latest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0009_systemloghourlycount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestProcessSnapshot',
+            fields=[
+                ('agent', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_processes', serialize=False, to='monitoring.monitoringagent')),
+                ('timestamp', models.DateTimeField()),
+                ('processes', models.JSONField(default=dict)),
+                ('history_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='processsnapshot',
+            index=models.Index(fields=['agent', 'timestamp'], name='monitoring__agent_i_c9fc55_idx'),
+        ),
+        migrations.RunPython(seed_latest_snapshots, migrations.RunPython.noop),
+    ]
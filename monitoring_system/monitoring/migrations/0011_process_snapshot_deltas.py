@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0010_latestprocesssnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processsnapshot',
+            name='delta',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='processsnapshot',
+            name='is_keyframe',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0012_processstring'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveProcess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('pid', models.IntegerField()),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('user', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.CharField(blank=True, max_length=32, null=True)),
+                ('is_root', models.BooleanField(default=False)),
+                ('cpu_percent', models.FloatField(default=0.0)),
+                ('memory_percent', models.FloatField(default=0.0)),
+                ('cmdline', models.JSONField(default=list)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='live_processes', to='monitoring.monitoringagent')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['agent', 'cpu_percent'], name='monitoring__agent_i_bc6bb7_idx'), models.Index(fields=['agent', 'memory_percent'], name='monitoring__agent_i_4f2b19_idx'), models.Index(fields=['agent', 'name'], name='monitoring__agent_i_a2e7fa_idx'), models.Index(fields=['agent', 'user'], name='monitoring__agent_i_def592_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='liveprocess',
+            constraint=models.UniqueConstraint(fields=('agent', 'pid'), name='unique_live_process'),
+        ),
+    ]
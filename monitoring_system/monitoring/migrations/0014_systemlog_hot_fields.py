@@ -0,0 +1,122 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:14
+
+from django.db import migrations, models
+
+
+def create_data_gin_index(apps, schema_editor):
+    # Postgres only: jsonb_path_ops serves @> containment on any path of `data`
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('monitoring', 'SystemLog')._meta.db_table
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {table}_data_gin ON {table} USING GIN (data jsonb_path_ops)'
+    )
+
+
+def drop_data_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('monitoring', 'SystemLog')._meta.db_table
+    schema_editor.execute(f'DROP INDEX IF EXISTS {table}_data_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0013_liveprocess'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemlog',
+            name='account_lockouts',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='failed_login_attempts',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='firewall_active',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='open_ports',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='privilege_escalation',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='selinux_enabled',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='ssh_key_changes',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='successful_logins',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='suspicious_processes',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='user_changes',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='zombie_processes',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(condition=models.Q(('failed_login_attempts__gt', 0)), fields=['failed_login_attempts', 'timestamp'], name='log_failed_logins_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(condition=models.Q(('privilege_escalation__gt', 0)), fields=['privilege_escalation', 'timestamp'], name='log_priv_escalation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(condition=models.Q(('ssh_key_changes__gt', 0)), fields=['ssh_key_changes', 'timestamp'], name='log_ssh_key_changes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(condition=models.Q(('account_lockouts__gt', 0)), fields=['account_lockouts', 'timestamp'], name='log_lockouts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(condition=models.Q(('suspicious_processes__gt', 0)), fields=['suspicious_processes', 'timestamp'], name='log_suspicious_procs_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(condition=models.Q(('zombie_processes__gt', 0)), fields=['zombie_processes', 'timestamp'], name='log_zombie_procs_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['open_ports', 'timestamp'], name='log_open_ports_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(condition=models.Q(('firewall_active', False)), fields=['timestamp'], name='log_firewall_off_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(condition=models.Q(('selinux_enabled', False)), fields=['timestamp'], name='log_selinux_off_idx'),
+        ),
+        migrations.RunPython(create_data_gin_index, drop_data_gin_index),
+    ]
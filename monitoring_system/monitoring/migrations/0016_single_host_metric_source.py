@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:28
+
+from django.db import migrations, models
+
+# Totals upload_logs used to make up for its rows
+FABRICATED_MEMORY_TOTAL = 16 * 1024 * 1024 * 1024
+FABRICATED_DISK_TOTAL = 1000 * 1024 * 1024 * 1024
+
+
+def clean_host_metrics(apps, schema_editor):
+    HostMetric = apps.get_model('monitoring', 'HostMetric')
+    table = schema_editor.quote_name(HostMetric._meta.db_table)
+
+    # Exact (agent, timestamp) duplicates would block the unique constraint; keep the first
+    schema_editor.execute(f"""
+        DELETE FROM {table} WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY agent_id, timestamp ORDER BY id) AS n
+                FROM {table}
+            ) ranked WHERE n > 1
+        )
+    """)
+
+    # Rows written from upload_logs: mark them and drop the made-up totals
+    HostMetric.objects.filter(
+        memory_total=FABRICATED_MEMORY_TOTAL, disk_total=FABRICATED_DISK_TOTAL
+    ).update(source='logs', memory_total=0, memory_used=0, disk_total=0, disk_used=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0015_systemlog_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hostmetric',
+            name='source',
+            field=models.CharField(choices=[('metrics', 'upload_metrics'), ('logs', 'upload_logs')], default='metrics', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='monitoringagent',
+            name='metric_source',
+            field=models.CharField(choices=[('metrics', 'upload_metrics'), ('logs', 'upload_logs')], default='metrics', max_length=10),
+        ),
+        migrations.RunPython(clean_host_metrics, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='hostmetric',
+            constraint=models.UniqueConstraint(fields=('agent', 'timestamp'), name='unique_host_metric_sample'),
+        ),
+    ]
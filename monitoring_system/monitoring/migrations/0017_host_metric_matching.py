@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0016_single_host_metric_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hostmetric',
+            name='evaluated',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='hostmetric',
+            name='merged_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='hostmetric',
+            index=models.Index(condition=models.Q(('evaluated', False)), fields=['agent', 'timestamp'], name='host_metric_unevaluated_idx'),
+        ),
+    ]
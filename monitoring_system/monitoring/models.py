@@ -1,8 +1,16 @@
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password
 import json
+import hmac
+import hashlib
+from django.conf import settings
 from django.utils import timezone
 
+METRIC_SOURCES = [
+    ('metrics', 'upload_metrics'),
+    ('logs', 'upload_logs'),
+]
+
 class MonitoringAgent(models.Model):
     hostname = models.CharField(max_length=255, unique=True)
     username = models.CharField(max_length=255)
@@ -12,6 +20,8 @@ class MonitoringAgent(models.Model):
     is_active = models.BooleanField(default=True)
     is_approved = models.BooleanField(default=False)
     monitoring_scope = models.CharField(max_length=50, default='all_users')
+    # Upload path whose HostMetric values win (see monitoring.hostmetrics)
+    metric_source = models.CharField(max_length=10, choices=METRIC_SOURCES, default='metrics')
     
     # Encryption credentials
     encryption_password = models.CharField(max_length=255, null=True, blank=True)
@@ -24,11 +34,26 @@ class MonitoringAgent(models.Model):
     def set_encryption_password(self, password):
         """Store encryption password"""
         self.encryption_password = password
+        self._key_reference = None
     
     def get_encryption_password(self):
         """Get encryption password"""
         return self.encryption_password
     
+    def get_key_reference(self):
+        """Fingerprint of the current credentials, used to look up cached keys
+
+        Keyed with SECRET_KEY, so the reference can sit in a shared cache
+        without offering an offline guess at the password.
+        """
+        if getattr(self, '_key_reference', None) is None:
+            self._key_reference = hmac.new(
+                settings.SECRET_KEY.encode(),
+                f"{self.encryption_password}:{self.encryption_salt}".encode(),
+                hashlib.sha256
+            ).hexdigest()
+        return self._key_reference
+    
     def can_send_logs(self):
         """Check if agent is allowed to send logs"""
         return self.is_active and self.is_approved
@@ -59,20 +84,113 @@ class AgentRegistrationRequest(models.Model):
         return f"Registration: {self.hostname} - {self.status}"
 
 class SystemLog(models.Model):
+    # Typed copies of the most queried `data` values: column -> (section, key)
+    HOT_FIELDS = {
+        'failed_login_attempts': ('authentication', 'failed_login_attempts'),
+        'successful_logins': ('authentication', 'successful_logins'),
+        'user_changes': ('authentication', 'user_changes'),
+        'privilege_escalation': ('authentication', 'privilege_escalation'),
+        'ssh_key_changes': ('authentication', 'ssh_key_changes'),
+        'account_lockouts': ('authentication', 'account_lockouts'),
+        'suspicious_processes': ('anomaly_threat_detection', 'suspicious_processes'),
+        'zombie_processes': ('resource_anomalies', 'zombie_processes'),
+        'open_ports': ('network_connection', 'open_ports'),
+        'firewall_active': ('security_tools', 'firewall_active'),
+        'selinux_enabled': ('security_tools', 'selinux_enabled'),
+    }
+    HOT_FIELD_MAX = 2 ** 31 - 1
+    # Key of `data` listing values stripped at ingest (see monitoring.logstorage)
+    NORMALIZED_KEY = '_normalized'
+
     agent = models.ForeignKey(MonitoringAgent, on_delete=models.CASCADE, related_name='logs')
     timestamp = models.DateTimeField()
-    data = models.JSONField()
+    # NULL when the entry is stored zstd-compressed in `payload` (see monitoring.logstorage)
+    data = models.JSONField(null=True, blank=True)
+    payload = models.BinaryField(null=True, blank=True)
+    payload_dictionary = models.ForeignKey(
+        'LogCompressionDictionary', on_delete=models.PROTECT, null=True, blank=True, related_name='+'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    failed_login_attempts = models.IntegerField(null=True, blank=True)
+    successful_logins = models.IntegerField(null=True, blank=True)
+    user_changes = models.IntegerField(null=True, blank=True)
+    privilege_escalation = models.IntegerField(null=True, blank=True)
+    ssh_key_changes = models.IntegerField(null=True, blank=True)
+    account_lockouts = models.IntegerField(null=True, blank=True)
+    suspicious_processes = models.IntegerField(null=True, blank=True)
+    zombie_processes = models.IntegerField(null=True, blank=True)
+    open_ports = models.IntegerField(null=True, blank=True)
+    firewall_active = models.BooleanField(null=True, blank=True)
+    selinux_enabled = models.BooleanField(null=True, blank=True)
+
     class Meta:
         indexes = [
             models.Index(fields=['agent', 'timestamp']),
             models.Index(fields=['timestamp']),
+            # Partial indexes: only the rare "something happened" rows are indexed
+            models.Index(fields=['failed_login_attempts', 'timestamp'], condition=models.Q(failed_login_attempts__gt=0), name='log_failed_logins_idx'),
+            models.Index(fields=['privilege_escalation', 'timestamp'], condition=models.Q(privilege_escalation__gt=0), name='log_priv_escalation_idx'),
+            models.Index(fields=['ssh_key_changes', 'timestamp'], condition=models.Q(ssh_key_changes__gt=0), name='log_ssh_key_changes_idx'),
+            models.Index(fields=['account_lockouts', 'timestamp'], condition=models.Q(account_lockouts__gt=0), name='log_lockouts_idx'),
+            models.Index(fields=['suspicious_processes', 'timestamp'], condition=models.Q(suspicious_processes__gt=0), name='log_suspicious_procs_idx'),
+            models.Index(fields=['zombie_processes', 'timestamp'], condition=models.Q(zombie_processes__gt=0), name='log_zombie_procs_idx'),
+            models.Index(fields=['open_ports', 'timestamp'], name='log_open_ports_idx'),
+            models.Index(fields=['timestamp'], condition=models.Q(firewall_active=False), name='log_firewall_off_idx'),
+            models.Index(fields=['timestamp'], condition=models.Q(selinux_enabled=False), name='log_selinux_off_idx'),
         ]
 
     def __str__(self):
         return f"{self.agent.hostname} - {self.timestamp}"
 
+    def extract_hot_fields(self, data=None):
+        """Copy the HOT_FIELDS values out of `data` (or the given entry) into their typed columns
+
+        Values of the wrong type, out of integer range, or in missing sections
+        leave the column NULL; values stripped from `data` keep their column.
+        """
+        data = self.data if data is None else data
+        data = data if isinstance(data, dict) else {}
+        stripped = isinstance(data.get(self.NORMALIZED_KEY), dict) and data[self.NORMALIZED_KEY].get('columns')
+        for column, (section, key) in self.HOT_FIELDS.items():
+            value = data.get(section)
+            if stripped and not (isinstance(value, dict) and key in value):
+                # Stripped from `data`: the column is the only copy left
+                continue
+            value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(self._meta.get_field(column), models.BooleanField):
+                value = value if isinstance(value, bool) else None
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                value = None
+            else:
+                value = int(value) if abs(value) <= self.HOT_FIELD_MAX else None
+            setattr(self, column, value)
+
+    def save(self, *args, **kwargs):
+        if self.data is not None:
+            # A JSON entry replaces any compressed one; compressed rows keep their columns
+            self.payload = None
+            self.payload_dictionary = None
+            self.extract_hot_fields()
+        super().save(*args, **kwargs)
+
+class SystemLogHourlyCount(models.Model):
+    """SystemLog rows stored per agent per UTC hour, maintained at ingest"""
+    agent = models.ForeignKey(MonitoringAgent, on_delete=models.CASCADE, related_name='log_counts')
+    hour = models.DateTimeField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'hour'], name='unique_log_count_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+    def __str__(self):
+        return f"{self.agent.hostname} - {self.hour}: {self.count}"
+
 # Add to Alert model in models.py
 class Alert(models.Model):
     ALERT_LEVELS = [
@@ -104,10 +222,53 @@ class Alert(models.Model):
 
     class Meta:
         ordering = ['-triggered_at']
+        indexes = [
+            models.Index(fields=['agent', 'triggered_at']),
+            models.Index(fields=['triggered_at']),
+        ]
+        constraints = [
+            # At most one open alert per agent/rule/type; blank fingerprints are exempt
+            models.UniqueConstraint(
+                fields=['fingerprint'],
+                condition=models.Q(resolved=False) & ~models.Q(fingerprint=''),
+                name='unique_open_alert_fingerprint',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.level.upper()}: {self.title}"
 
+    @staticmethod
+    def make_fingerprint(agent_id, title, alert_type):
+        """Identify the rule that raised an alert on an agent"""
+        return hashlib.sha1(f"{agent_id}:{alert_type}:{title}".encode()).hexdigest()
+
+    @classmethod
+    def reopen(cls, queryset):
+        """Mark alerts unresolved, skipping any whose rule already has another open alert"""
+        rows = list(queryset.values_list('id', 'fingerprint', 'resolved'))
+        open_fingerprints = set(cls.objects.filter(
+            resolved=False,
+            fingerprint__in={fingerprint for _, fingerprint, _ in rows if fingerprint}
+        ).values_list('fingerprint', flat=True))
+
+        alert_ids = []
+        for alert_id, fingerprint, resolved in rows:
+            if resolved and fingerprint:
+                if fingerprint in open_fingerprints:
+                    continue
+                open_fingerprints.add(fingerprint)
+            alert_ids.append(alert_id)
+
+        return cls.objects.filter(id__in=alert_ids).update(resolved=False, resolved_at=None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        alert = super().from_db(db, field_names, values)
+        # Lets post_save tell an alert being resolved from a resolved one saved again
+        alert._was_resolved = alert.__dict__.get('resolved')
+        return alert
+
     def add_note(self, note):
         """Add a note to the alert"""
         from django.utils import timezone
@@ -144,6 +305,7 @@ class Alert(models.Model):
     resolved_at = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)  # New field for admin notes
     metadata = models.JSONField(default=dict)  # New field for additional data like process names, network info
+    fingerprint = models.CharField(max_length=40, blank=True, default='', db_index=True)  # Set for rule-raised alerts
 
     def __str__(self):
         return f"{self.level.upper()}: {self.title}"
@@ -168,6 +330,14 @@ class UserSession(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['agent', 'username']),
+            models.Index(fields=['agent', 'login_time']),
+            models.Index(fields=['login_time']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['agent', 'username', 'pid', 'login_time'],
+                name='unique_user_session',
+            ),
         ]
 # models.py - ADD THESE MODELS
 class HostMetric(models.Model):
@@ -182,11 +352,25 @@ class HostMetric(models.Model):
     disk_used = models.BigIntegerField(default=0)
     network_sent = models.BigIntegerField(default=0)
     network_received = models.BigIntegerField(default=0)
+    # Upload path the usage values come from; log-sourced rows have no totals (0)
+    source = models.CharField(max_length=10, choices=METRIC_SOURCES, default='metrics')
+    # Sample time of the other upload path's sample merged into this row, if any
+    merged_timestamp = models.DateTimeField(null=True, blank=True)
+    # Whether the row has been through threshold checks (see monitoring.hostmetrics)
+    evaluated = models.BooleanField(default=True)
     
     class Meta:
         indexes = [
             models.Index(fields=['agent', 'timestamp']),
             models.Index(fields=['timestamp']),
+            models.Index(
+                fields=['agent', 'timestamp'],
+                condition=models.Q(evaluated=False),
+                name='host_metric_unevaluated_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'timestamp'], name='unique_host_metric_sample'),
         ]
         ordering = ['-timestamp']
 
@@ -194,17 +378,171 @@ class HostMetric(models.Model):
         return f"{self.agent.hostname} - {self.timestamp}"
 
 
+
+class HostMetricRollup(models.Model):
+    """Per-agent HostMetric aggregates at fixed bucket sizes, used for charts"""
+    RESOLUTIONS = [
+        ('1m', '1 minute'),
+        ('5m', '5 minutes'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+    RESOLUTION_SECONDS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+    # HostMetric fields that get min/max/avg/last columns
+    METRIC_FIELDS = ['cpu_usage', 'memory_usage', 'disk_usage', 'network_sent', 'network_received']
+    
+    agent = models.ForeignKey(MonitoringAgent, on_delete=models.CASCADE, related_name='metric_rollups')
+    resolution = models.CharField(max_length=2, choices=RESOLUTIONS)
+    bucket = models.DateTimeField()
+    sample_count = models.IntegerField(default=0)
+    last_timestamp = models.DateTimeField()
+    cpu_usage_min = models.FloatField(default=0.0)
+    cpu_usage_max = models.FloatField(default=0.0)
+    cpu_usage_avg = models.FloatField(default=0.0)
+    cpu_usage_last = models.FloatField(default=0.0)
+    memory_usage_min = models.FloatField(default=0.0)
+    memory_usage_max = models.FloatField(default=0.0)
+    memory_usage_avg = models.FloatField(default=0.0)
+    memory_usage_last = models.FloatField(default=0.0)
+    disk_usage_min = models.FloatField(default=0.0)
+    disk_usage_max = models.FloatField(default=0.0)
+    disk_usage_avg = models.FloatField(default=0.0)
+    disk_usage_last = models.FloatField(default=0.0)
+    network_sent_min = models.FloatField(default=0.0)
+    network_sent_max = models.FloatField(default=0.0)
+    network_sent_avg = models.FloatField(default=0.0)
+    network_sent_last = models.FloatField(default=0.0)
+    network_received_min = models.FloatField(default=0.0)
+    network_received_max = models.FloatField(default=0.0)
+    network_received_avg = models.FloatField(default=0.0)
+    network_received_last = models.FloatField(default=0.0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['agent', 'resolution', 'bucket'],
+                name='unique_metric_rollup_bucket'
+            ),
+        ]
+        ordering = ['-bucket']
+    
+    def __str__(self):
+        return f"{self.agent.hostname} - {self.resolution} - {self.bucket}"
+    
+    def add_sample(self, metric):
+        """Fold one HostMetric into this bucket; samples may arrive in any order"""
+        first = self.sample_count == 0
+        newest = first or metric.timestamp >= self.last_timestamp
+        count = self.sample_count
+        
+        for field in self.METRIC_FIELDS:
+            value = float(getattr(metric, field))
+            if first:
+                setattr(self, f'{field}_min', value)
+                setattr(self, f'{field}_max', value)
+                setattr(self, f'{field}_avg', value)
+            else:
+                setattr(self, f'{field}_min', min(getattr(self, f'{field}_min'), value))
+                setattr(self, f'{field}_max', max(getattr(self, f'{field}_max'), value))
+                setattr(self, f'{field}_avg', (getattr(self, f'{field}_avg') * count + value) / (count + 1))
+            if newest:
+                setattr(self, f'{field}_last', value)
+        
+        if newest:
+            self.last_timestamp = metric.timestamp
+        self.sample_count = count + 1
+
+
 class ProcessSnapshot(models.Model):
+    """Process history, kept at PROCESS_HISTORY_INTERVAL cadence
+
+    Keyframes hold the full upload in `processes`. Delta rows hold
+    everything but `all_processes` there, plus the changes to the process
+    list since the previous row in `delta`; see monitoring.processes.
+    """
     agent = models.ForeignKey(MonitoringAgent, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(default=timezone.now)  # Fixed: use callable
     processes = models.JSONField(default=dict)
+    is_keyframe = models.BooleanField(default=True)
+    delta = models.JSONField(null=True, blank=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['agent', 'timestamp']),
+        ]
 
     def __str__(self):
         return f"{self.agent.hostname} - {self.timestamp}"
 
+
+class LiveProcess(models.Model):
+    """One row per process in an agent's newest full process list, for server-side queries"""
+    agent = models.ForeignKey(MonitoringAgent, on_delete=models.CASCADE, related_name='live_processes')
+    timestamp = models.DateTimeField()
+    pid = models.IntegerField()
+    name = models.CharField(max_length=255, blank=True)
+    user = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=32, null=True, blank=True)
+    is_root = models.BooleanField(default=False)
+    cpu_percent = models.FloatField(default=0.0)
+    memory_percent = models.FloatField(default=0.0)
+    cmdline = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'pid'], name='unique_live_process'),
+        ]
+        indexes = [
+            models.Index(fields=['agent', 'cpu_percent']),
+            models.Index(fields=['agent', 'memory_percent']),
+            models.Index(fields=['agent', 'name']),
+            models.Index(fields=['agent', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.agent.hostname} - {self.pid} {self.name}"
+
+
+class ProcessString(models.Model):
+    """Interned process name, user, status or cmdline (JSON text), shared by every snapshot
+
+    Rows are never changed once written, so their ids can be cached freely.
+    """
+    digest = models.CharField(max_length=40, unique=True)  # sha1 of value
+    value = models.TextField()
+
+    def __str__(self):
+        return self.value[:80]
+
+
+class LogCompressionDictionary(models.Model):
+    """zstd dictionary trained on stored log entries; its id is the version
+
+    Compressed SystemLog rows reference the dictionary they were written
+    with, so a newer one never makes older rows unreadable.
+    """
+    data = models.BinaryField()
+    sample_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Log dictionary v{self.id} ({len(self.data)} bytes)"
+
+
+class LatestProcessSnapshot(models.Model):
+    """The newest process list per agent, upserted at ingest"""
+    agent = models.OneToOneField(
+        MonitoringAgent, on_delete=models.CASCADE, primary_key=True, related_name='latest_processes'
+    )
+    timestamp = models.DateTimeField()
+    processes = models.JSONField(default=dict)
+    # Timestamp of the newest ProcessSnapshot history row written for the agent
+    history_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.agent.hostname} - latest {self.timestamp}"
+
 class ResourceThreshold(models.Model):
     RESOURCE_TYPES = [
         ('cpu', 'CPU'),
@@ -249,4 +587,67 @@ class NotificationChannel(models.Model):
         ordering = ['name']  # Add this line
 
     def __str__(self):
-        return f"{self.name} ({self.channel_type})"
\ No newline at end of file
+        return f"{self.name} ({self.channel_type})"
+
+class IngestJob(models.Model):
+    """Raw agent upload waiting to be processed by run_ingest_workers"""
+    KINDS = [
+        ('logs', 'Logs'),
+        ('metrics', 'Metrics'),
+        ('processes', 'Processes'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('failed', 'Failed'),
+    ]
+
+    agent = models.ForeignKey(MonitoringAgent, on_delete=models.CASCADE, related_name='ingest_jobs')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # A failed job waits until then before it is retried
+    not_before = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} for {self.agent.hostname} ({self.status})"
+
+
+class PurgeTask(models.Model):
+    """Resumable chunked delete of one model's rows matching a filter"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    model = models.CharField(max_length=100)  # app label, e.g. 'monitoring.SystemLog'
+    filters = models.JSONField(default=dict)  # queryset filter kwargs
+    reason = models.CharField(max_length=50, blank=True)
+    last_id = models.BigIntegerField(default=0)  # every matching row with pk <= last_id is gone
+    deleted = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"purge {self.model} {self.filters} ({self.status}, {self.deleted} deleted)"
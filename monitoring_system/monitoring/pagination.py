@@ -0,0 +1,150 @@
+"""Keyset (cursor) pagination on (timestamp, id) with optional or estimated counts"""
+import json
+import base64
+from collections import OrderedDict
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """Cheap row estimate from the Postgres statistics instead of COUNT(*)
+
+    Unfiltered querysets use pg_class.reltuples (summed over partitions for
+    partitioned tables); filtered ones use the planner's row estimate.
+    Returns None on databases without statistics to read.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute("""
+                SELECT SUM(GREATEST(c.reltuples, 0))::bigint FROM pg_class c
+                WHERE c.oid = to_regclass(%s)
+                   OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))
+            """, [queryset.model._meta.db_table] * 2)
+            return cursor.fetchone()[0] or 0
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first pages that seek past the last (timestamp, id) seen
+
+    Every page is an index range scan from the cursor, so page 1000 costs
+    the same as page 1. The view names its time column in `keyset_field`
+    (default 'timestamp'). `count` is estimated by default; pass
+    `count=exact` for COUNT(*) or `count=none` to skip it.
+
+    A view can add rows from outside the database (e.g. the log archive):
+    `get_archived_rows(position, reverse, limit)` returns up to limit rows
+    past the cursor position ((value, pk) or None) in page order, and
+    `count_archived_rows()` how many there are in total.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.field = getattr(view, 'keyset_field', 'timestamp')
+        self.page_size = self.get_page_size(request)
+        self.count, self.count_is_estimate = self.get_count(queryset, request)
+        if self.count is not None and hasattr(view, 'count_archived_rows'):
+            self.count += view.count_archived_rows()
+
+        cursor = self.decode_cursor(request)
+        field = self.field
+        queryset = queryset.order_by(f'-{field}', '-pk')
+        reverse = False
+        if cursor:
+            value, pk, reverse = cursor
+            if reverse:
+                # Walking back towards newer rows: read them oldest first
+                queryset = queryset.filter(
+                    Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | Q(pk__gt=pk))
+                ).order_by(field, 'pk')
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(pk__lt=pk))
+                )
+
+        rows = list(queryset[:self.page_size + 1])
+        archived = getattr(view, 'get_archived_rows', None)
+        if archived is not None:
+            extra = archived(cursor[:2] if cursor else None, reverse, self.page_size + 1)
+            if extra:
+                rows = sorted(
+                    rows + extra, key=lambda row: (getattr(row, field), row.pk), reverse=not reverse
+                )[:self.page_size + 1]
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else cursor is not None
+        self.next_cursor = self.encode_cursor(rows[-1], False) if rows and has_next else None
+        self.previous_cursor = self.encode_cursor(rows[0], True) if rows and has_previous else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param, 'estimate')
+        if mode == 'none':
+            return None, False
+        if mode != 'exact':
+            estimate = estimate_count(queryset)
+            if estimate is not None:
+                return estimate, True
+        return queryset.count(), False
+
+    def encode_cursor(self, row, reverse):
+        position = {'v': getattr(row, self.field).isoformat(), 'p': row.pk, 'r': int(reverse)}
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            value = parse_datetime(position['v'])
+            if value is None:
+                raise ValueError(position['v'])
+            return value, int(position['p']), bool(position.get('r'))
+        except (ValueError, KeyError, TypeError):
+            raise NotFound('Invalid cursor')
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_is_estimate', self.count_is_estimate),
+            ('next', self.get_link(self.next_cursor)),
+            ('previous', self.get_link(self.previous_cursor)),
+            ('results', data),
+        ]))
@@ -0,0 +1,41 @@
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.parsers import BaseParser
+
+# MessagePack support is optional; without it only JSON uploads are accepted
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Versions of the binary upload envelope this server understands
+ENVELOPE_VERSIONS = [1]
+
+
+class EnvelopeParser(BaseParser):
+    """Parse a MessagePack upload envelope.
+
+    Version 1 is a map of hostname, username, timestamp, codec and token,
+    where token is the raw (not base64-encoded) Fernet token.
+    """
+
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        # 415 tells agents to fall back to JSON uploads
+        if not MSGPACK_AVAILABLE:
+            raise UnsupportedMediaType(media_type or self.media_type, 'MessagePack uploads are not supported by this server')
+
+        try:
+            envelope = msgpack.unpackb(stream.read(), raw=False)
+        except Exception as e:
+            raise ParseError(f'Invalid upload envelope: {e}')
+
+        if not isinstance(envelope, dict):
+            raise ParseError('Invalid upload envelope')
+        if envelope.get('v') not in ENVELOPE_VERSIONS:
+            raise UnsupportedMediaType(media_type or self.media_type, 'Unsupported upload envelope version')
+        if not isinstance(envelope.get('token'), bytes):
+            raise ParseError('Upload envelope is missing its token')
+
+        return envelope
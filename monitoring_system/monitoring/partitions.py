@@ -0,0 +1,148 @@
+"""Declarative range partitioning on `timestamp` for the large time-series tables
+
+Only Postgres partitions; on other databases (SQLite in tests and local
+runs) the tables stay plain and retention falls back to deleting rows.
+"""
+import logging
+from datetime import timedelta, timezone as dt_timezone
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = {'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+
+
+def supports_partitioning():
+    return connection.vendor == 'postgresql'
+
+
+def partition_options(label):
+    """TIME_PARTITIONS entry for a model, with its RETENTION_POLICIES age as retention_days"""
+    return dict(settings.TIME_PARTITIONS[label], retention_days=settings.RETENTION_POLICIES[label]['days'])
+
+
+def partitioned_models():
+    """(model, options) for every model listed in settings.TIME_PARTITIONS"""
+    for label in settings.TIME_PARTITIONS:
+        yield apps.get_model(label), partition_options(label)
+
+
+def partition_start(timestamp, interval):
+    """Start of the UTC day (or Monday-based week) timestamp falls in"""
+    start = timestamp.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def partition_name(table, start):
+    return f'{table}_p{start:%Y%m%d}'
+
+
+def default_partition_name(table):
+    return f'{table}_default'
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def parse_bound(bound):
+    """(start, end) of a range partition bound from pg_get_expr, or None for the default partition
+
+    FOR VALUES FROM ('2024-01-01 00:00:00+00') TO ('2024-01-02 00:00:00+00')
+    """
+    if bound == 'DEFAULT':
+        return None
+    start, end = [part.split("'")[1] for part in bound.split('FROM', 1)[1].split('TO')]
+    return parse_datetime(start), parse_datetime(end)
+
+
+def list_partitions(table):
+    """{name: (start, end)} for the range partitions of table (the default one excluded)"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, [table])
+        rows = cursor.fetchall()
+
+    partitions = {}
+    for name, bound in rows:
+        bounds = parse_bound(bound)
+        if bounds is not None:
+            partitions[name] = bounds
+    return partitions
+
+
+def create_partition(table, start, end):
+    """Add the [start, end) partition, moving in any rows the default partition caught"""
+    qn = connection.ops.quote_name
+    name = partition_name(table, start)
+    default = default_partition_name(table)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Keep inserts out of the default partition until the range is attached
+        cursor.execute(f'LOCK TABLE {qn(default)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {qn(default)} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *
+            )
+            INSERT INTO {qn(name)} SELECT * FROM moved
+        """, [start, end])
+        # Bounds go in as plain string literals, which every Postgres version accepts
+        cursor.execute(
+            f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)',
+            [start.isoformat(), end.isoformat()]
+        )
+    logger.info(f"Created partition {name} [{start}, {end})")
+    return name
+
+
+def ensure_partitions(table, options, now=None):
+    """Create missing partitions from the retention cutoff up to `premake` intervals ahead"""
+    now = now or timezone.now()
+    interval = options['interval']
+    step = INTERVALS[interval]
+    existing = {start for start, end in list_partitions(table).values()}
+
+    created = []
+    start = partition_start(now - timedelta(days=options['retention_days']), interval)
+    last = partition_start(now, interval) + step * options['premake']
+    while start <= last:
+        if start not in existing:
+            created.append(create_partition(table, start, start + step))
+        start += step
+    return created
+
+
+def drop_expired_partitions(table, options, now=None):
+    """Drop partitions that ended before the retention cutoff; returns their names"""
+    qn = connection.ops.quote_name
+    cutoff = (now or timezone.now()) - timedelta(days=options['retention_days'])
+
+    dropped = []
+    for name, (start, end) in sorted(list_partitions(table).items()):
+        if end <= cutoff:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {qn(name)}')
+            dropped.append(name)
+            logger.info(f"Dropped expired partition {name}")
+
+    # Stragglers older than any partition landed in the default partition
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {qn(default_partition_name(table))} WHERE "timestamp" < %s',
+            [cutoff]
+        )
+    return dropped
+
@@ -0,0 +1,446 @@
+"""Process snapshot storage: one latest row per agent plus thinned-out history
+
+History is delta-encoded: every PROCESS_KEYFRAME_INTERVAL-th row is a
+keyframe with the full upload, the rows in between only record which
+processes (by pid) were added, removed or changed since the row before,
+and list the top CPU/memory processes by pid.
+
+Stored process lists are dictionary-encoded: each process with the usual
+agent fields becomes a compact row (see PROCESS_FIELDS) whose name, user,
+cmdline and status are ids into the ProcessString table. Anything else is
+kept as the original dict, so old and unusual rows decode unchanged.
+"""
+import json
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import LatestProcessSnapshot, LiveProcess, MonitoringAgent, ProcessSnapshot, ProcessString
+
+# Process fields in the order compact rows store them; the ones in
+# INTERNED_FIELDS are stored as ProcessString ids (null for None)
+PROCESS_FIELDS = ['pid', 'name', 'user', 'cmdline', 'cpu_percent', 'memory_percent', 'status', 'is_root']
+PROCESS_FIELD_SET = set(PROCESS_FIELDS)
+INTERNED_FIELDS = {'name', 'user', 'cmdline', 'status'}
+PROCESS_LISTS = ['all_processes', 'top_cpu_processes', 'top_memory_processes']
+INTERN_BATCH_SIZE = 500
+
+# ProcessString rows never change, so each worker caches them without invalidation
+_string_ids = {}
+_string_values = {}
+
+
+def _remember(strings):
+    """Cache the (id, key, value) triples a finished batch looked up
+
+    Callers build their own maps for the batch first, so clearing the cache
+    here when it is full never loses a string they still need.
+    """
+    size = settings.PROCESS_STRING_CACHE_SIZE
+    if len(_string_values) + len(strings) > size:
+        _string_ids.clear()
+        _string_values.clear()
+    for string_id, key, value in strings[:size]:
+        _string_ids[key] = string_id
+        _string_values[string_id] = value
+
+
+def _string_key(value):
+    """Hashable cache key for an interned value without serializing the common cases"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return tuple(value)
+    # Can't collide with a cmdline tuple, which only holds strings
+    return (None, _string_text(value))
+
+
+def _string_text(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def _is_compactable(process):
+    return isinstance(process, dict) and process.keys() == PROCESS_FIELD_SET
+
+
+def intern_strings(values):
+    """{key: id} for a {_string_key(value): value} map, adding values ProcessString doesn't have yet"""
+    ids = {}
+    missing = {}
+    for key, value in values.items():
+        if key in _string_ids:
+            ids[key] = _string_ids[key]
+        else:
+            text = _string_text(value)
+            missing[hashlib.sha1(text.encode()).hexdigest()] = (key, value, text)
+    if missing:
+        looked_up = []
+        digests = list(missing)
+        for start in range(0, len(digests), INTERN_BATCH_SIZE):
+            batch = digests[start:start + INTERN_BATCH_SIZE]
+            found = dict(ProcessString.objects.filter(digest__in=batch).values_list('digest', 'id'))
+            new = [ProcessString(digest=digest, value=missing[digest][2]) for digest in batch if digest not in found]
+            if new:
+                # A concurrent upload may insert the same strings; read back whichever row won
+                ProcessString.objects.bulk_create(new, ignore_conflicts=True)
+                found.update(ProcessString.objects.filter(
+                    digest__in=[row.digest for row in new]
+                ).values_list('digest', 'id'))
+            for digest, string_id in found.items():
+                key, value, text = missing[digest]
+                ids[key] = string_id
+                looked_up.append((string_id, key, value))
+        _remember(looked_up)
+    return ids
+
+
+def _load_strings(ids):
+    """{id: value} for every ProcessString id in ids"""
+    values = {}
+    missing = []
+    for string_id in ids:
+        if string_id in _string_values:
+            values[string_id] = _string_values[string_id]
+        else:
+            missing.append(string_id)
+    looked_up = []
+    for start in range(0, len(missing), INTERN_BATCH_SIZE):
+        for string_id, text in ProcessString.objects.filter(
+            id__in=missing[start:start + INTERN_BATCH_SIZE]
+        ).values_list('id', 'value'):
+            values[string_id] = value = json.loads(text)
+            looked_up.append((string_id, _string_key(value), value))
+    _remember(looked_up)
+    return values
+
+
+def _process_lists(processes, delta):
+    """Every stored list of process entries in a (processes, delta) payload"""
+    lists = [processes[key] for key in PROCESS_LISTS if isinstance(processes.get(key), list)]
+    if delta:
+        lists.append(delta['added'])
+    return lists
+
+
+def _map_lists(processes, delta, convert):
+    processes = {
+        key: [convert(entry) for entry in value] if key in PROCESS_LISTS and isinstance(value, list) else value
+        for key, value in processes.items()
+    }
+    if delta:
+        delta = dict(delta, added=[convert(entry) for entry in delta['added']])
+    return processes, delta
+
+
+def compact_payloads(payloads):
+    """Dictionary-encode the process lists of (processes, delta) payloads, interning in one go"""
+    values = {}
+    for processes, delta in payloads:
+        for entries in _process_lists(processes, delta):
+            for process in entries:
+                if _is_compactable(process):
+                    for field in INTERNED_FIELDS:
+                        value = process[field]
+                        if value is not None:
+                            values.setdefault(_string_key(value), value)
+    ids = intern_strings(values)
+
+    def compact(process):
+        if not _is_compactable(process):
+            return process
+        return [
+            ids[_string_key(process[field])] if field in INTERNED_FIELDS and process[field] is not None
+            else process[field]
+            for field in PROCESS_FIELDS
+        ]
+
+    return [_map_lists(processes, delta, compact) for processes, delta in payloads]
+
+
+def expand_payloads(payloads):
+    """Inverse of compact_payloads(); payloads with plain dict entries pass through"""
+    interned = [index for index, field in enumerate(PROCESS_FIELDS) if field in INTERNED_FIELDS]
+    strings = _load_strings({
+        entry[index]
+        for processes, delta in payloads
+        for entries in _process_lists(processes, delta)
+        for entry in entries if isinstance(entry, list)
+        for index in interned if entry[index] is not None
+    })
+
+    def expand(entry):
+        if not isinstance(entry, list):
+            return entry
+        return {
+            field: strings[value] if field in INTERNED_FIELDS and value is not None else value
+            for field, value in zip(PROCESS_FIELDS, entry)
+        }
+
+    return [_map_lists(processes, delta, expand) for processes, delta in payloads]
+
+
+def expand_processes(processes):
+    """A stored upload (e.g. LatestProcessSnapshot.processes) with its process lists decoded"""
+    return expand_payloads([(processes, None)])[0][0]
+
+
+def upsert_latest(agent, timestamp, processes, history_at):
+    """Make (timestamp, processes) the agent's latest snapshot unless a newer one is stored
+
+    One INSERT ... ON CONFLICT DO UPDATE ... WHERE, so concurrent or late
+    uploads can never replace a newer process list with an older one.
+    Returns whether this upload became the latest.
+    """
+    qn = connection.ops.quote_name
+    table = qn(LatestProcessSnapshot._meta.db_table)
+    field = LatestProcessSnapshot._meta.get_field
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table} (agent_id, {qn('timestamp')}, processes, history_at)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (agent_id) DO UPDATE SET
+                {qn('timestamp')} = EXCLUDED.{qn('timestamp')},
+                processes = EXCLUDED.processes,
+                history_at = EXCLUDED.history_at
+            WHERE {table}.{qn('timestamp')} <= EXCLUDED.{qn('timestamp')}
+        """, [
+            agent.id,
+            field('timestamp').get_db_prep_save(timestamp, connection),
+            field('processes').get_db_prep_save(processes, connection),
+            field('history_at').get_db_prep_save(history_at, connection),
+        ])
+        return cursor.rowcount > 0
+
+
+def refresh_live_processes(agent, timestamp, processes):
+    """Replace the agent's LiveProcess rows with an uploaded all_processes list"""
+    rows = {}
+    for process in processes:
+        if not isinstance(process, dict) or not isinstance(process.get('pid'), int):
+            continue
+        rows[process['pid']] = LiveProcess(
+            agent=agent,
+            timestamp=timestamp,
+            pid=process['pid'],
+            name=str(process.get('name') or '')[:255],
+            user=process.get('user'),
+            status=process.get('status'),
+            is_root=bool(process.get('is_root')),
+            cpu_percent=process.get('cpu_percent') or 0.0,
+            memory_percent=process.get('memory_percent') or 0.0,
+            cmdline=process.get('cmdline') or []
+        )
+
+    LiveProcess.objects.filter(agent=agent).exclude(pid__in=list(rows)).delete()
+    LiveProcess.objects.bulk_create(
+        rows.values(),
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['agent', 'pid'],
+        update_fields=[
+            'timestamp', 'name', 'user', 'status', 'is_root', 'cpu_percent', 'memory_percent', 'cmdline'
+        ]
+    )
+
+
+def _by_pid(processes):
+    """{pid: process} for a process list, or None if it can't be keyed by pid"""
+    if not isinstance(processes, list):
+        return None
+    by_pid = {}
+    for process in processes:
+        if not isinstance(process, dict) or 'pid' not in process or process['pid'] in by_pid:
+            return None
+        by_pid[process['pid']] = process
+    return by_pid
+
+
+def diff_processes(old, new):
+    """Delta turning process list old into new, or None if either isn't a list keyed by pid
+
+    Changed processes only carry their pid and the fields that changed.
+    """
+    old_by_pid = _by_pid(old)
+    new_by_pid = _by_pid(new)
+    if old_by_pid is None or new_by_pid is None:
+        return None
+
+    added = []
+    removed = [pid for pid in old_by_pid if pid not in new_by_pid]
+    changed = []
+    for pid, process in new_by_pid.items():
+        before = old_by_pid.get(pid)
+        if before is None:
+            added.append(process)
+        elif before.keys() != process.keys():
+            removed.append(pid)
+            added.append(process)
+        elif before != process:
+            changes = {key: value for key, value in process.items() if before[key] != value}
+            changes['pid'] = pid
+            changed.append(changes)
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+
+def apply_delta(processes, delta):
+    """Process list after applying a diff_processes() delta, ordered by pid"""
+    by_pid = {process['pid']: process for process in processes}
+    for pid in delta['removed']:
+        by_pid.pop(pid, None)
+    for changes in delta['changed']:
+        by_pid[changes['pid']] = {**by_pid[changes['pid']], **changes}
+    for process in delta['added']:
+        by_pid[process['pid']] = process
+    return sorted(by_pid.values(), key=lambda process: process['pid'])
+
+
+def _history_chain(agent_id, at=None, only_count=False):
+    """History rows from the newest keyframe at or before `at` up to the newest row
+
+    Empty if there is no keyframe, e.g. when retention already purged it
+    but not yet the deltas that follow it. With only_count, just the
+    number of those rows.
+    """
+    rows = ProcessSnapshot.objects.filter(agent_id=agent_id)
+    if at is not None:
+        rows = rows.filter(timestamp__lte=at)
+    keyframes = rows.filter(is_keyframe=True).order_by('-timestamp', '-id')
+    keyframe = (keyframes.only('timestamp') if only_count else keyframes).first()
+    if keyframe is None:
+        return 0 if only_count else []
+    deltas = rows.filter(
+        Q(timestamp__gt=keyframe.timestamp) | Q(timestamp=keyframe.timestamp, id__gt=keyframe.id),
+        is_keyframe=False
+    )
+    if only_count:
+        return 1 + deltas.count()
+    return [keyframe, *deltas.order_by('timestamp', 'id')]
+
+
+# Lists that repeat entries of all_processes; delta rows store them as pids
+TOP_LISTS = ['top_cpu_processes', 'top_memory_processes']
+
+
+def _encode_delta_row(base, processes):
+    """(processes, delta) for a delta row, or None if it has to be a keyframe"""
+    delta = diff_processes(base.get('all_processes'), processes.get('all_processes'))
+    if delta is None:
+        return None
+
+    by_pid = _by_pid(processes['all_processes'])
+    summary = {key: value for key, value in processes.items() if key != 'all_processes'}
+    delta['top'] = {}
+    for key in TOP_LISTS:
+        top = summary.get(key)
+        if isinstance(top, list) and all(
+            isinstance(process, dict) and by_pid.get(process.get('pid')) == process for process in top
+        ):
+            delta['top'][key] = [process['pid'] for process in top]
+            del summary[key]
+    return summary, delta
+
+
+def _replay(chain):
+    """Full upload the last row of a history chain stands for"""
+    payloads = expand_payloads([(row.processes, row.delta) for row in chain])
+    processes = payloads[0][0]
+    for summary, delta in payloads[1:]:
+        all_processes = apply_delta(processes['all_processes'], delta)
+        processes = dict(summary, all_processes=all_processes)
+        top = delta.get('top')
+        if top:
+            by_pid = {process['pid']: process for process in all_processes}
+            for key, pids in top.items():
+                processes[key] = [by_pid[pid] for pid in pids]
+    return processes
+
+
+def process_snapshot_at(agent_id, at=None):
+    """(timestamp, processes) of the agent's history as of `at` (default: newest), or None"""
+    chain = _history_chain(agent_id, at)
+    if not chain:
+        return None
+    return chain[-1].timestamp, _replay(chain)
+
+
+def encode_history(agent, uploads, base=None):
+    """ProcessSnapshot rows for (timestamp, processes) uploads following the stored history
+
+    base, if known, is the full upload the newest history row stands for;
+    it saves replaying the chain. Callers hold the agent's row lock (see
+    save_process_snapshots) so the history doesn't change underneath.
+    """
+    if base is None:
+        chain = _history_chain(agent.id)
+        base = _replay(chain) if chain else None
+        since_keyframe = len(chain)
+    else:
+        since_keyframe = _history_chain(agent.id, only_count=True)
+
+    rows = []
+    for timestamp, processes in uploads:
+        encoded = None
+        if base is not None and 0 < since_keyframe < settings.PROCESS_KEYFRAME_INTERVAL:
+            encoded = _encode_delta_row(base, processes)
+
+        if encoded is None:
+            rows.append(ProcessSnapshot(agent=agent, timestamp=timestamp, processes=processes))
+            since_keyframe = 1
+        else:
+            summary, delta = encoded
+            rows.append(ProcessSnapshot(
+                agent=agent,
+                timestamp=timestamp,
+                processes=summary,
+                is_keyframe=False,
+                delta=delta
+            ))
+            since_keyframe += 1
+        base = processes
+    return rows
+
+
+def save_process_snapshots(agent, snapshots):
+    """Store an agent's (timestamp, processes) uploads; returns the history rows written
+
+    The newest upload becomes the agent's LatestProcessSnapshot and, if it
+    carries all_processes, its LiveProcess rows. A ProcessSnapshot history
+    row is only written once PROCESS_HISTORY_INTERVAL seconds have passed
+    since the previous one. Each delta row is diffed against the row
+    before it, so an agent's uploads are stored one at a time.
+    """
+    if not snapshots:
+        return []
+    snapshots = sorted(snapshots, key=lambda snapshot: snapshot[0])
+    interval = timedelta(seconds=settings.PROCESS_HISTORY_INTERVAL)
+
+    with transaction.atomic():
+        # Held until commit, so an overlapping upload reads the history this one writes
+        MonitoringAgent.objects.select_for_update().values_list('id', flat=True).get(id=agent.id)
+        latest = LatestProcessSnapshot.objects.filter(agent_id=agent.id).only('timestamp', 'history_at').first()
+        history_at = latest.history_at if latest else None
+
+        uploads = []
+        for timestamp, processes in snapshots:
+            if history_at is None or timestamp - history_at >= interval:
+                uploads.append((timestamp, processes))
+                history_at = timestamp
+
+        history = []
+        if uploads:
+            # When the live snapshot was also the last one written to history, it is the delta base
+            base = None
+            if latest and latest.timestamp == latest.history_at:
+                base = expand_processes(latest.processes)
+            history = encode_history(agent, uploads, base)
+
+        timestamp, processes = snapshots[-1]
+        payloads = compact_payloads([(row.processes, row.delta) for row in history] + [(processes, None)])
+        for row, (row_processes, row_delta) in zip(history, payloads):
+            row.processes, row.delta = row_processes, row_delta
+        ProcessSnapshot.objects.bulk_create(history)
+        if upsert_latest(agent, timestamp, payloads[-1][0], history_at):
+            if isinstance(processes.get('all_processes'), list):
+                refresh_live_processes(agent, timestamp, processes['all_processes'])
+    return history
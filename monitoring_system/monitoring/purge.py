@@ -0,0 +1,184 @@
+"""Chunked, throttled and resumable deletes for the high-volume tables
+
+Every purge is a PurgeTask: matching rows are deleted in primary-key order,
+at most PURGE_CHUNK_SIZE per short transaction, and the task records the
+last pk it got through, so an interrupted purge continues where it stopped.
+A finished task is deleted; only unfinished ones stay around to be resumed.
+"""
+import time
+import logging
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CASCADE, Q
+from django.utils import timezone
+from .models import PurgeTask, MonitoringAgent, Alert
+from .utils import alert_cooldown
+
+logger = logging.getLogger(__name__)
+
+
+def delete_chunk(chunk):
+    """Delete a chunk of rows in one statement where Django would go row by row
+
+    Alert's post_delete receiver makes Django's collector fetch every alert
+    and forget its cooldown separately; here the chunk's cooldowns are
+    forgotten in one call once it is committed.
+    """
+    if chunk.model is Alert:
+        fingerprints = set(chunk.exclude(fingerprint='').values_list('fingerprint', flat=True))
+        chunk._raw_delete(chunk.db)
+        transaction.on_commit(lambda: alert_cooldown.forget(fingerprints))
+    else:
+        chunk.delete()
+
+
+def run_purge(task, chunk_size=None, pause=None, progress=None):
+    """Delete the task's rows chunk by chunk; returns the task
+
+    progress, if given, is called with the task after every chunk.
+    """
+    chunk_size = chunk_size or settings.PURGE_CHUNK_SIZE
+    pause = settings.PURGE_CHUNK_PAUSE if pause is None else pause
+    model = apps.get_model(task.model)
+    queryset = model._base_manager.filter(**task.filters).order_by('pk')
+
+    PurgeTask.objects.filter(id=task.id).update(status='running', updated_at=timezone.now())
+    task.status = 'running'
+
+    try:
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.filter(pk__gt=task.last_id).values_list('pk', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                # Bounded pk range: an index range scan, and short-lived row locks
+                delete_chunk(queryset.filter(pk__gte=ids[0], pk__lte=ids[-1]))
+                task.last_id = ids[-1]
+                task.deleted += len(ids)
+                PurgeTask.objects.filter(id=task.id).update(
+                    last_id=task.last_id,
+                    deleted=task.deleted,
+                    updated_at=timezone.now()
+                )
+
+            if progress:
+                progress(task)
+            if pause:
+                time.sleep(pause)
+    except Exception as e:
+        PurgeTask.objects.filter(id=task.id).update(status='failed', last_error=str(e))
+        task.status = 'failed'
+        logger.error(f"Purge task {task.id} ({task.model}) failed after {task.deleted} rows: {e}")
+        raise
+
+    PurgeTask.objects.filter(id=task.id).delete()
+    task.status = 'done'
+    logger.info(f"Purge task {task.id} ({task.model}, {task.reason}) deleted {task.deleted} rows")
+    return task
+
+
+def purge(model, filters, reason='', **options):
+    """Create a purge task for model rows matching filters and run it now"""
+    task = PurgeTask.objects.create(model=model._meta.label, filters=filters, reason=reason)
+    return run_purge(task, **options)
+
+
+def resumable_tasks():
+    """Tasks to (re)run: pending, failed, or running without progress for a while"""
+    stale = timezone.now() - timedelta(seconds=settings.PURGE_STALE_AFTER)
+    return PurgeTask.objects.filter(status__in=['pending', 'failed']) | PurgeTask.objects.filter(
+        status='running', updated_at__lt=stale
+    )
+
+
+def run_pending_purges(progress=None):
+    """Run every resumable task in creation order; returns the tasks handled"""
+    handled = []
+    for task in resumable_tasks().order_by('id'):
+        try:
+            run_purge(task, progress=progress)
+        except Exception:
+            # Recorded on the task as 'failed'; the next run retries it
+            pass
+        handled.append(task)
+    return handled
+
+
+def agent_purge_targets(agent_id):
+    """(model label, filters) of everything an agent owns, the agent row last"""
+    for relation in MonitoringAgent._meta.related_objects:
+        if relation.on_delete is CASCADE:
+            yield relation.related_model._meta.label, {relation.field.attname: agent_id}
+    yield MonitoringAgent._meta.label, {'id': agent_id}
+
+
+def plan_agent_purge(agent):
+    """Queue tasks deleting everything an agent owns, then the agent itself
+
+    Tasks run in id order, so the agent row (and its cascade, by then empty)
+    goes last. The agent is deactivated first so no new uploads come in.
+    """
+    agent.is_active = False
+    agent.save(update_fields=['is_active'])
+
+    return PurgeTask.objects.bulk_create(
+        PurgeTask(model=label, filters=filters, reason='agent_delete')
+        for label, filters in agent_purge_targets(agent.id)
+    )
+
+
+def agent_purge_tasks(agent_id):
+    """The agent's queued (or unfinished) purge tasks"""
+    targets = Q()
+    for label, filters in agent_purge_targets(agent_id):
+        targets |= Q(model=label, filters=filters)
+    return PurgeTask.objects.filter(targets, reason='agent_delete')
+
+
+def run_agent_purge(agent_id, progress=None):
+    """Run an agent's resumable purge tasks now, in order; returns them
+
+    A task another process is still running is left to it, so the agent row
+    may outlive this call.
+    """
+    tasks = resumable_tasks() & agent_purge_tasks(agent_id)
+    return [run_purge(task, progress=progress) for task in tasks.order_by('id')]
+
+
+def release_hostname(hostname):
+    """Make way for a new agent called hostname; False if an agent still holds it
+
+    A deleted agent whose purge is still queued (no cron has run it yet) is
+    purged here, so its host can register again.
+    """
+    agent = MonitoringAgent.objects.filter(hostname=hostname).first()
+    if agent is None:
+        return True
+    if agent.is_active or not agent_purge_tasks(agent.id).exists():
+        return False
+    logger.info(f"Finishing the queued purge of deleted agent {hostname} before it registers again")
+    run_agent_purge(agent.id)
+    return not MonitoringAgent.objects.filter(id=agent.id).exists()
+
+
+def retention_tasks(now=None):
+    """Create one purge task per settings.RETENTION_POLICIES entry
+
+    A model that still has an unfinished retention task is skipped; that
+    task is resumed by run_pending_purges() instead.
+    """
+    now = now or timezone.now()
+    unfinished = set(
+        resumable_tasks().filter(reason='retention').values_list('model', flat=True)
+    )
+
+    tasks = []
+    for label, policy in settings.RETENTION_POLICIES.items():
+        if label in unfinished:
+            continue
+        cutoff = now - timedelta(days=policy['days'])
+        filters = {f"{policy['field']}__lt": cutoff.isoformat(), **policy.get('filters', {})}
+        tasks.append(PurgeTask.objects.create(model=label, filters=filters, reason='retention'))
+    return tasks
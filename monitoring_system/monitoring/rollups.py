@@ -0,0 +1,309 @@
+"""Multi-resolution HostMetric rollups (1m / 5m / 1h / 1d buckets) and bucketed series"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby
+from django.db import connection, transaction
+from django.db.models import Aggregate, Avg, Count, FloatField, Func, IntegerField, Max, Min
+from .models import HostMetric, HostMetricRollup
+
+logger = logging.getLogger(__name__)
+
+RESOLUTION_SECONDS = HostMetricRollup.RESOLUTION_SECONDS
+UPDATE_FIELDS = ['sample_count', 'last_timestamp'] + [
+    f'{field}_{stat}'
+    for field in HostMetricRollup.METRIC_FIELDS
+    for stat in ('min', 'max', 'avg', 'last')
+]
+
+
+def bucket_start(timestamp, seconds):
+    """Start of the UTC bucket of the given size that timestamp falls in"""
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=dt_timezone.utc)
+
+
+def pick_resolution(span_seconds, points):
+    """Coarsest tier that still gives at least about `points` buckets over the span
+
+    Returns None when even 1m buckets would be too coarse, meaning raw
+    HostMetric rows should be served instead.
+    """
+    for resolution, seconds in sorted(RESOLUTION_SECONDS.items(), key=lambda item: -item[1]):
+        # "About" N: accept a tier that gives at least half the requested points
+        if span_seconds / seconds >= points / 2:
+            return resolution
+    return None
+
+
+def update_rollups(metrics):
+    """Fold freshly stored HostMetric rows into every rollup tier
+
+    Late and out-of-order samples simply land in their (older) bucket. The
+    samples of each bucket are summed up here and merged into the stored
+    bucket by the database, so concurrent uploads can't lose each other's.
+    """
+    pending = {}
+    for metric in metrics:
+        for resolution, seconds in RESOLUTION_SECONDS.items():
+            key = (metric.agent_id, resolution, bucket_start(metric.timestamp, seconds))
+            rollup = pending.get(key)
+            if rollup is None:
+                agent_id, resolution, bucket = key
+                pending[key] = rollup = HostMetricRollup(agent_id=agent_id, resolution=resolution, bucket=bucket)
+            rollup.add_sample(metric)
+
+    merge_rollups(list(pending.values()))
+    return len(pending)
+
+
+def replace_samples(changes):
+    """Swap the new values of updated HostMetric rows into their rollup buckets
+
+    changes is a list of (old, metric): the METRIC_FIELDS values a row held
+    before it was updated, and the updated row. Sample counts stay as they
+    are, averages move by the difference and `last` follows when the row is
+    its bucket's newest. A min or max that an old value defined is
+    recomputed from the bucket's raw rows, so the rows must be saved first.
+    Callers hold the agent's row lock, so its buckets can't change meanwhile.
+    """
+    changed = {}
+    for old, metric in changes:
+        for resolution, seconds in RESOLUTION_SECONDS.items():
+            key = (metric.agent_id, resolution, bucket_start(metric.timestamp, seconds))
+            changed.setdefault(key, []).append((old, metric))
+    if not changed:
+        return 0
+
+    rollups = HostMetricRollup.objects.filter(
+        agent_id__in={key[0] for key in changed},
+        bucket__in={key[2] for key in changed}
+    )
+    updated = []
+    for rollup in rollups:
+        key = (rollup.agent_id, rollup.resolution, rollup.bucket)
+        if key not in changed:
+            continue
+        stale = []
+        for old, metric in changed[key]:
+            for field in HostMetricRollup.METRIC_FIELDS:
+                before, after = float(old[field]), float(getattr(metric, field))
+                if before == after:
+                    continue
+                setattr(rollup, f'{field}_avg', getattr(rollup, f'{field}_avg') + (after - before) / rollup.sample_count)
+                if metric.timestamp == rollup.last_timestamp:
+                    setattr(rollup, f'{field}_last', after)
+                for stat, widen in (('min', min), ('max', max)):
+                    extreme = getattr(rollup, f'{field}_{stat}')
+                    if before == extreme and widen(before, after) == before:
+                        stale.append(f'{field}_{stat}')
+                    else:
+                        setattr(rollup, f'{field}_{stat}', widen(extreme, after))
+
+        if stale:
+            # The old value was the extreme and moved inwards: only the raw rows know the new one
+            seconds = RESOLUTION_SECONDS[rollup.resolution]
+            extremes = HostMetric.objects.filter(
+                agent_id=rollup.agent_id,
+                timestamp__gte=rollup.bucket,
+                timestamp__lt=rollup.bucket + timedelta(seconds=seconds)
+            ).aggregate(**{
+                column: (Min if column.endswith('_min') else Max)(column.rsplit('_', 1)[0])
+                for column in set(stale)
+            })
+            for column, value in extremes.items():
+                setattr(rollup, column, float(value))
+        updated.append(rollup)
+
+    HostMetricRollup.objects.bulk_update(updated, UPDATE_FIELDS)
+    return len(updated)
+
+
+def merge_rollups(rollups):
+    """Merge partial rollups into their stored buckets, inserting missing ones
+
+    One INSERT ... ON CONFLICT DO UPDATE per batch: counts add up, min/max
+    widen, averages are weighted by sample count and the newer `last`
+    values win, all computed from the stored row at write time.
+    """
+    if not rollups:
+        return
+    qn = connection.ops.quote_name
+    table = qn(HostMetricRollup._meta.db_table)
+    fields = {field.attname: field for field in HostMetricRollup._meta.concrete_fields}
+    columns = ['agent_id', 'resolution', 'bucket'] + UPDATE_FIELDS
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+
+    def stored(column):
+        return f'{table}.{qn(column)}'
+
+    def excluded(column):
+        return f'EXCLUDED.{qn(column)}'
+
+    newer = f"{excluded('last_timestamp')} >= {stored('last_timestamp')}"
+    updates = {
+        'sample_count': f"{stored('sample_count')} + {excluded('sample_count')}",
+        'last_timestamp': f"CASE WHEN {newer} THEN {excluded('last_timestamp')} ELSE {stored('last_timestamp')} END",
+    }
+    for field in HostMetricRollup.METRIC_FIELDS:
+        updates[f'{field}_min'] = f"{least}({stored(f'{field}_min')}, {excluded(f'{field}_min')})"
+        updates[f'{field}_max'] = f"{greatest}({stored(f'{field}_max')}, {excluded(f'{field}_max')})"
+        updates[f'{field}_avg'] = (
+            f"({stored(f'{field}_avg')} * {stored('sample_count')} + {excluded(f'{field}_avg')} * {excluded('sample_count')})"
+            f" / ({stored('sample_count')} + {excluded('sample_count')})"
+        )
+        updates[f'{field}_last'] = f"CASE WHEN {newer} THEN {excluded(f'{field}_last')} ELSE {stored(f'{field}_last')} END"
+
+    batch_size = connection.ops.bulk_batch_size([fields[column] for column in columns], rollups)
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rollups), batch_size):
+            batch = rollups[start:start + batch_size]
+            cursor.execute(f"""
+                INSERT INTO {table} ({', '.join(qn(column) for column in columns)})
+                VALUES {', '.join([row] * len(batch))}
+                ON CONFLICT (agent_id, resolution, bucket) DO UPDATE SET
+                    {', '.join(f'{qn(column)} = {expression}' for column, expression in updates.items())}
+            """, [
+                fields[column].get_db_prep_save(getattr(rollup, column), connection)
+                for rollup in batch
+                for column in columns
+            ])
+
+
+def rebuild_rollups(since=None, agent_ids=None, batch_size=1000):
+    """Recompute rollups from raw HostMetric rows
+
+    Every bucket from the start of the UTC day containing `since` onwards is
+    rebuilt, so samples that arrived late or out of order are all counted.
+    Raw rows are streamed in (agent, timestamp) order, so only one open
+    bucket per tier is held at a time.
+    """
+    metrics = HostMetric.objects.all()
+    rollups = HostMetricRollup.objects.all()
+    if agent_ids:
+        metrics = metrics.filter(agent_id__in=agent_ids)
+        rollups = rollups.filter(agent_id__in=agent_ids)
+    if since is not None:
+        since = bucket_start(since, RESOLUTION_SECONDS['1d'])
+        metrics = metrics.filter(timestamp__gte=since)
+        rollups = rollups.filter(bucket__gte=since)
+
+    metrics = metrics.order_by('agent_id', 'timestamp').only(
+        'agent_id', 'timestamp', *HostMetricRollup.METRIC_FIELDS
+    )
+
+    built = 0
+    with transaction.atomic():
+        rollups.delete()
+
+        open_buckets = {}
+        finished = []
+        for metric in metrics.iterator(chunk_size=2000):
+            for resolution, seconds in RESOLUTION_SECONDS.items():
+                bucket = bucket_start(metric.timestamp, seconds)
+                rollup = open_buckets.get(resolution)
+                if rollup is None or rollup.agent_id != metric.agent_id or rollup.bucket != bucket:
+                    if rollup is not None:
+                        finished.append(rollup)
+                    rollup = HostMetricRollup(agent_id=metric.agent_id, resolution=resolution, bucket=bucket)
+                    open_buckets[resolution] = rollup
+                rollup.add_sample(metric)
+
+            if len(finished) >= batch_size:
+                HostMetricRollup.objects.bulk_create(finished)
+                built += len(finished)
+                finished = []
+
+        finished.extend(open_buckets.values())
+        HostMetricRollup.objects.bulk_create(finished, batch_size=batch_size)
+        built += len(finished)
+
+    logger.info(f"Rebuilt {built} metric rollups")
+    return built
+
+
+class EpochBucket(Func):
+    """Epoch seconds of the start of the `step`-second bucket a datetime falls in"""
+    template = 'CAST(FLOOR(EXTRACT(EPOCH FROM %(expressions)s) / %(step)s) * %(step)s AS BIGINT)'
+    output_field = IntegerField()
+
+    def __init__(self, expression, step):
+        super().__init__(expression, step=int(step))
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Epoch timestamps are positive, so integer division floors
+        return self.as_sql(
+            compiler, connection,
+            template="((CAST(strftime('%%%%s', %(expressions)s) AS INTEGER) / %(step)s) * %(step)s)",
+            **extra_context
+        )
+
+
+class Percentile(Aggregate):
+    """PERCENTILE_CONT (Postgres only)"""
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def _percentile(values, fraction):
+    """Linear-interpolated percentile, matching Postgres PERCENTILE_CONT"""
+    values = sorted(values)
+    position = fraction * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+# Columnar series keys and the HostMetric fields behind them
+SERIES_FIELDS = {
+    'cpu': 'cpu_usage',
+    'mem': 'memory_usage',
+    'disk': 'disk_usage',
+    'net_sent': 'network_sent',
+    'net_recv': 'network_received',
+}
+SERIES_AGGREGATIONS = {
+    'avg': Avg,
+    'max': Max,
+    'min': Min,
+    'p95': lambda field: Percentile(field, 0.95),
+}
+
+
+def metric_series(agent_id, start, end, step, aggregation='avg'):
+    """Aggregate one agent's metrics into `step`-second buckets, grouped in SQL
+
+    Returns columnar lists: ts (bucket start, epoch seconds), samples and one
+    list per SERIES_FIELDS key. Empty buckets are left out.
+    """
+    metrics = HostMetric.objects.filter(
+        agent_id=agent_id,
+        timestamp__gte=start,
+        timestamp__lt=end
+    ).annotate(ts=EpochBucket('timestamp', step))
+    series = {key: [] for key in ['ts', 'samples', *SERIES_FIELDS]}
+
+    if aggregation == 'p95' and connection.vendor != 'postgresql':
+        # No PERCENTILE_CONT here: bucket in SQL, take the percentile per bucket
+        rows = metrics.order_by('ts').values_list('ts', *SERIES_FIELDS.values())
+        for ts, bucket_rows in groupby(rows.iterator(), key=lambda row: row[0]):
+            bucket_rows = list(bucket_rows)
+            series['ts'].append(ts)
+            series['samples'].append(len(bucket_rows))
+            for index, key in enumerate(SERIES_FIELDS, start=1):
+                series[key].append(_percentile([row[index] for row in bucket_rows], 0.95))
+        return series
+
+    aggregate = SERIES_AGGREGATIONS[aggregation]
+    rows = metrics.values('ts').annotate(
+        samples=Count('id'),
+        **{key: aggregate(field) for key, field in SERIES_FIELDS.items()}
+    ).order_by('ts')
+    for row in rows:
+        for key in series:
+            series[key].append(row[key])
+    return series
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import MonitoringAgent, SystemLog, Alert, UserSession, AgentRegistrationRequest , HostMetric , ProcessSnapshot , ResourceThreshold , NotificationChannel
+from .models import MonitoringAgent, SystemLog, Alert, UserSession, AgentRegistrationRequest , HostMetric , HostMetricRollup , ProcessSnapshot , ResourceThreshold , NotificationChannel
+from .logstorage import rehydrate
 
 class MonitoringAgentSerializer(serializers.ModelSerializer):
     log_count = serializers.IntegerField(read_only=True)
@@ -21,12 +22,31 @@ class AgentRegistrationRequestSerializer(serializers.ModelSerializer):
             'encryption_password': {'write_only': True},
         }
 
+class SystemLogListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Rehydrate the whole page with one query per referenced table
+        logs = list(data.all() if hasattr(data, 'all') else data)
+        for log, entry in zip(logs, rehydrate(logs)):
+            log.full_data = entry
+        return super().to_representation(logs)
+
 class SystemLogSerializer(serializers.ModelSerializer):
     agent_hostname = serializers.CharField(source='agent.hostname', read_only=True)
     
     class Meta:
         model = SystemLog
-        fields = '__all__'
+        # `data` is returned decoded, whatever form it is stored in
+        exclude = ['payload', 'payload_dictionary']
+        # Derived from `data` on save
+        read_only_fields = list(SystemLog.HOT_FIELDS)
+        list_serializer_class = SystemLogListSerializer
+    
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        if not hasattr(instance, 'full_data'):
+            instance.full_data = rehydrate([instance])[0]
+        representation['data'] = instance.full_data
+        return representation
 
 class AlertSerializer(serializers.ModelSerializer):
     agent_hostname = serializers.CharField(source='agent.hostname', read_only=True)
@@ -74,6 +94,20 @@ class HostMetricSerializer(serializers.ModelSerializer):
         model = HostMetric
         fields = '__all__'
 
+class HostMetricRollupSerializer(serializers.ModelSerializer):
+    """Rollup bucket shaped like a HostMetric row (averages under the plain names)"""
+    agent_hostname = serializers.CharField(source='agent.hostname', read_only=True)
+    timestamp = serializers.DateTimeField(source='bucket', read_only=True)
+    cpu_usage = serializers.FloatField(source='cpu_usage_avg', read_only=True)
+    memory_usage = serializers.FloatField(source='memory_usage_avg', read_only=True)
+    disk_usage = serializers.FloatField(source='disk_usage_avg', read_only=True)
+    network_sent = serializers.FloatField(source='network_sent_avg', read_only=True)
+    network_received = serializers.FloatField(source='network_received_avg', read_only=True)
+    
+    class Meta:
+        model = HostMetricRollup
+        exclude = ['bucket']
+
 class NestedMetricUploadSerializer(serializers.Serializer):
     hostname = serializers.CharField()
     timestamp = serializers.DateTimeField(required=False)
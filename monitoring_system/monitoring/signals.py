@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import MonitoringAgent, ResourceThreshold, Alert
+from .utils import derived_key_cache, threshold_cache, alert_cooldown, agent_identity_cache
+
+
+@receiver(post_save, sender=MonitoringAgent)
+@receiver(post_delete, sender=MonitoringAgent)
+def invalidate_agent_keys(sender, instance, **kwargs):
+    """Drop cached keys and identity whenever an agent's credentials or flags may have changed"""
+    derived_key_cache.invalidate(instance.id)
+    agent_identity_cache.invalidate(instance.hostname)
+
+
+@receiver(post_save, sender=ResourceThreshold)
+@receiver(post_delete, sender=ResourceThreshold)
+def invalidate_thresholds(sender, instance, **kwargs):
+    """Make every worker reload thresholds on its next lookup once the change is committed"""
+    transaction.on_commit(threshold_cache.bump_version)
+
+
+@receiver(post_save, sender=Alert)
+def forget_cooldown_on_resolve(sender, instance, **kwargs):
+    """An alert that just got resolved must not keep suppressing new hits of its rule"""
+    newly_resolved = instance.resolved and not getattr(instance, '_was_resolved', False)
+    instance._was_resolved = instance.resolved
+    if newly_resolved and instance.fingerprint:
+        transaction.on_commit(lambda: alert_cooldown.forget([instance.fingerprint]))
+
+
+@receiver(post_delete, sender=Alert)
+def forget_cooldown_on_delete(sender, instance, **kwargs):
+    if instance.fingerprint:
+        transaction.on_commit(lambda: alert_cooldown.forget([instance.fingerprint]))
@@ -0,0 +1,89 @@
+"""Dashboard counters: per-hour SystemLog counts and the cached stats query"""
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from .models import MonitoringAgent, AgentRegistrationRequest, Alert, SystemLogHourlyCount
+from .rollups import bucket_start
+
+STATS_CACHE_KEY = 'monitoring:dashboard_stats'
+
+
+def record_log_counts(logs):
+    """Add freshly stored SystemLog rows to their (agent, hour) counters
+
+    A single INSERT ... ON CONFLICT DO UPDATE (Postgres and SQLite both
+    support it) adds to existing counters, so concurrent uploads never lose
+    increments.
+    """
+    counts = Counter((log.agent_id, bucket_start(log.timestamp, 3600)) for log in logs)
+    if not counts:
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(SystemLogHourlyCount._meta.db_table)
+    rows = ', '.join(['(%s, %s, %s)'] * len(counts))
+    params = []
+    for (agent_id, hour), count in counts.items():
+        params += [agent_id, connection.ops.adapt_datetimefield_value(hour), count]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table} (agent_id, hour, count) VALUES {rows}
+            ON CONFLICT (agent_id, hour) DO UPDATE SET count = {table}.count + EXCLUDED.count
+        """, params)
+
+
+def recent_hours_start(now, hours=24):
+    """First counted hour of the `hours`-hour window ending in the current (partial) hour"""
+    return bucket_start(now, 3600) - timedelta(hours=hours - 1)
+
+
+def compute_dashboard_stats(now=None):
+    """All dashboard counters in one statement
+
+    Every table is reduced by an aggregate without GROUP BY, so each derived
+    table yields exactly one row and the cross join is one row as well.
+    recent_logs_count sums the hourly counters of the last 24 clock hours.
+    """
+    now = now or timezone.now()
+    agents = MonitoringAgent._meta.db_table
+    registrations = AgentRegistrationRequest._meta.db_table
+    alerts = Alert._meta.db_table
+    log_counts = SystemLogHourlyCount._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT a.total_agents, a.active_agents, r.pending_registrations,
+                   l.recent_logs_count, al.alerts_count
+            FROM (
+                SELECT COUNT(*) AS total_agents,
+                       COUNT(CASE WHEN is_active = %s AND is_approved = %s THEN 1 END) AS active_agents
+                FROM {agents}
+            ) a, (
+                SELECT COUNT(*) AS pending_registrations FROM {registrations} WHERE status = %s
+            ) r, (
+                SELECT COALESCE(SUM(count), 0) AS recent_logs_count FROM {log_counts} WHERE hour >= %s
+            ) l, (
+                SELECT COUNT(*) AS alerts_count FROM {alerts} WHERE resolved = %s
+            ) al
+        """, [
+            True, True,
+            'pending',
+            connection.ops.adapt_datetimefield_value(recent_hours_start(now)),
+            False,
+        ])
+        columns = [column[0] for column in cursor.description]
+        return {column: int(value) for column, value in zip(columns, cursor.fetchone())}
+
+
+def dashboard_stats():
+    """Dashboard counters, kept in the Django cache for DASHBOARD_STATS_TTL seconds"""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_dashboard_stats()
+        cache.set(STATS_CACHE_KEY, stats, settings.DASHBOARD_STATS_TTL)
+    return stats
+
@@ -1,3 +1,1420 @@
-from django.test import TestCase
+import io
+import os
+import copy
+import gzip
+import json
+import time
+import timeit
+import zlib
+import random
+import threading
+import base64
+import hashlib
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.test import APIClient
+from . import processes
+from .parsers import MSGPACK_AVAILABLE, EnvelopeParser
+from .models import (
+    MonitoringAgent, ProcessString, SystemLog, HostMetric, HostMetricRollup, UserSession, ResourceThreshold,
+    Alert, PurgeTask, ProcessSnapshot, IngestJob, LatestProcessSnapshot, AgentRegistrationRequest,
+    SystemLogHourlyCount,
+)
+from .logstorage import ZSTD_AVAILABLE, encode_entry, rehydrate, stored_data, train_dictionary
+from .archive import (
+    EXTENSIONS, archive_horizon, archive_logs, archive_root, archived_records, count_archived, load_index,
+)
+from .hostmetrics import store_samples
+from .partitions import (
+    create_partition, drop_expired_partitions, ensure_partitions, is_partitioned, list_partitions, parse_bound,
+    partition_start,
+)
+from .ingest import claim_jobs, drain_queue, requeue_stale_jobs
+from .purge import purge, run_pending_purges
+from .processes import save_process_snapshots, process_snapshot_at
+from .rollups import UPDATE_FIELDS, update_rollups, rebuild_rollups
+from .stats import compute_dashboard_stats, dashboard_stats, record_log_counts
+from .utils import (
+    AlertCooldownCache, EncryptionManager, FernetStream, ThresholdCache, agent_identity_cache, derived_key_cache,
+    alert_cooldown, bump_counter, create_deduplicated_alert, threshold_cache,
+    iter_json_entries, iter_msgpack_entries, _iter_inflate, _iter_slices,
+)
 
-# Create your tests here.
+if MSGPACK_AVAILABLE:
+    import msgpack
+if ZSTD_AVAILABLE:
+    import zstandard
+
+START = datetime(2026, 10, 1, tzinfo=dt_timezone.utc)
+SAMPLE_FILE = settings.BASE_DIR.parent / 'SampleDataFromAgent.json'
+
+
+def log_entry(i, users=2, hostname='pop-os'):
+    """A SampleDataFromAgent.json-shaped upload_logs entry, i minutes after START"""
+    timestamp = START + timedelta(minutes=i)
+    return {
+        'timestamp': timestamp.isoformat(),
+        'hostname': hostname,
+        'users_logged_in': {
+            'total_users': users,
+            'users': [
+                {'name': f'user{n}', 'terminal': f'pts/{n}', 'host': '127.0.0.1',
+                 'started': START.timestamp() - 3600 + n, 'pid': 2000 + n}
+                for n in range(users)
+            ],
+            'monitoring_scope': 'all_users',
+        },
+        'authentication': {
+            'failed_login_attempts': 0, 'successful_logins': 6, 'user_changes': 2,
+            'privilege_escalation': 37, 'ssh_key_changes': 0, 'account_lockouts': 0,
+        },
+        'process_system_activity': {
+            'total_processes': 265 + i % 5, 'root_processes': 175,
+            'top_cpu_processes': [],
+            'top_memory_processes': [
+                {'pid': 2330, 'name': 'gnome-shell', 'user': 'user0', 'cpu_percent': 0.0,
+                 'memory_percent': 4.6, 'cmdline': ['/usr/bin/gnome-shell'], 'is_root': False},
+            ],
+            'load_average': [0.5, 0.4, 0.3],
+        },
+        'resource_anomalies': {
+            'cpu_percent': 10.0 + i % 40, 'memory_percent': 30.0, 'disk_percent': 55.0,
+            'disk_read_bytes': 1000 * i, 'disk_write_bytes': 2000 * i,
+        },
+        'network_connection': {
+            'bytes_sent': 10_000 * i, 'bytes_recv': 50_000 * i,
+            'connections': [{'local_address': '10.0.0.2:44312', 'remote_address': '140.82.113.25:443',
+                             'status': 'ESTABLISHED', 'pid': 2330}],
+        },
+        'system_logs_audit': {'recent_syslog_entries': 40},
+    }
+
+
+def sample_entries(count, seed=1):
+    """Copies of the SampleDataFromAgent.json entry a minute apart, with counters, ports and loads drifting"""
+    rnd = random.Random(seed)
+    with open(SAMPLE_FILE) as f:
+        sample = json.load(f)[0]
+
+    entries = []
+    for i in range(count):
+        entry = copy.deepcopy(sample)
+        entry['timestamp'] = (START + timedelta(minutes=i, microseconds=rnd.randrange(10 ** 6))).isoformat()
+        entry['hostname'] = 'pop-os'
+        resources = entry['resource_anomalies']
+        resources['cpu_percent'] = round(rnd.uniform(0.5, 60), 1)
+        resources['memory_percent'] = round(rnd.uniform(20, 40), 1)
+        resources['disk_read_bytes'] += i * rnd.randrange(10 ** 5, 10 ** 6)
+        resources['disk_write_bytes'] += i * rnd.randrange(10 ** 5, 10 ** 6)
+        network = entry['network_connection']
+        network['bytes_sent'] += i * rnd.randrange(10 ** 3, 10 ** 5)
+        network['bytes_recv'] += i * rnd.randrange(10 ** 4, 10 ** 6)
+        for connection_info in network['connections']:
+            if connection_info['remote_address']:
+                address = connection_info['local_address'].rsplit(':', 1)[0]
+                connection_info['local_address'] = f'{address}:{rnd.randrange(32768, 61000)}'
+                connection_info['status'] = rnd.choice(['ESTABLISHED', 'TIME_WAIT', 'CLOSE_WAIT'])
+        entry['authentication']['failed_login_attempts'] = rnd.choice([0, 0, 0, 1, 2, 7])
+        entry['authentication']['privilege_escalation'] = 37 + i // 10
+        entry['system_logs_audit']['recent_syslog_entries'] = rnd.randrange(20, 80)
+        processes_info = entry['process_system_activity']
+        processes_info['total_processes'] = 265 + rnd.randrange(-5, 6)
+        processes_info['load_average'] = [round(rnd.uniform(0, 3), 2) for _ in range(3)]
+        for process in processes_info['top_memory_processes']:
+            process['memory_percent'] *= rnd.uniform(0.95, 1.05)
+            process['cpu_percent'] = round(rnd.uniform(0, 5), 1)
+        entries.append(entry)
+    return entries
+
+
+def churning_process_uploads(minutes, seed=7):
+    """(timestamp, upload) a minute apart for 320 processes: 3 exit and 3 spawn a minute, 15% are busy"""
+    rnd = random.Random(seed)
+    names = ['systemd', 'kworker/0:1', 'bash', 'sshd', 'python3', 'chrome', 'postgres', 'nginx', 'dockerd', 'node']
+    users = ['root', 'root', 'root', 'www-data', 'postgres', 'alice', 'bob']
+    next_pid = 1000
+    busy = set()
+
+    def spawn():
+        nonlocal next_pid
+        next_pid += rnd.randint(1, 40)
+        name, user = rnd.choice(names), rnd.choice(users)
+        if rnd.random() < 0.15:
+            busy.add(next_pid)
+        return {
+            'pid': next_pid, 'name': name, 'user': user, 'cpu_percent': 0.0, 'memory_percent': rnd.random() * 2,
+            'cmdline': [f'/usr/bin/{name}', '--config', f'/etc/{name}/{name}.conf', f'--worker-id={rnd.randint(1, 99)}'],
+            'status': 'sleeping', 'is_root': user == 'root',
+        }
+
+    running = [spawn() for _ in range(320)]
+    uploads = []
+    for minute in range(minutes):
+        for process in rnd.sample(running, 3):
+            running.remove(process)
+        running += [spawn() for _ in range(3)]
+        running = [dict(process) for process in running]
+        for process in running:
+            if process['pid'] not in busy:
+                continue
+            if rnd.random() < 0.5:
+                process['cpu_percent'] = round(rnd.random() * 30, 1)
+            if rnd.random() < 0.6:
+                process['memory_percent'] *= 1 + (rnd.random() - 0.5) / 50
+            if rnd.random() < 0.1:
+                process['status'] = rnd.choice(['running', 'sleeping', 'idle'])
+
+        all_processes = sorted(running, key=lambda process: process['pid'])
+        uploads.append((START + timedelta(minutes=minute), {
+            'total_processes': len(all_processes),
+            'root_processes': sum(process['is_root'] for process in all_processes),
+            'top_cpu_processes': sorted(all_processes, key=lambda process: -process['cpu_percent'])[:10],
+            'top_memory_processes': sorted(all_processes, key=lambda process: -process['memory_percent'])[:10],
+            'load_average': [0.5, 0.4, 0.3],
+            'all_processes': all_processes,
+        }))
+    return uploads
+
+
+class AgentTestCase(TestCase):
+    """An approved agent 'pop-os' and an API client, with the shared caches cleared"""
+
+    def setUp(self):
+        cache.clear()
+        # Interned process strings are rolled back with each test
+        processes._string_ids.clear()
+        processes._string_values.clear()
+        self.agent = MonitoringAgent.objects.create(
+            hostname='pop-os', username='u', encryption_password='pw', is_approved=True
+        )
+        self.client = APIClient()
+
+    def upload_logs(self, entries):
+        return self.client.post('/api/logs/upload_logs/', {
+            'hostname': 'pop-os', 'username': 'u', 'logs': entries,
+        }, format='json')
+
+
+class ProcessStringCacheTests(TestCase):
+    def setUp(self):
+        processes._string_ids.clear()
+        processes._string_values.clear()
+        self.addCleanup(processes._string_ids.clear)
+        self.addCleanup(processes._string_values.clear)
+
+    @override_settings(PROCESS_STRING_CACHE_SIZE=3)
+    def test_batches_larger_than_the_cache_round_trip(self):
+        names = ['a', 'b', 'c', 'd', 'e']
+        ids = processes.intern_strings({name: name for name in names})
+        self.assertEqual(set(ids), set(names))
+        self.assertEqual(ProcessString.objects.count(), len(names))
+
+        payload = {'all_processes': [
+            {'pid': pid, 'name': name, 'user': 'root', 'cmdline': [name, '-v'],
+             'cpu_percent': 0.0, 'memory_percent': 1.0, 'status': 'running', 'is_root': True}
+            for pid, name in enumerate(names)
+        ]}
+        [(compact, _)] = processes.compact_payloads([(payload, None)])
+        self.assertTrue(all(isinstance(entry, list) for entry in compact['all_processes']))
+
+        processes._string_ids.clear()
+        processes._string_values.clear()
+        self.assertEqual(processes.expand_processes(compact), payload)
+        self.assertLessEqual(len(processes._string_values), 3)
+
+
+class AgentIdentityCacheTests(AgentTestCase):
+    def test_cached_entry_holds_no_credential_material(self):
+        agent_identity_cache.get('pop-os')
+        entry = cache.get(agent_identity_cache._cache_key('pop-os'))
+        self.assertNotIn('encryption_salt', entry)
+        self.assertNotIn('encryption_password', entry)
+        unkeyed = hashlib.sha256(f"pw:{self.agent.encryption_salt}".encode()).hexdigest()
+        self.assertNotEqual(entry['key_reference'], unkeyed)
+
+    def test_cached_agent_loads_credentials_on_access(self):
+        agent_identity_cache.get('pop-os')
+        cached = agent_identity_cache.get('pop-os')
+        self.assertEqual(cached.get_key_reference(), self.agent.get_key_reference())
+        self.assertEqual(cached.encryption_salt, self.agent.encryption_salt)
+        self.assertEqual(cached.get_encryption_password(), 'pw')
+
+
+class DecryptLatencyBenchmarkTests(AgentTestCase):
+    """Latency of a one-entry encrypted upload, deriving the agent's key each time or not"""
+
+    def median_upload_time(self, runs=7, derive_key=False):
+        """Median upload time, and how many PBKDF2 derivations the uploads ran"""
+        manager = EncryptionManager('pw', self.agent.encryption_salt)
+        timings = []
+        with mock.patch('monitoring.utils.PBKDF2HMAC', wraps=PBKDF2HMAC) as kdf:
+            for i in range(runs):
+                payload = {
+                    'hostname': 'pop-os', 'username': 'u',
+                    'encrypted_data': manager.encrypt_data(json.dumps([log_entry(i)])),
+                }
+                if derive_key:
+                    derived_key_cache.invalidate(self.agent.id)
+                started = time.perf_counter()
+                response = self.client.post('/api/logs/upload_logs/', payload, format='json')
+                timings.append(time.perf_counter() - started)
+                self.assertEqual(response.status_code, 200)
+        return sorted(timings)[runs // 2], kdf.call_count
+
+    def test_cached_key_skips_the_derivation(self):
+        self.median_upload_time(runs=1)
+        derived, derivations = self.median_upload_time(derive_key=True)
+        cached, cached_derivations = self.median_upload_time()
+        report = f'key derived: {derived * 1000:.1f} ms, cached: {cached * 1000:.1f} ms'
+        self.assertEqual(derivations, 7, report)
+        self.assertEqual(cached_derivations, 0, report)
+
+
+class UploadLogsTests(AgentTestCase):
+    def test_batch_is_written_with_a_fixed_number_of_queries(self):
+        self.upload_logs([log_entry(0)])
+        cache.clear()
+        # Lookups, the agent row locks, one bulk insert per table, the rollup
+        # upsert, the sweep for samples the metrics path never reported (and
+        # their threshold checks) and the hourly log counters; SQLite's
+        # bound-parameter limit splits the upsert in two
+        with self.assertNumQueries(26 if connection.vendor == 'sqlite' else 25):
+            response = self.upload_logs([log_entry(i) for i in range(1, 51)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['logs_processed'], 50)
+        self.assertEqual(response.data['metrics_saved'], 50)
+        self.assertEqual(SystemLog.objects.count(), 51)
+
+    def test_session_host_that_is_not_an_address_keeps_the_batch(self):
+        entries = [log_entry(i) for i in range(5)]
+        entries[2]['users_logged_in']['users'][1].update(name='remote', host='workstation.lan')
+        entries[3]['users_logged_in']['users'][0]['terminal'] = 'x' * 500
+        response = self.upload_logs(entries)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['logs_processed'], 5)
+        self.assertEqual(SystemLog.objects.count(), 5)
+        self.assertEqual(HostMetric.objects.count(), 5)
+        self.assertEqual(UserSession.objects.get(username='remote').host, '0.0.0.0')
+        self.assertEqual(UserSession.objects.count(), 3)
+
+class StripNormalizedTests(AgentTestCase):
+    @override_settings(SYSTEMLOG_STRIP_NORMALIZED=True)
+    def test_stripped_entries_read_back_exactly(self):
+        entries = [log_entry(i) for i in range(3)]
+        self.assertEqual(self.upload_logs(entries).status_code, 200)
+        logs = list(SystemLog.objects.order_by('timestamp'))
+        refs = logs[0].data[SystemLog.NORMALIZED_KEY]
+        self.assertEqual(refs['columns'], 1)
+        self.assertEqual(sorted(refs['sessions']), sorted(UserSession.objects.values_list('id', flat=True)))
+        self.assertNotIn('users', logs[0].data['users_logged_in'])
+        self.assertEqual(rehydrate(logs), entries)
+
+
+class UserSessionBenchmarkTests(AgentTestCase):
+    """500 entries x 10 logged-in users in one batch, the shape that used to cost a query per user per entry"""
+
+    def timed_upload(self, entries):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.upload_logs(entries)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        return len(queries), elapsed
+
+    def test_sessions_cost_a_fixed_number_of_queries(self):
+        entries = [log_entry(i, users=10) for i in range(500)]
+        queries, elapsed = self.timed_upload(entries)
+        repeat_queries, repeat_elapsed = self.timed_upload(entries)
+
+        self.assertEqual(UserSession.objects.count(), 10)
+        # Per-user lookups would cost over 5000 queries here
+        report = f'first upload: {queries} queries, {elapsed:.2f} s; repeat: {repeat_queries} queries, {repeat_elapsed:.2f} s'
+        self.assertLess(queries, 100, report)
+        self.assertLess(repeat_queries, 100, report)
+
+
+class ProcessChurnBenchmarkTests(AgentTestCase):
+    """Four hours of one-minute process uploads: stored history size and exact reconstruction"""
+
+    def test_history_is_delta_encoded_and_reconstructs_exactly(self):
+        uploads = churning_process_uploads(4 * 60)
+        for timestamp, upload in uploads:
+            save_process_snapshots(self.agent, [(timestamp, upload)])
+
+        rows = list(ProcessSnapshot.objects.filter(agent=self.agent).order_by('timestamp'))
+        by_timestamp = dict(uploads)
+        every_upload = sum(len(json.dumps(upload)) for timestamp, upload in uploads)
+        full_history = sum(len(json.dumps(by_timestamp[row.timestamp])) for row in rows)
+        stored = sum(len(json.dumps(row.processes)) + len(json.dumps(row.delta)) for row in rows)
+        for row in rows:
+            self.assertEqual(process_snapshot_at(self.agent.id, row.timestamp)[1], by_timestamp[row.timestamp])
+
+        report = (
+            f'{len(rows)} history rows, {sum(row.is_keyframe for row in rows)} keyframes; '
+            f'every upload in full: {every_upload} B, history in full: {full_history} B, delta-encoded: {stored} B '
+            f'({full_history / stored:.1f}x and {every_upload / stored:.0f}x smaller)'
+        )
+        self.assertGreater(full_history / stored, 5, report)
+
+    def test_get_processes_at(self):
+        user = get_user_model().objects.create_user(
+            email='admin@example.com', username='admin', password='pw', is_staff=True
+        )
+        self.client.force_authenticate(user=user)
+        uploads = churning_process_uploads(30)
+        for timestamp, upload in uploads:
+            save_process_snapshots(self.agent, [(timestamp, upload)])
+
+        timestamp, upload = uploads[10]
+        response = self.client.get('/api/processes/get_processes/', {'hostname': 'pop-os', 'at': timestamp.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['timestamp'], timestamp)
+        response = self.client.get('/api/processes/get_processes/', {'hostname': 'pop-os', 'at': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+def process_upload(*processes):
+    return {
+        'total_processes': len(processes), 'root_processes': 0,
+        'top_cpu_processes': [], 'top_memory_processes': [], 'load_average': [0.5, 0.4, 0.3],
+        'all_processes': [
+            {'pid': pid, 'name': 'python3', 'user': 'alice', 'cmdline': ['python3'], 'cpu_percent': cpu,
+             'memory_percent': 1.0, 'status': 'running', 'is_root': False}
+            for pid, cpu in processes
+        ],
+    }
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locks and a connection per thread')
+class ConcurrentProcessUploadTests(TransactionTestCase):
+    @override_settings(PROCESS_HISTORY_INTERVAL=0)
+    def test_overlapping_uploads_replay_exactly(self):
+        agent = MonitoringAgent.objects.create(hostname='pop-os', username='u')
+        uploads = [
+            (START, process_upload((1, 0.0), (2, 0.0), (3, 0.0))),
+            # pid 2 exits, then shows up again; diffed against the first upload
+            # instead of this one, the last would change a pid the replay removed
+            (START + timedelta(minutes=1), process_upload((1, 0.0), (3, 0.0))),
+            (START + timedelta(minutes=2), process_upload((1, 0.0), (2, 5.0), (3, 0.0))),
+        ]
+        save_process_snapshots(agent, uploads[:1])
+
+        encode_history = processes.encode_history
+        encoded, release = threading.Event(), threading.Event()
+
+        def encode_then_wait(*args):
+            rows = encode_history(*args)
+            if not encoded.is_set():
+                encoded.set()
+                release.wait(10)
+            return rows
+
+        def upload(snapshot):
+            try:
+                save_process_snapshots(agent, [snapshot])
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(processes, 'encode_history', encode_then_wait):
+            first = threading.Thread(target=upload, args=(uploads[1],))
+            first.start()
+            encoded.wait(10)
+            second = threading.Thread(target=upload, args=(uploads[2],))
+            second.start()
+            # Let the second upload get as far as it can while the first is still open
+            deadline = time.monotonic() + 5
+            with connection.cursor() as cursor:
+                while second.is_alive() and time.monotonic() < deadline:
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+                    )
+                    if cursor.fetchone()[0]:
+                        break
+                    time.sleep(0.01)
+            release.set()
+            first.join()
+            second.join()
+
+        self.assertEqual(ProcessSnapshot.objects.filter(agent=agent).count(), 3)
+        for timestamp, upload_data in uploads:
+            self.assertEqual(process_snapshot_at(agent.id, timestamp), (timestamp, upload_data))
+
+
+def rollup_values():
+    """Every rollup row, keyed by (resolution, bucket), rounded for comparison"""
+    return {
+        (rollup.resolution, rollup.bucket): (
+            rollup.sample_count, rollup.last_timestamp,
+            *(round(getattr(rollup, column), 6) for column in UPDATE_FIELDS[2:]),
+        )
+        for rollup in HostMetricRollup.objects.all()
+    }
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.agent = MonitoringAgent.objects.create(hostname='pop-os', username='u')
+
+    def test_merged_batches_match_a_rebuild(self):
+        metrics = [
+            HostMetric(agent=self.agent, timestamp=START + timedelta(seconds=20 * i),
+                       cpu_usage=(i * 37) % 100, memory_usage=30 + i % 7, disk_usage=50.0,
+                       network_sent=1000 * i, network_received=5000 * i)
+            for i in range(30)
+        ]
+        HostMetric.objects.bulk_create(metrics)
+        # Out of order and split over uploads, the way agents deliver them
+        update_rollups(metrics[10:20])
+        update_rollups(metrics[:10])
+        update_rollups(metrics[20:])
+        merged = rollup_values()
+
+        rebuild_rollups()
+        self.assertEqual(merged, rollup_values())
+        self.assertEqual(HostMetricRollup.objects.get(resolution='1h').sample_count, 30)
+
+
+class HostMetricMergeTests(AgentTestCase):
+    def sample(self, seconds, cpu=10.0):
+        return HostMetric(agent=self.agent, timestamp=START + timedelta(seconds=seconds), cpu_usage=cpu,
+                          memory_usage=30.0, disk_usage=55.0, network_sent=1000, network_received=5000)
+
+    def store(self, source, *samples):
+        """Timestamps, in seconds after START, of the stored rows and of the rows due for checks"""
+        rows, evaluate = store_samples(self.agent, list(samples), source)
+        return (
+            [(row.timestamp - START).seconds for row in rows],
+            sorted((row.timestamp - START).seconds for row in evaluate),
+        )
+
+    def test_samples_on_a_short_interval_each_get_a_row(self):
+        self.assertEqual(self.store('metrics', *(self.sample(10 * i) for i in range(6))),
+                         ([0, 10, 20, 30, 40, 50], [0, 10, 20, 30, 40, 50]))
+        self.assertEqual(HostMetric.objects.count(), 6)
+        self.assertEqual(HostMetricRollup.objects.get(resolution='1m').sample_count, 6)
+
+    def test_samples_pair_with_the_nearest_unmerged_sample(self):
+        self.store('metrics', self.sample(0), self.sample(10), self.sample(20))
+        # 13 is nearest to 10; 14 then takes 20, the nearest one still unmerged
+        self.assertEqual(self.store('logs', self.sample(13), self.sample(14), self.sample(60)),
+                         ([10, 20, 60], []))
+        self.assertEqual(
+            list(HostMetric.objects.order_by('timestamp').values_list('timestamp', 'merged_timestamp')),
+            [(START, None),
+             (START + timedelta(seconds=10), START + timedelta(seconds=13)),
+             (START + timedelta(seconds=20), START + timedelta(seconds=14)),
+             (START + timedelta(seconds=60), None)]
+        )
+
+    def test_repeated_samples_are_stored_and_checked_once(self):
+        self.store('logs', self.sample(3))
+        self.assertEqual(self.store('metrics', self.sample(0, cpu=40.0)), ([3], [3]))
+        self.assertEqual(self.store('metrics', self.sample(0, cpu=40.0)), ([3], []))
+        self.assertEqual(self.store('logs', self.sample(3)), ([3], []))
+        self.assertEqual(HostMetric.objects.get().cpu_usage, 40.0)
+
+    def test_samples_the_authoritative_path_misses_are_checked_once(self):
+        # The metrics upload for 0 failed; the one for 60 shows it won't come
+        self.assertEqual(self.store('logs', self.sample(0)), ([0], []))
+        self.assertEqual(self.store('metrics', self.sample(60)), ([60], [0, 60]))
+        self.assertEqual(self.store('metrics', self.sample(120)), ([120], [120]))
+        # An agent whose metrics path is down altogether
+        self.assertEqual(self.store('logs', self.sample(300)), ([300], []))
+        self.assertEqual(self.store('logs', self.sample(960)), ([960], [300]))
+        self.assertEqual(HostMetric.objects.filter(evaluated=False).count(), 1)
+
+    def test_overwritten_rows_match_a_rebuild(self):
+        cpu = [5.0, 90.0, 40.0, 60.0, 20.0, 70.0]
+        self.store('logs', *(self.sample(20 * i + 3, cpu=value) for i, value in enumerate(cpu)))
+        # The metrics values replace the extremes and the last sample of each bucket
+        self.store('metrics', *(self.sample(20 * i, cpu=value + 10) for i, value in enumerate(cpu)))
+        merged = rollup_values()
+        self.assertEqual(HostMetricRollup.objects.get(resolution='5m').cpu_usage_min, 15.0)
+
+        rebuild_rollups()
+        self.assertEqual(merged, rollup_values())
+
+
+class FernetStreamTests(TestCase):
+    key = Fernet.generate_key()
+
+    def stream(self, token, chunk_size=7):
+        return FernetStream(self.key, lambda: _iter_slices(base64.urlsafe_b64decode(token), chunk_size))
+
+    def test_matches_fernet_decrypt(self):
+        fernet = Fernet(self.key)
+        for size in [0, 1, 15, 16, 17, 1000, 200_000]:
+            plaintext = bytes(range(256)) * (size // 256) + bytes(size % 256)
+            token = fernet.encrypt(plaintext)
+            for chunk_size in [1, 7, 64 * 1024]:
+                stream = self.stream(token, chunk_size)
+                stream.verify()
+                self.assertEqual(b''.join(stream.iter_plaintext()), fernet.decrypt(token))
+
+    def test_rejects_tampered_truncated_and_foreign_tokens(self):
+        raw = base64.urlsafe_b64decode(Fernet(self.key).encrypt(b'{"a": 1}' * 100))
+        tampered = raw[:40] + bytes([raw[40] ^ 1]) + raw[41:]
+        foreign = base64.urlsafe_b64decode(Fernet(Fernet.generate_key()).encrypt(b'{"a": 1}'))
+        for token in [tampered, raw[:-1], raw[:20], foreign, b'']:
+            stream = FernetStream(self.key, lambda: _iter_slices(token))
+            with self.assertRaises(ValueError):
+                stream.verify()
+
+    def test_plaintext_needs_verification(self):
+        with self.assertRaises(ValueError):
+            list(self.stream(Fernet(self.key).encrypt(b'[]')).iter_plaintext())
+
+
+class StreamedEntryTests(TestCase):
+    def test_json_batches_must_be_complete(self):
+        self.assertEqual(list(iter_json_entries(['[{"a": 1}', ', {"b"', ': 2}]  '])), [{'a': 1}, {'b': 2}])
+        for text in ['[{"a": 1}', '[{"a": 1}, {"b"', '[{"a": 1}] {"b": 2}', '[] x']:
+            with self.assertRaises(ValueError):
+                list(iter_json_entries([text]))
+
+    @skipUnless(MSGPACK_AVAILABLE, 'msgpack is not installed')
+    def test_msgpack_batches_must_be_complete(self):
+        packed = msgpack.packb([{'a': 1}, {'b': 2}])
+        self.assertEqual(list(iter_msgpack_entries(_iter_slices(packed, 3))), [{'a': 1}, {'b': 2}])
+        self.assertEqual(list(iter_msgpack_entries([msgpack.packb({'a': 1})])), [{'a': 1}])
+        for data in [packed[:-1], packed[:-6], packed + msgpack.packb({'c': 3}), msgpack.packb({'a': 1})[:-1]]:
+            with self.assertRaises(ValueError):
+                list(iter_msgpack_entries(_iter_slices(data, 3)))
+
+    def test_inflate_rejects_corrupt_and_truncated_data(self):
+        compressed = zlib.compress(b'x' * 100_000)
+        self.assertEqual(b''.join(_iter_inflate(_iter_slices(compressed, 100))), b'x' * 100_000)
+        for data in [b'not zlib', compressed[:-10]]:
+            with self.assertRaises(ValueError):
+                b''.join(_iter_inflate([data]))
+
+
+class EncryptedUploadTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fernet = Fernet(EncryptionManager.for_agent(self.agent).key)
+
+    def upload_envelope(self, plaintext):
+        return self.client.post('/api/logs/upload_logs/', {
+            'hostname': 'pop-os', 'username': 'u', 'codec': 'msgpack+zlib',
+            'token': base64.b64encode(base64.urlsafe_b64decode(self.fernet.encrypt(plaintext))).decode(),
+        }, format='json')
+
+    @skipUnless(MSGPACK_AVAILABLE, 'msgpack is not installed')
+    def test_envelope_upload(self):
+        response = self.upload_envelope(zlib.compress(msgpack.packb([log_entry(i) for i in range(3)])))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['logs_processed'], 3)
+
+    @skipUnless(MSGPACK_AVAILABLE, 'msgpack is not installed')
+    def test_malformed_envelopes_are_rejected_and_store_nothing(self):
+        packed = msgpack.packb([log_entry(i) for i in range(3)])
+        for plaintext in [b'not zlib', zlib.compress(packed)[:-4], zlib.compress(packed[:-20])]:
+            response = self.upload_envelope(plaintext)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(SystemLog.objects.count(), 0)
+
+    def test_failed_batch_only_forgets_its_own_cooldowns(self):
+        now = timezone.now()
+        # Picks up the current generation, which clears the worker's fingerprints
+        alert_cooldown.is_cooling_down('other-agent', now)
+        alert_cooldown.remember('other-agent', now)
+        with self.assertRaises(RuntimeError):
+            with alert_cooldown.forget_on_error():
+                alert_cooldown.remember('this-batch', now)
+                raise RuntimeError
+        self.assertTrue(alert_cooldown.is_cooling_down('other-agent', now))
+        self.assertFalse(alert_cooldown.is_cooling_down('this-batch', now))
+
+
+class StreamingDecodeMemoryTests(TestCase):
+    """Peak memory of decoding an encrypted batch doesn't depend on its size"""
+
+    manager = EncryptionManager('pw', 'salt')
+
+    def peak_memory(self, decode):
+        tracemalloc.start()
+        try:
+            for entry in decode():
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def json_peak(self, count):
+        encrypted = self.manager.encrypt_data(json.dumps([log_entry(i) for i in range(count)]))
+        return self.peak_memory(lambda: self.manager.iter_decrypted_entries(encrypted))
+
+    def envelope_peak(self, count):
+        token = base64.urlsafe_b64decode(self.manager.fernet.encrypt(
+            zlib.compress(msgpack.packb([log_entry(i) for i in range(count)]))
+        ))
+        return self.peak_memory(lambda: self.manager.iter_envelope_entries(token, 'msgpack+zlib'))
+
+    def test_json_batches(self):
+        small, large = self.json_peak(1000), self.json_peak(10000)
+        self.assertLess(large, small * 1.5, f'1k entries: {small} B, 10k entries: {large} B')
+
+    @skipUnless(MSGPACK_AVAILABLE, 'msgpack is not installed')
+    def test_envelope_batches(self):
+        small, large = self.envelope_peak(1000), self.envelope_peak(10000)
+        self.assertLess(large, small * 1.5, f'1k entries: {small} B, 10k entries: {large} B')
+
+
+@skipUnless(MSGPACK_AVAILABLE and SAMPLE_FILE.exists(), 'needs msgpack and SampleDataFromAgent.json')
+class EnvelopeDecodeBenchmarkTests(TestCase):
+    """Size of the JSON upload against the envelope; decode times (parse and decrypt) are reported only"""
+
+    manager = EncryptionManager('pw', 'salt')
+
+    def json_body(self, entries):
+        return json.dumps({
+            'hostname': 'pop-os', 'username': 'u',
+            'encrypted_data': self.manager.encrypt_data(json.dumps(entries)),
+        }).encode()
+
+    def envelope_body(self, entries):
+        return msgpack.packb({
+            'v': 1, 'hostname': 'pop-os', 'username': 'u', 'codec': 'msgpack+zlib',
+            'token': base64.urlsafe_b64decode(self.manager.fernet.encrypt(zlib.compress(msgpack.packb(entries)))),
+        })
+
+    def decode_json(self, body):
+        data = JSONParser().parse(io.BytesIO(body))
+        return list(self.manager.iter_decrypted_entries(data['encrypted_data']))
+
+    def decode_envelope(self, body):
+        envelope = EnvelopeParser().parse(io.BytesIO(body))
+        return list(self.manager.iter_envelope_entries(envelope['token'], envelope['codec']))
+
+    def test_envelope_is_smaller_and_decodes_the_same(self):
+        for count in (1, 50):
+            entries = sample_entries(count)
+            json_body, envelope_body = self.json_body(entries), self.envelope_body(entries)
+            self.assertEqual(self.decode_json(json_body), entries)
+            self.assertEqual(self.decode_envelope(envelope_body), entries)
+
+            json_time = min(timeit.repeat(lambda: self.decode_json(json_body), number=10, repeat=3)) / 10
+            envelope_time = min(timeit.repeat(lambda: self.decode_envelope(envelope_body), number=10, repeat=3)) / 10
+            report = (
+                f'{count} entries: JSON {len(json_body)} B in {json_time * 1000:.2f} ms, '
+                f'envelope {len(envelope_body)} B in {envelope_time * 1000:.2f} ms'
+            )
+            self.assertLess(len(envelope_body) * 2, len(json_body), report)
+
+
+class ThresholdCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_version_is_bumped_once_the_change_is_committed(self):
+        self.assertEqual(len(threshold_cache.get('cpu')), 0)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ResourceThreshold.objects.create(
+                name='High CPU', resource_type='cpu', threshold_value=90
+            )
+            self.assertIsNone(cache.get(ThresholdCache.VERSION_KEY))
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(cache.get(ThresholdCache.VERSION_KEY), 1)
+        self.assertEqual(len(threshold_cache.get('cpu')), 1)
+
+    def test_bumps_add_up(self):
+        for expected in range(1, 4):
+            self.assertEqual(bump_counter('monitoring:test_counter'), expected)
+
+
+class AlertCooldownTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        alert_cooldown.reset()
+
+    def raise_alert(self, title):
+        return create_deduplicated_alert(self.agent, title, 'description', 'high', alert_type='resource')
+
+    def test_resolving_an_alert_only_forgets_its_own_rule(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cpu = self.raise_alert('High CPU')
+            self.raise_alert('High Memory')
+        self.assertIsNone(self.raise_alert('High CPU'))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            cpu.resolved = True
+            cpu.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNotNone(self.raise_alert('High CPU'))
+        self.assertIsNone(self.raise_alert('High Memory'))
+
+    def test_saving_a_resolved_alert_again_forgets_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = self.raise_alert('High CPU')
+            alert.resolved = True
+            alert.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNotNone(self.raise_alert('High CPU'))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Alert.objects.get(id=alert.id).add_note('checked')
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(self.raise_alert('High CPU'))
+
+    def test_other_workers_see_the_forgotten_fingerprint(self):
+        other_worker = AlertCooldownCache()
+        now = timezone.now()
+        other_worker.is_cooling_down('fingerprint', now)
+        other_worker.remember('fingerprint', now)
+        alert_cooldown.forget(['fingerprint'])
+        self.assertFalse(other_worker.is_cooling_down('fingerprint', timezone.now()))
+
+
+class PurgeTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        alert_cooldown.reset()
+
+    def test_alerts_are_deleted_and_forgotten_a_chunk_at_a_time(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(20):
+                create_deduplicated_alert(self.agent, f'Rule {n}', 'description', 'high', alert_type='resource')
+        Alert.objects.update(resolved=True)
+        self.assertIsNone(create_deduplicated_alert(self.agent, 'Rule 0', 'description', 'high', alert_type='resource'))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            task = purge(Alert, {'resolved': True}, reason='test', chunk_size=5, pause=0)
+        self.assertEqual(task.deleted, 20)
+        self.assertEqual(len(callbacks), 4)
+        self.assertFalse(Alert.objects.exists())
+        self.assertFalse(PurgeTask.objects.exists())
+        self.assertIsNotNone(create_deduplicated_alert(self.agent, 'Rule 0', 'description', 'high', alert_type='resource'))
+
+    def delete_agent(self):
+        user = get_user_model().objects.create_user(email='admin@example.com', username='admin', password='pw')
+        self.client.force_authenticate(user=user)
+        self.upload_logs([log_entry(i) for i in range(3)])
+        return self.client.delete(f'/api/agents/{self.agent.id}/')
+
+    def test_deleting_an_agent_purges_it_right_away(self):
+        response = self.delete_agent()
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(MonitoringAgent.objects.exists())
+        self.assertFalse(SystemLog.objects.exists())
+        self.assertFalse(PurgeTask.objects.exists())
+
+    @override_settings(AGENT_PURGE_IN_BACKGROUND=True)
+    def test_deleting_an_agent_only_queues_its_purge_in_background_mode(self):
+        response = self.delete_agent()
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(MonitoringAgent.objects.get(id=self.agent.id).is_active)
+        self.assertEqual(SystemLog.objects.count(), 3)
+        self.assertEqual(PurgeTask.objects.count(), len(response.data['purge_task_ids']))
+
+        run_pending_purges()
+        self.assertFalse(MonitoringAgent.objects.exists())
+        self.assertFalse(SystemLog.objects.exists())
+        self.assertFalse(PurgeTask.objects.exists())
+
+    @override_settings(AGENT_PURGE_IN_BACKGROUND=True)
+    def test_a_host_awaiting_its_purge_can_register_again(self):
+        self.assertEqual(self.delete_agent().status_code, 202)
+        registration = {
+            'hostname': 'pop-os', 'username': 'user', 'ip_address': '10.0.0.2', 'encryption_password': 'secret'
+        }
+        response = self.client.post('/api/registrations/', registration, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse(MonitoringAgent.objects.exists())
+        self.assertFalse(SystemLog.objects.exists())
+        self.assertFalse(PurgeTask.objects.exists())
+
+        response = self.client.post(f'/api/registrations/{response.data["request_id"]}/approve/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(MonitoringAgent.objects.get().hostname, 'pop-os')
+
+    @override_settings(AGENT_PURGE_IN_BACKGROUND=True)
+    def test_approving_finishes_a_purge_queued_after_the_request(self):
+        registration = AgentRegistrationRequest.objects.create(
+            hostname='pop-os', username='user', ip_address='10.0.0.2', encryption_password='secret'
+        )
+        self.assertEqual(self.delete_agent().status_code, 202)
+        response = self.client.post(f'/api/registrations/{registration.id}/approve/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse(SystemLog.objects.exists())
+        self.assertNotEqual(MonitoringAgent.objects.get(hostname='pop-os').id, self.agent.id)
+
+    def test_an_active_agent_keeps_its_hostname(self):
+        response = self.client.post('/api/registrations/', {
+            'hostname': 'pop-os', 'username': 'user', 'ip_address': '10.0.0.2', 'encryption_password': 'secret'
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(MonitoringAgent.objects.filter(id=self.agent.id).exists())
+
+
+@skipUnless(ZSTD_AVAILABLE and SAMPLE_FILE.exists(), 'needs zstandard and SampleDataFromAgent.json')
+@override_settings(SYSTEMLOG_COMPRESSION=True)
+class SystemLogCompressionBenchmarkTests(AgentTestCase):
+    """Stored size of compressed entries on sample-shaped data; the decode rate is reported only"""
+
+    def test_ratio_and_round_trip(self):
+        entries = sample_entries(900)
+        for start in range(0, 900, 100):
+            if start == 300:
+                dictionary, stats = train_dictionary(samples=300)
+            self.assertEqual(self.upload_logs(entries[start:start + 100]).status_code, 200)
+
+        rows = list(SystemLog.objects.filter(payload_dictionary=dictionary).order_by('id'))
+        raw = sum(len(encode_entry(entry)) for entry in entries[300:])
+        stored = sum(len(row.payload) for row in rows)
+        started = time.perf_counter()
+        decompressors = {}
+        decoded = [stored_data(row, decompressors) for row in rows]
+        rate = len(rows) / (time.perf_counter() - started)
+
+        self.assertEqual(decoded, entries[300:])
+        report = (
+            f'{raw / len(rows):.0f} B of JSON per entry; without a dictionary {stats["raw"] / stats["zstd"]:.1f}x, '
+            f'with one {raw / stored:.1f}x ({stored / len(rows):.0f} B per row); {rate:.0f} rows/s decoded'
+        )
+        self.assertGreater(raw / stored, 10, report)
+
+    def test_contains_queries_are_refused(self):
+        user = get_user_model().objects.create_user(
+            email='admin@example.com', username='admin', password='pw', is_staff=True
+        )
+        self.client.force_authenticate(user=user)
+        response = self.client.get('/api/logs/query/', {'contains': '{"hostname": "pop-os"}'})
+        self.assertEqual(response.status_code, 400)
+
+
+class EnvelopeParserTests(AgentTestCase):
+    def post_envelope(self, envelope):
+        return self.client.post('/api/logs/upload_logs/', msgpack.packb(envelope), content_type='application/octet-stream')
+
+    @skipUnless(MSGPACK_AVAILABLE, 'msgpack is not installed')
+    def test_unsupported_envelopes_answer_415(self):
+        envelope = {'v': 1, 'hostname': 'pop-os', 'username': 'u', 'codec': 'msgpack+zlib', 'token': b'x'}
+        with mock.patch('monitoring.parsers.MSGPACK_AVAILABLE', False):
+            self.assertEqual(self.post_envelope(envelope).status_code, 415)
+        self.assertEqual(self.post_envelope(dict(envelope, v=99)).status_code, 415)
+        self.assertEqual(self.post_envelope(dict(envelope, token='x')).status_code, 400)
+
+
+class RequestDecompressionTests(AgentTestCase):
+    def post_logs(self, body, encoding):
+        return self.client.generic('POST', '/api/logs/upload_logs/', body, content_type='application/json',
+                                   HTTP_CONTENT_ENCODING=encoding)
+
+    def batch(self, count):
+        return json.dumps({'hostname': 'pop-os', 'username': 'u', 'logs': sample_entries(count)}).encode()
+
+    def test_gzip_upload_round_trip(self):
+        body = self.batch(50)
+        compressed = gzip.compress(body)
+        response = self.post_logs(compressed, 'gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['logs_processed'], 50)
+        self.assertEqual(SystemLog.objects.count(), 50)
+        self.assertGreater(len(body) / len(compressed), 10, f'50-entry batch: {len(body)} B, gzip: {len(compressed)} B')
+
+    @skipUnless(ZSTD_AVAILABLE, 'zstandard is not installed')
+    def test_zstd_upload_round_trip(self):
+        response = self.post_logs(zstandard.ZstdCompressor().compress(self.batch(5)), 'zstd')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(SystemLog.objects.count(), 5)
+
+    def test_unknown_encoding_answers_415(self):
+        self.assertEqual(self.post_logs(self.batch(1), 'br').status_code, 415)
+
+    @override_settings(MAX_DECOMPRESSED_REQUEST_SIZE=1024 * 1024)
+    def test_bodies_that_decompress_past_the_limit_answer_413(self):
+        bomb = b'[' + b' ' * (64 * 1024 * 1024) + b']'
+        compressed = gzip.compress(bomb)
+        self.assertLess(len(compressed), 100 * 1024)
+        self.assertEqual(self.post_logs(compressed, 'gzip').status_code, 413)
+        if ZSTD_AVAILABLE:
+            self.assertEqual(self.post_logs(zstandard.ZstdCompressor().compress(bomb), 'zstd').status_code, 413)
+            stream = zstandard.ZstdCompressor().compressobj()
+            self.assertEqual(self.post_logs(stream.compress(bomb) + stream.flush(), 'zstd').status_code, 413)
+
+    def test_truncated_or_padded_bodies_answer_400(self):
+        compressed = gzip.compress(self.batch(5))
+        for body in (compressed[:len(compressed) // 2], compressed + b'garbage', b'not gzip'):
+            self.assertEqual(self.post_logs(body, 'gzip').status_code, 400)
+        if ZSTD_AVAILABLE:
+            compressed = zstandard.ZstdCompressor().compress(self.batch(5))
+            for body in (compressed[:len(compressed) // 2], compressed + b'garbage'):
+                self.assertEqual(self.post_logs(body, 'zstd').status_code, 400)
+        self.assertEqual(SystemLog.objects.count(), 0)
+
+
+class IngestQueueTests(AgentTestCase):
+    def queue(self, count):
+        return [IngestJob.objects.create(agent=self.agent, kind='logs', payload={'logs': []}) for _ in range(count)]
+
+    @override_settings(INGEST_ASYNC=True)
+    def test_uploads_are_queued_then_processed(self):
+        response = self.upload_logs([log_entry(i) for i in range(3)])
+        self.assertEqual(response.status_code, 202)
+        response = self.client.post('/api/metrics/upload_metrics/', {
+            'hostname': 'pop-os', 'timestamp': START.isoformat(), 'cpu_usage': 10.0, 'memory_usage': 30.0,
+            'memory_total': 8000, 'memory_used': 2400, 'disk_usage': 55.0, 'disk_total': 1000, 'disk_used': 550,
+            'network_sent': 1000, 'network_received': 5000,
+        }, format='json')
+        self.assertEqual(response.status_code, 202)
+        response = self.client.post('/api/processes/upload_processes/', {
+            'hostname': 'pop-os', 'process_system_activity': process_upload((1, 0.0), (2, 3.0)),
+        }, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['job_id'], IngestJob.objects.latest('id').id)
+        self.assertEqual((SystemLog.objects.count(), HostMetric.objects.count()), (0, 0))
+
+        self.assertEqual(drain_queue(), 3)
+        self.assertFalse(IngestJob.objects.exists())
+        self.assertEqual(SystemLog.objects.count(), 3)
+        self.assertEqual(HostMetric.objects.get(timestamp=START).memory_total, 8000)
+        self.assertEqual(LatestProcessSnapshot.objects.get(agent=self.agent).processes['total_processes'], 2)
+
+    def test_claims_skip_jobs_that_are_taken_or_waiting(self):
+        jobs = self.queue(5)
+        IngestJob.objects.filter(id=jobs[1].id).update(status='processing')
+        IngestJob.objects.filter(id=jobs[2].id).update(not_before=timezone.now() + timedelta(minutes=1))
+        IngestJob.objects.filter(id=jobs[3].id).update(not_before=timezone.now() - timedelta(minutes=1))
+        claimed = claim_jobs(batch_size=2)
+        self.assertEqual([job.id for job in claimed], [jobs[0].id, jobs[3].id])
+        self.assertEqual([(job.status, job.attempts) for job in claimed], [('processing', 1)] * 2)
+        self.assertEqual([job.id for job in claim_jobs()], [jobs[4].id])
+        self.assertEqual(claim_jobs(), [])
+
+    def test_conditional_update_fallback(self):
+        jobs = self.queue(3)
+        filter_jobs = IngestJob.objects.filter
+
+        def filter_after_another_worker(*args, **kwargs):
+            if kwargs.get('id') == jobs[0].id:
+                # Another worker claims the first job between the lookup and the update
+                filter_jobs(id=jobs[0].id).update(status='processing')
+            return filter_jobs(*args, **kwargs)
+
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', False), \
+                mock.patch.object(IngestJob.objects, 'filter', filter_after_another_worker):
+            claimed = claim_jobs()
+        self.assertEqual([job.id for job in claimed], [jobs[1].id, jobs[2].id])
+        self.assertEqual(IngestJob.objects.get(id=jobs[0].id).attempts, 0)
+
+    @override_settings(INGEST_MAX_ATTEMPTS=3, INGEST_RETRY_DELAY=30)
+    def test_failed_jobs_back_off_then_give_up(self):
+        job, = self.queue(1)
+        with mock.patch('monitoring.ingest.process_job', side_effect=ValueError('poison')):
+            for attempt, delay in [(1, 30), (2, 60)]:
+                started = timezone.now()
+                self.assertEqual(drain_queue(), 1)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts, job.last_error), ('pending', attempt, 'poison'))
+                self.assertAlmostEqual((job.not_before - started).total_seconds(), delay, delta=5)
+                # Not retried until it is due
+                self.assertEqual(drain_queue(), 0)
+                IngestJob.objects.filter(id=job.id).update(not_before=timezone.now())
+
+            self.assertEqual(drain_queue(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.not_before), ('failed', 3, None))
+        self.assertEqual(drain_queue(), 0)
+
+    @override_settings(INGEST_JOB_TIMEOUT=300)
+    def test_stale_jobs_are_requeued(self):
+        stale, recent = self.queue(2)
+        IngestJob.objects.filter(id=stale.id).update(status='processing', started_at=timezone.now() - timedelta(seconds=301))
+        IngestJob.objects.filter(id=recent.id).update(status='processing', started_at=timezone.now())
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(IngestJob.objects.get(id=stale.id).status, 'pending')
+        self.assertEqual(IngestJob.objects.get(id=recent.id).status, 'processing')
+
+
+class KeysetPaginationTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_user(
+            email='admin@example.com', username='admin', password='pw', is_staff=True
+        )
+        self.client.force_authenticate(user=user)
+        base = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        # Three rows per timestamp, created out of order so ids don't follow time
+        self.logs = [
+            SystemLog.objects.create(agent=self.agent, timestamp=base + timedelta(minutes=i // 3), data=log_entry(i))
+            for i in random.Random(3).sample(range(9), 9)
+        ]
+        self.newest_first = [log.id for log in sorted(self.logs, key=lambda log: (log.timestamp, log.id), reverse=True)]
+
+    def walk(self, direction, link, params=None):
+        """Result ids of every page from link on, following the `direction` links, and the last response"""
+        pages = []
+        response = self.client.get(link, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            if not response.data[direction]:
+                return pages, response
+            response = self.client.get(response.data[direction])
+
+    def assert_pages_walk_both_ways(self):
+        pages, last = self.walk('next', '/api/logs/', {'page_size': 2, 'count': 'exact'})
+        self.assertEqual([pk for page in pages for pk in page], self.newest_first)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 2, 1])
+        self.assertEqual(last.data['count'], 9)
+
+        back, first = self.walk('previous', last.data['previous'])
+        self.assertEqual(back, pages[-2::-1])
+        self.assertIsNone(first.data['previous'])
+
+    def test_pages_over_equal_timestamps(self):
+        self.assert_pages_walk_both_ways()
+
+    def test_count_modes(self):
+        response = self.client.get('/api/logs/', {'count': 'exact'})
+        self.assertEqual((response.data['count'], response.data['count_is_estimate']), (9, False))
+        response = self.client.get('/api/logs/', {'count': 'none'})
+        self.assertEqual((response.data['count'], response.data['count_is_estimate']), (None, False))
+        response = self.client.get('/api/logs/')
+        if connection.vendor == 'postgresql':
+            self.assertTrue(response.data['count_is_estimate'])
+            self.assertIsInstance(response.data['count'], int)
+        else:
+            # No planner statistics to read: falls back to COUNT(*)
+            self.assertEqual((response.data['count'], response.data['count_is_estimate']), (9, False))
+
+    def test_invalid_cursor_answers_404(self):
+        for cursor in ('garbage', base64.urlsafe_b64encode(b'{"v": "yesterday", "p": 1}').decode()):
+            self.assertEqual(self.client.get('/api/logs/', {'cursor': cursor}).status_code, 404)
+
+    def test_pages_span_the_archive(self):
+        with tempfile.TemporaryDirectory() as archive_dir, override_settings(SYSTEMLOG_ARCHIVE_DIR=archive_dir):
+            # The two older timestamps go to the archive; the second page starts in the database
+            cutoff = min(log.timestamp for log in self.logs) + timedelta(minutes=2)
+            self.assertEqual(archive_logs(cutoff), 6)
+            self.assertEqual(SystemLog.objects.count(), 3)
+            self.assert_pages_walk_both_ways()
+
+
+class MetricSeriesTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            email='viewer@example.com', username='viewer', password='pw'
+        ))
+        # Samples on both sides of, and exactly on, minute boundaries
+        HostMetric.objects.bulk_create([
+            HostMetric(agent=self.agent, timestamp=START + timedelta(seconds=offset), cpu_usage=cpu,
+                       memory_usage=30.0, disk_usage=55.0, network_sent=1000, network_received=5000)
+            for offset, cpu in [(0, 10.0), (30, 20.0), (59.5, 30.0), (60, 40.0), (119.9, 50.0), (120, 60.0)]
+        ])
+
+    def series(self, **params):
+        return self.client.get('/api/metrics/series/', {
+            'agent_id': self.agent.id, 'start': START.isoformat(),
+            'end': (START + timedelta(minutes=5)).isoformat(), 'step': 60, **params,
+        })
+
+    def test_columnar_buckets(self):
+        response = self.series()
+        self.assertEqual(response.status_code, 200)
+        epoch = int(START.timestamp())
+        self.assertEqual(response.data['ts'], [epoch, epoch + 60, epoch + 120])
+        self.assertEqual(response.data['samples'], [3, 2, 1])
+        self.assertEqual(response.data['cpu'], [20.0, 45.0, 60.0])
+        self.assertEqual(response.data['mem'], [30.0] * 3)
+        self.assertEqual(
+            set(response.data),
+            {'agent_id', 'start', 'end', 'step', 'aggregation', 'ts', 'samples', 'cpu', 'mem', 'disk', 'net_sent', 'net_recv'}
+        )
+        self.assertEqual(self.series(step='5m').data['samples'], [6])
+        self.assertEqual(self.series(aggregation='max').data['cpu'], [30.0, 50.0, 60.0])
+
+    def test_p95(self):
+        # PERCENTILE_CONT on Postgres, computed per bucket in Python elsewhere
+        response = self.series(aggregation='p95')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['samples'], [3, 2, 1])
+        for value, expected in zip(response.data['cpu'], [29.0, 49.5, 60.0]):
+            self.assertAlmostEqual(value, expected)
+
+    @override_settings(METRIC_SERIES_MAX_POINTS=100)
+    def test_invalid_requests_answer_400(self):
+        self.assertEqual(self.series(step=1, end=(START + timedelta(hours=1)).isoformat()).status_code, 400)
+        self.assertEqual(self.series(step=36, end=(START + timedelta(hours=1)).isoformat()).status_code, 200)
+        for params in ({'step': 0}, {'step': 'often'}, {'aggregation': 'median'},
+                       {'end': START.isoformat()}, {'start': 'yesterday'}, {'agent_id': ''}):
+            self.assertEqual(self.series(**params).status_code, 400, params)
+
+
+class DashboardStatsTests(AgentTestCase):
+    def test_hourly_counts_add_up(self):
+        other = MonitoringAgent.objects.create(hostname='db-1', username='u')
+        logs = [SystemLog(agent=self.agent, timestamp=START + timedelta(minutes=20 * i)) for i in range(7)]
+        record_log_counts(logs)
+        record_log_counts(logs[:2] + [SystemLog(agent=other, timestamp=START)])
+        self.assertEqual(
+            set(SystemLogHourlyCount.objects.values_list('agent__hostname', 'hour', 'count')),
+            {('pop-os', START, 5), ('pop-os', START + timedelta(hours=1), 3),
+             ('pop-os', START + timedelta(hours=2), 1), ('db-1', START, 1)}
+        )
+
+    def test_stats_match_the_orm_counts(self):
+        now = START + timedelta(minutes=30)
+        MonitoringAgent.objects.create(hostname='db-1', username='u', is_approved=True, is_active=False)
+        MonitoringAgent.objects.create(hostname='db-2', username='u')
+        for registration_status in ['pending', 'pending', 'approved']:
+            AgentRegistrationRequest.objects.create(
+                hostname='new', username='u', ip_address='10.0.0.9', status=registration_status
+            )
+        for resolved in [False, False, True]:
+            Alert.objects.create(agent=self.agent, title='t', description='d', level='low', alert_type='system',
+                                 resolved=resolved)
+        logs = [
+            SystemLog.objects.create(agent=self.agent, timestamp=now - timedelta(hours=hours), data={})
+            for hours in [0.5, 1, 10, 23, 30, 50]
+        ]
+        record_log_counts(logs)
+
+        expected = {
+            'total_agents': MonitoringAgent.objects.count(),
+            'active_agents': MonitoringAgent.objects.filter(is_active=True, is_approved=True).count(),
+            'pending_registrations': AgentRegistrationRequest.objects.filter(status='pending').count(),
+            'recent_logs_count': SystemLog.objects.filter(timestamp__gte=now - timedelta(hours=24)).count(),
+            'alerts_count': Alert.objects.filter(resolved=False).count(),
+        }
+        self.assertEqual(expected, {'total_agents': 3, 'active_agents': 1, 'pending_registrations': 2,
+                                    'recent_logs_count': 4, 'alerts_count': 2})
+        with self.assertNumQueries(1):
+            self.assertEqual(compute_dashboard_stats(now), expected)
+
+    def test_endpoint_is_served_from_the_cache(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            email='viewer@example.com', username='viewer', password='pw'
+        ))
+        response = self.client.get('/api/agents/stats/')
+        self.assertEqual(response.data['total_agents'], 1)
+        MonitoringAgent.objects.create(hostname='db-1', username='u')
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_stats()['total_agents'], 1)
+        cache.clear()
+        self.assertEqual(self.client.get('/api/agents/stats/').data['total_agents'], 2)
+
+
+class PartitionTests(AgentTestCase):
+    def test_parse_bound(self):
+        self.assertEqual(
+            parse_bound("FOR VALUES FROM ('2026-10-01 00:00:00+00') TO ('2026-10-02 00:00:00+00')"),
+            (START, START + timedelta(days=1))
+        )
+        self.assertIsNone(parse_bound('DEFAULT'))
+
+    def test_partition_start(self):
+        # 2026-10-01 is a Thursday; 01:30 at UTC+3 is still the previous UTC day
+        moment = datetime(2026, 10, 1, 1, 30, tzinfo=dt_timezone(timedelta(hours=3)))
+        self.assertEqual(partition_start(moment, 'day'), START - timedelta(days=1))
+        self.assertEqual(partition_start(moment, 'week'), datetime(2026, 9, 28, tzinfo=dt_timezone.utc))
+
+    def test_plain_tables_fall_back_to_purging(self):
+        now = timezone.now()
+        HostMetric.objects.bulk_create([
+            HostMetric(agent=self.agent, timestamp=now - timedelta(days=days), cpu_usage=1.0, memory_usage=1.0,
+                       disk_usage=1.0, network_sent=0, network_received=0)
+            for days in [1, 10, 200, 400]
+        ])
+        out = io.StringIO()
+        with mock.patch('monitoring.management.commands.manage_partitions.supports_partitioning', return_value=False):
+            call_command('manage_partitions', stdout=out)
+        self.assertIn('monitoring_hostmetric: not partitioned, deleted 2 rows', out.getvalue())
+        self.assertEqual(HostMetric.objects.count(), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'only Postgres partitions')
+    def test_partitions_are_created_and_dropped(self):
+        table = HostMetric._meta.db_table
+        self.assertTrue(is_partitioned(table))
+        self.assertTrue(list_partitions(table))
+
+        def metric(timestamp):
+            return HostMetric.objects.create(agent=self.agent, timestamp=timestamp, cpu_usage=1.0, memory_usage=1.0,
+                                             disk_usage=1.0, network_sent=0, network_received=0)
+
+        def partition_of(row):
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT tableoid::regclass::text FROM {table} WHERE id = %s', [row.id])
+                return cursor.fetchone()[0]
+
+        # Rows older than any partition land in the default one until theirs exists
+        week = datetime(2020, 1, 6, tzinfo=dt_timezone.utc)
+        caught, straggler = metric(week + timedelta(days=2)), metric(week - timedelta(days=30))
+        self.assertEqual(partition_of(caught), f'{table}_default')
+        name = create_partition(table, week, week + timedelta(weeks=1))
+        self.assertEqual(partition_of(caught), name)
+        self.assertEqual(list_partitions(table)[name], (week, week + timedelta(weeks=1)))
+        self.assertEqual(partition_of(straggler), f'{table}_default')
+
+        kept = metric(timezone.now())
+        self.assertEqual(drop_expired_partitions(table, {'retention_days': 90}), [name])
+        self.assertEqual(list(HostMetric.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(ensure_partitions(table, dict(settings.TIME_PARTITIONS['monitoring.HostMetric'],
+                                                       retention_days=90)), [])
+
+
+@mock.patch('monitoring.archive.ARCHIVE_FRAME_ROWS', 4)
+class ArchiveTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings_override = override_settings(SYSTEMLOG_ARCHIVE_DIR=archive_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.other = MonitoringAgent.objects.create(hostname='db-1', username='u')
+        # Both agents log at the same moments, across a UTC day boundary
+        self.logs = [
+            SystemLog.objects.create(agent=agent, timestamp=START - timedelta(hours=12) + timedelta(minutes=50 * i),
+                                     data=log_entry(i, hostname=agent.hostname))
+            for i in range(20) for agent in (self.agent, self.other)
+        ]
+        self.window = (START - timedelta(days=1), START + timedelta(days=1))
+
+    def archived(self, *window, **kwargs):
+        return [(record['id'], record['data']) for record in archived_records(*window, **kwargs)]
+
+    def expected(self, logs):
+        return [(log.id, log.data) for log in sorted(logs, key=lambda log: (log.timestamp, log.id))]
+
+    def test_round_trip(self):
+        self.assertEqual(archive_logs(START + timedelta(days=1)), 40)
+        self.assertFalse(SystemLog.objects.exists())
+        self.assertEqual(archive_horizon(), self.logs[-1].timestamp)
+
+        expected = self.expected(self.logs)
+        self.assertEqual(self.archived(*self.window, reverse=True), expected)
+        self.assertEqual(self.archived(*self.window), expected[::-1])
+        mine = self.expected([log for log in self.logs if log.agent_id == self.agent.id])
+        self.assertEqual(self.archived(*self.window, agent_id=self.agent.id, reverse=True), mine)
+
+        # A range that starts and ends inside frames
+        start, end = START - timedelta(hours=4), START + timedelta(hours=3)
+        inside = self.expected([log for log in self.logs if start <= log.timestamp < end])
+        self.assertEqual(self.archived(start, end, reverse=True), inside)
+        self.assertEqual(count_archived(start, end), len(inside))
+        self.assertEqual(count_archived(*self.window, agent_id=self.other.id), 20)
+
+        # One segment per agent per day, frames back to back
+        index = load_index(self.agent.id, START.date())
+        self.assertEqual(index['codec'], 'zstd' if ZSTD_AVAILABLE else 'gzip')
+        self.assertEqual([frame['offset'] for frame in index['frames']],
+                         [sum(frame['length'] for frame in index['frames'][:n]) for n in range(len(index['frames']))])
+        self.assertEqual(sum(frame['count'] for frame in index['frames']),
+                         sum(log.agent_id == self.agent.id and log.timestamp >= START for log in self.logs))
+        segment = os.path.join(archive_root(), str(self.agent.id), f'{START.date()}{EXTENSIONS[index["codec"]]}')
+        self.assertEqual(os.path.getsize(segment), index['size'])
+
+    def test_rerun_after_an_interrupted_run(self):
+        # Killed after the frames were written but before the rows were deleted
+        with mock.patch('django.db.models.query.QuerySet.delete', side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                archive_logs(START + timedelta(days=1))
+        self.assertEqual(SystemLog.objects.count(), 40)
+        # ... and again after appending a frame whose index update never happened
+        day = START.date() - timedelta(days=1)
+        agent_id, index = next(
+            (agent.id, load_index(agent.id, day)) for agent in (self.agent, self.other) if load_index(agent.id, day)
+        )
+        segment = os.path.join(archive_root(), str(agent_id), f'{day}{EXTENSIONS[index["codec"]]}')
+        with open(segment, 'ab') as f:
+            f.write(b'half a frame')
+
+        self.assertEqual(archive_logs(START + timedelta(days=1)), 40)
+        self.assertFalse(SystemLog.objects.exists())
+        self.assertEqual(self.archived(*self.window, reverse=True), self.expected(self.logs))
+        self.assertEqual(count_archived(*self.window), 40)
+        self.assertEqual(os.path.getsize(segment), load_index(agent_id, day)['size'])
+
+    def test_logs_api_reads_across_the_horizon(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            email='admin@example.com', username='admin', password='pw', is_staff=True
+        ))
+        now = timezone.now()
+        SystemLog.objects.filter(id__in=[log.id for log in self.logs]).update(timestamp=now - timedelta(days=1))
+        recent = SystemLog.objects.create(agent=self.agent, timestamp=now - timedelta(hours=1), data=log_entry(0))
+        archive_logs(now - timedelta(hours=2))
+
+        response = self.client.get('/api/logs/', {'agent_id': self.agent.id, 'hours': 48, 'count': 'exact'})
+        self.assertEqual(response.data['count'], 21)
+        results = response.data['results']
+        self.assertEqual(results[0]['id'], recent.id)
+        self.assertEqual({row['agent_hostname'] for row in results}, {'pop-os'})
+        self.assertEqual(results[1]['data'], next(log.data for log in self.logs if log.id == results[1]['id']))
+        # hours= stops short of the archive
+        self.assertEqual(self.client.get('/api/logs/', {'hours': 12, 'count': 'exact'}).data['count'], 1)
+
+
+class ProcessListTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            email='viewer@example.com', username='viewer', password='pw'
+        ))
+        (timestamp, self.upload), = churning_process_uploads(1)
+        save_process_snapshots(self.agent, [(timestamp, self.upload)])
+        self.all_processes = self.upload['all_processes']
+
+    def list(self, **params):
+        return self.client.get('/api/processes/list/', {'hostname': 'pop-os', **params})
+
+    def pids(self, processes):
+        return [process['pid'] for process in processes]
+
+    def test_sorting_and_paging(self):
+        response = self.list()
+        self.assertEqual(response.status_code, 200)
+        by_memory = sorted(self.all_processes, key=lambda process: (process['memory_percent'], process['pid']), reverse=True)
+        self.assertEqual(self.pids(response.data['processes']), self.pids(by_memory[:50]))
+        self.assertEqual((response.data['count'], response.data['total_pages']), (320, 7))
+        self.assertEqual(response.data['total_processes'], 320)
+
+        by_name = sorted(self.all_processes, key=lambda process: (process['name'], process['pid']))
+        response = self.list(sort='name', page=2, page_size=100)
+        self.assertEqual(self.pids(response.data['processes']), self.pids(by_name[100:200]))
+        by_cpu = sorted(self.all_processes, key=lambda process: (process['cpu_percent'], process['pid']), reverse=True)
+        self.assertEqual(self.pids(self.list(sort='-cpu').data['processes']), self.pids(by_cpu[:50]))
+        self.assertEqual(self.list(page=8).data['processes'], [])
+
+    def test_filters(self):
+        response = self.list(user='root', is_root='true', name='SYS', sort='pid', page_size=500)
+        expected = [
+            process['pid'] for process in self.all_processes
+            if process['user'] == 'root' and process['is_root'] and 'sys' in process['name']
+        ]
+        self.assertTrue(expected)
+        self.assertEqual(self.pids(response.data['processes']), expected)
+        self.assertEqual(response.data['count'], len(expected))
+        self.assertEqual(self.list(status='zombie').data['count'], 0)
+
+    def test_top_lists_are_kept(self):
+        response = self.list(user='nobody')
+        self.assertEqual(response.data['processes'], [])
+        self.assertEqual(self.pids(response.data['top_memory_processes']), self.pids(self.upload['top_memory_processes']))
+        self.assertEqual(self.pids(response.data['top_cpu_processes']), self.pids(
+            sorted(self.all_processes, key=lambda process: (process['cpu_percent'], process['pid']), reverse=True)[:10]
+        ))
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.list(sort='rss').status_code, 400)
+        self.assertEqual(self.list(page='last').status_code, 400)
+        self.assertEqual(self.client.get('/api/processes/list/').status_code, 400)
+        self.assertEqual(self.list(hostname='elsewhere').status_code, 404)
+        self.assertEqual(self.client.get('/api/processes/list/', {'agent_id': 'x'}).status_code, 404)
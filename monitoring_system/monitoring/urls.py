@@ -31,7 +31,7 @@ urlpatterns = [
     path('agent/register/', views.AgentRegistrationViewSet.as_view({'post': 'create'}), name='agent-register'),
     path('metrics/upload/', views.HostMetricViewSet.as_view({'post': 'upload_metrics'}), name='metrics-upload'),
     path('processes/upload/', views.ProcessViewSet.as_view({'post': 'upload_processes'}), name='processes-upload'),
-    path('processes/list/', views.ProcessViewSet.as_view({'get': 'get_processes'}), name='processes-list'),
+    path('processes/list/', views.ProcessViewSet.as_view({'get': 'list_processes'}), name='processes-list'),
     path('api/auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
\ No newline at end of file
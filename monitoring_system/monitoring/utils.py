@@ -1,8 +1,33 @@
 import base64
+import codecs
 import json
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
+import hashlib
+import time
+import zlib
+import re
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes, padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.hmac import HMAC
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from .parsers import MSGPACK_AVAILABLE
+
+if MSGPACK_AVAILABLE:
+    import msgpack
+
+logger = logging.getLogger(__name__)
+
+# Plaintext encodings accepted inside a binary upload envelope
+ENVELOPE_CODECS = ['msgpack+zlib']
 
 
 class EncryptionManager:
@@ -30,8 +55,8 @@ class EncryptionManager:
     
     def initialize_from_password(self, password, salt):
         """Initialize encryption with password and salt"""
-        key = self.generate_key_from_password(password, salt)
-        self.fernet = Fernet(key)
+        self.key = self.generate_key_from_password(password, salt)
+        self.fernet = Fernet(self.key)
     
     def encrypt_data(self, data):
         """Encrypt data before sending to server"""
@@ -59,6 +84,601 @@ class EncryptionManager:
         except Exception as e:
             raise ValueError(f"Decryption failed: {str(e)}")
 
+    def iter_decrypted_entries(self, encrypted_data):
+        """Decrypt a JSON upload and yield its log entries one at a time
+        
+        Neither the plaintext nor the decoded entries are ever held in full:
+        the token is authenticated in one pass, then decrypted and parsed
+        chunk by chunk in a second one.
+        """
+        if not self.fernet:
+            raise ValueError("Decryption not initialized")
+        
+        def token_chunks():
+            # encrypted_data is base64 around the (itself base64) Fernet token
+            return _iter_b64decode(_iter_b64decode(_iter_slices(encrypted_data)))
+        
+        stream = FernetStream(self.key, token_chunks)
+        stream.verify()
+        def text_chunks():
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            for chunk in stream.iter_plaintext():
+                yield decoder.decode(chunk)
+            # Raises on a multi-byte character cut off at the end
+            yield decoder.decode(b'', final=True)
+        
+        return iter_json_entries(text_chunks())
+
+    def iter_envelope_entries(self, token, codec):
+        """Decrypt a raw Fernet token from a binary upload envelope and yield its entries"""
+        if not self.fernet:
+            raise ValueError("Decryption not initialized")
+        if codec not in ENVELOPE_CODECS:
+            raise ValueError(f"Unsupported envelope codec: {codec}")
+        
+        stream = FernetStream(self.key, lambda: _iter_slices(token))
+        stream.verify()
+        return iter_msgpack_entries(_iter_inflate(stream.iter_plaintext()))
+
+    @classmethod
+    def for_agent(cls, agent):
+        """Build a manager for an agent using the process-wide derived key cache"""
+        manager = cls()
+        key = derived_key_cache.get_key(
+            agent.id,
+            agent.get_key_reference(),
+            lambda: manager.generate_key_from_password(
+                agent.get_encryption_password(),
+                agent.encryption_salt
+            )
+        )
+        manager.key = key
+        manager.fernet = Fernet(key)
+        return manager
+
+
+# Size of the slices large uploads are decoded, decrypted and parsed in
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_MSGPACK_ARRAY_HEADERS = set(range(0x90, 0xa0)) | {0xdc, 0xdd}
+
+
+def _iter_slices(data, size=STREAM_CHUNK_SIZE):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _iter_b64decode(chunks):
+    """Decode a stream of urlsafe base64 chunks without joining them"""
+    pending = b''
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        pending += chunk
+        cut = len(pending) - len(pending) % 4
+        if cut:
+            yield base64.urlsafe_b64decode(pending[:cut])
+            pending = pending[cut:]
+    if pending.strip():
+        raise ValueError("Truncated base64 data")
+
+
+def _iter_inflate(chunks):
+    """zlib-decompress a stream of chunks, never producing more than a chunk at a time"""
+    decompressor = zlib.decompressobj()
+    try:
+        for chunk in chunks:
+            while chunk:
+                yield decompressor.decompress(chunk, STREAM_CHUNK_SIZE)
+                chunk = decompressor.unconsumed_tail
+        yield decompressor.flush()
+    except zlib.error as e:
+        raise ValueError(f"Malformed compressed payload: {e}")
+    if not decompressor.eof:
+        raise ValueError("Truncated compressed payload")
+
+
+class FernetStream:
+    """Chunked Fernet decryption for tokens too large to decrypt in one go
+    
+    Fernet.decrypt needs the whole token and returns the whole plaintext,
+    which costs several copies of a large upload. Here token_chunks is a
+    callable returning a fresh iterator over the raw token bytes; the token
+    is read once by verify() to check its HMAC and once more by
+    iter_plaintext(), so nothing is decrypted before it is authenticated.
+    """
+    
+    HEADER_SIZE = 25    # version, timestamp, IV
+    HMAC_SIZE = 32
+    
+    def __init__(self, key, token_chunks):
+        key = base64.urlsafe_b64decode(key)
+        self.signing_key = key[:16]
+        self.encryption_key = key[16:]
+        self.token_chunks = token_chunks
+        self.verified = False
+    
+    def verify(self):
+        """Check the token's HMAC, raising ValueError if it doesn't match"""
+        signature = HMAC(self.signing_key, hashes.SHA256())
+        tail = b''
+        try:
+            for chunk in self.token_chunks():
+                tail += chunk
+                if len(tail) > self.HMAC_SIZE:
+                    signature.update(tail[:-self.HMAC_SIZE])
+                    tail = tail[-self.HMAC_SIZE:]
+            if len(tail) < self.HMAC_SIZE:
+                raise InvalidToken
+            signature.verify(tail)
+        except Exception as e:
+            raise ValueError(f"Decryption failed: {type(e).__name__}")
+        self.verified = True
+    
+    def iter_plaintext(self):
+        """Yield the decrypted plaintext chunk by chunk"""
+        if not self.verified:
+            raise ValueError("Token must be verified before decrypting")
+        
+        header = b''
+        held = b''
+        decryptor = None
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        for chunk in self.token_chunks():
+            if decryptor is None:
+                header += chunk
+                if len(header) < self.HEADER_SIZE:
+                    continue
+                if header[0] != 0x80:
+                    raise ValueError("Decryption failed: unknown token version")
+                iv = header[9:self.HEADER_SIZE]
+                decryptor = Cipher(algorithms.AES(self.encryption_key), modes.CBC(iv)).decryptor()
+                chunk = header[self.HEADER_SIZE:]
+            
+            # Keep the trailing HMAC out of the ciphertext
+            held += chunk
+            ciphertext, held = held[:-self.HMAC_SIZE], held[-self.HMAC_SIZE:]
+            if ciphertext:
+                yield unpadder.update(decryptor.update(ciphertext))
+        
+        if decryptor is None:
+            raise ValueError("Decryption failed: token too short")
+        try:
+            yield unpadder.update(decryptor.finalize()) + unpadder.finalize()
+        except ValueError as e:
+            raise ValueError(f"Decryption failed: {str(e)}")
+
+
+def iter_json_entries(chunks):
+    """Yield the entries of a JSON array (or a single JSON object) as its text streams in
+    
+    Only the entry being decoded and the text not yet consumed are kept, so
+    a 10k-entry buffer flush never exists as one list of dicts.
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    
+    def read_more():
+        nonlocal buf, pos
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+    
+    def next_char():
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if not read_more():
+                return ''
+    
+    if next_char() != '[':
+        # A single entry, nothing to gain from streaming it
+        while read_more():
+            pass
+        entry = decoder.decode(buf[pos:])
+        if not isinstance(entry, dict):
+            raise ValueError(f"Unexpected decrypted data type: {type(entry)}")
+        yield entry
+        return
+    
+    pos += 1
+    if next_char() == ']':
+        pos += 1
+        if next_char():
+            raise ValueError("Malformed log batch: data after the closing ']'")
+        return
+    
+    while True:
+        # An entry is only complete once text follows it (a number could
+        # continue in the next chunk) or the input has run out
+        while True:
+            try:
+                entry, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or not read_more():
+                    break
+            except json.JSONDecodeError:
+                if not read_more():
+                    raise
+        pos = end
+        yield entry
+        
+        separator = next_char()
+        if separator == ']':
+            pos += 1
+            if next_char():
+                raise ValueError("Malformed log batch: data after the closing ']'")
+            return
+        if separator != ',':
+            raise ValueError(f"Malformed log batch: expected ',' or ']', got {separator!r}")
+        pos += 1
+        next_char()
+
+
+def iter_msgpack_entries(chunks):
+    """Yield the entries of a MessagePack array (or a single map) as its bytes stream in"""
+    unpacker = msgpack.Unpacker(raw=False)
+    is_array = None
+    remaining = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        unpacker.feed(chunk)
+        if is_array is None:
+            is_array = chunk[0] in _MSGPACK_ARRAY_HEADERS
+        if not is_array:
+            continue
+        if remaining is None:
+            try:
+                remaining = unpacker.read_array_header()
+            except msgpack.OutOfData:
+                continue
+        # Entries come out as soon as their last byte has been fed
+        for entry in unpacker:
+            if not remaining:
+                raise ValueError("Malformed envelope payload: data after the last entry")
+            remaining -= 1
+            yield entry
+    
+    if is_array is None:
+        raise ValueError("Empty envelope payload")
+    if is_array and remaining != 0:
+        raise ValueError("Truncated envelope payload")
+    if not is_array:
+        # Stops at the end of the data, so a truncated map gives no entry
+        entries = list(unpacker)
+        if len(entries) != 1:
+            raise ValueError("Malformed envelope payload: expected a single entry")
+        entry = entries[0]
+        if not isinstance(entry, dict):
+            raise ValueError(f"Unexpected decrypted data type: {type(entry)}")
+        yield entry
+
+
+class DerivedKeyCache:
+    """LRU cache of PBKDF2-derived keys, keyed on (agent id, credentials reference)"""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_key(self, agent_id, key_reference, derive):
+        """Return the cached key or derive it by calling derive()"""
+        cache_key = (agent_id, key_reference)
+        with self._lock:
+            key = self._keys.get(cache_key)
+            if key is not None:
+                self._keys.move_to_end(cache_key)
+                return key
+
+        # Derive outside the lock so one slow derivation doesn't block other agents
+        key = derive()
+
+        with self._lock:
+            self._keys[cache_key] = key
+            self._keys.move_to_end(cache_key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+        return key
+
+    def invalidate(self, agent_id):
+        """Drop every cached key belonging to an agent"""
+        with self._lock:
+            for cache_key in [k for k in self._keys if k[0] == agent_id]:
+                del self._keys[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+derived_key_cache = DerivedKeyCache(
+    max_size=getattr(settings, 'ENCRYPTION_KEY_CACHE_SIZE', 1024)
+)
+
+
+class AgentIdentityCache:
+    """Short-TTL hostname -> agent identity cache in the shared Django cache.
+
+    Hits return a MonitoringAgent with only the identity fields loaded; any
+    other field (e.g. the encryption password or salt) is fetched lazily on
+    access, so no credential material is written to the shared cache.
+    Unknown hostnames are cached too so they can be rejected without a query.
+    """
+
+    FIELDS = [
+        'id', 'hostname', 'username', 'is_active', 'is_approved',
+        'monitoring_scope', 'config_version',
+    ]
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+
+    def _cache_key(self, hostname):
+        return 'monitoring:agent:' + hashlib.sha1(hostname.encode()).hexdigest()
+
+    def get(self, hostname):
+        """Return the agent registered under hostname, or None"""
+        from .models import MonitoringAgent
+
+        entry = cache.get(self._cache_key(hostname))
+        if entry is None:
+            agent = MonitoringAgent.objects.filter(hostname=hostname).first()
+            if agent is None:
+                entry = {'missing': True}
+            else:
+                entry = {field: getattr(agent, field) for field in self.FIELDS}
+                entry['key_reference'] = agent.get_key_reference()
+            cache.set(self._cache_key(hostname), entry, self.ttl)
+            return agent
+
+        if entry.get('missing'):
+            return None
+
+        # from_db expects values in model field order
+        field_names = [f.attname for f in MonitoringAgent._meta.concrete_fields if f.attname in entry]
+        agent = MonitoringAgent.from_db('default', field_names, [entry[name] for name in field_names])
+        agent._key_reference = entry['key_reference']
+        return agent
+
+    def invalidate(self, hostname):
+        cache.delete(self._cache_key(hostname))
+
+
+agent_identity_cache = AgentIdentityCache(
+    ttl=getattr(settings, 'AGENT_IDENTITY_CACHE_TTL', 60)
+)
+
+
+def bump_counter(key):
+    """Increment a counter in the shared Django cache, creating it if needed
+
+    add() and incr() are atomic on Redis, Memcached and the local-memory
+    backend, so concurrent bumps are never lost.
+    """
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+class ThresholdCache:
+    """Process-local cache of active ResourceThresholds grouped by resource_type.
+
+    A version number kept in the shared Django cache is bumped whenever a
+    threshold changes, so every worker reloads on its next lookup. Entries
+    also expire after max_age seconds in case a change bypassed the signals.
+    """
+
+    VERSION_KEY = 'monitoring:threshold_version'
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._by_type = None
+        self._version = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, resource_type):
+        """Return the active thresholds for a resource type"""
+        version = cache.get(self.VERSION_KEY, 0)
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > self.max_age
+            if self._by_type is None or version != self._version or expired:
+                self._load(version)
+            return self._by_type.get(resource_type, [])
+
+    def _load(self, version):
+        from .models import ResourceThreshold
+
+        by_type = {}
+        for threshold in ResourceThreshold.objects.filter(is_active=True):
+            by_type.setdefault(threshold.resource_type, []).append(threshold)
+
+        self._by_type = by_type
+        self._version = version
+        self._loaded_at = time.monotonic()
+
+    def bump_version(self):
+        """Invalidate the cached thresholds in every worker"""
+        bump_counter(self.VERSION_KEY)
+        with self._lock:
+            self._by_type = None
+
+
+threshold_cache = ThresholdCache(
+    max_age=getattr(settings, 'THRESHOLD_CACHE_MAX_AGE', 300)
+)
+
+
+def exceeded_thresholds(metric):
+    """Yield (threshold, current_value, label) for each cached threshold a metric exceeds"""
+    for resource_type, label, current_value in (
+        ('cpu', 'CPU', metric.cpu_usage),
+        ('memory', 'Memory', metric.memory_usage),
+        ('disk', 'Disk', metric.disk_usage),
+    ):
+        for threshold in threshold_cache.get(resource_type):
+            if current_value > threshold.threshold_value:
+                yield threshold, current_value, label
+
+
+class AlertCooldownCache:
+    """Remembers when each alert fingerprint was last raised in this process.
+
+    Resolving or deleting an alert calls forget() with its fingerprint,
+    which leaves a marker in the shared Django cache so every worker lets
+    that rule fire again straight away. reset() bumps a generation number
+    instead, which clears all remembered fingerprints in every worker.
+    """
+
+    GENERATION_KEY = 'monitoring:alert_generation'
+    FORGOTTEN_KEY = 'monitoring:alert_forgotten:'
+
+    def __init__(self, cooldown=timedelta(minutes=30), max_size=10000):
+        self.cooldown = cooldown
+        self.max_size = max_size
+        self._recent = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self._batch = threading.local()
+
+    def is_cooling_down(self, fingerprint, now):
+        generation = cache.get(self.GENERATION_KEY, 0)
+        with self._lock:
+            if generation != self._generation:
+                self._recent.clear()
+                self._generation = generation
+            triggered_at = self._recent.get(fingerprint)
+        if triggered_at is None or triggered_at < now - self.cooldown:
+            return False
+        forgotten_at = cache.get(self.FORGOTTEN_KEY + fingerprint)
+        if forgotten_at is not None and forgotten_at >= triggered_at:
+            self.discard([fingerprint])
+            return False
+        return True
+
+    def remember(self, fingerprint, triggered_at):
+        with self._lock:
+            self._recent[fingerprint] = triggered_at
+            self._recent.move_to_end(fingerprint)
+            while len(self._recent) > self.max_size:
+                self._recent.popitem(last=False)
+        recorded = getattr(self._batch, 'recorded', None)
+        if recorded is not None:
+            recorded.append(fingerprint)
+
+    def discard(self, fingerprints):
+        """Forget some fingerprints in this worker"""
+        with self._lock:
+            for fingerprint in fingerprints:
+                self._recent.pop(fingerprint, None)
+
+    @contextmanager
+    def forget_on_error(self):
+        """Forget the fingerprints remembered inside the block if it raises
+
+        Wrap a transaction that creates alerts with it: when the transaction
+        rolls back, so does the cooldown of the alerts it raised, and no other
+        fingerprint's. They were only remembered by this worker.
+        """
+        self._batch.recorded = recorded = []
+        try:
+            yield
+        except Exception:
+            self.discard(recorded)
+            raise
+        finally:
+            self._batch.recorded = None
+
+    def forget(self, fingerprints):
+        """Let these fingerprints raise alerts again straight away, in every worker"""
+        fingerprints = [fingerprint for fingerprint in fingerprints if fingerprint]
+        if not fingerprints:
+            return
+        # Only hits remembered before now are forgotten; the marker can go
+        # once those are past the cooldown anyway
+        now = timezone.now()
+        cache.set_many(
+            {self.FORGOTTEN_KEY + fingerprint: now for fingerprint in fingerprints},
+            timeout=self.cooldown.total_seconds()
+        )
+        self.discard(fingerprints)
+
+    def reset(self):
+        """Forget remembered fingerprints in every worker"""
+        bump_counter(self.GENERATION_KEY)
+        with self._lock:
+            self._recent.clear()
+
+
+alert_cooldown = AlertCooldownCache()
+
+
+def create_deduplicated_alert(agent, title, description, level, alert_type='system', metadata=None):
+    """Create an alert unless the same rule already raised one within the cooldown.
+
+    Returns the new (or re-raised) alert, or None when the hit was suppressed.
+    """
+    from .models import Alert
+
+    now = timezone.now()
+    fingerprint = Alert.make_fingerprint(agent.id, title, alert_type)
+    if alert_cooldown.is_cooling_down(fingerprint, now):
+        return None
+
+    existing = Alert.objects.filter(fingerprint=fingerprint, resolved=False).first()
+    if existing:
+        if existing.triggered_at >= now - alert_cooldown.cooldown:
+            alert_cooldown.remember(fingerprint, existing.triggered_at)
+            return None
+
+        # Still open but past the cooldown: raise the open alert again in place
+        existing.description = description
+        existing.level = level
+        existing.metadata = metadata or {}
+        existing.triggered_at = now
+        existing.save(update_fields=['description', 'level', 'metadata', 'triggered_at'])
+        alert_cooldown.remember(fingerprint, now)
+        logger.info(f"Re-raised alert: {title} (Level: {level}, Type: {alert_type})")
+        return existing
+
+    try:
+        with transaction.atomic():
+            alert = Alert.objects.create(
+                agent=agent,
+                title=title,
+                description=description,
+                level=level,
+                alert_type=alert_type,
+                metadata=metadata or {},
+                fingerprint=fingerprint,
+                resolved=False
+            )
+    except IntegrityError:
+        # Another worker raised the same alert first
+        return None
+
+    alert_cooldown.remember(fingerprint, alert.triggered_at)
+    logger.info(f"Created alert: {title} (Level: {level}, Type: {alert_type})")
+    return alert
+
 
 class AlertGenerator:
     """Generates alerts based on monitoring data"""
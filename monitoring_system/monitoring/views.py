@@ -2,15 +2,18 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
 from django.utils import timezone
+from django.db import IntegrityError, transaction
 from django.db.models import Count, Q
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
-from .models import MonitoringAgent, SystemLog, Alert, UserSession, AgentRegistrationRequest, HostMetric, ProcessSnapshot, ResourceThreshold, NotificationChannel
+from .models import MonitoringAgent, SystemLog, Alert, UserSession, AgentRegistrationRequest, HostMetric, HostMetricRollup, LatestProcessSnapshot, LiveProcess, ResourceThreshold, NotificationChannel, IngestJob
 from .serializers import *
-from .utils import EncryptionManager, AlertGenerator
+from .utils import EncryptionManager, AlertGenerator, exceeded_thresholds, create_deduplicated_alert, alert_cooldown, agent_identity_cache
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils.dateparse import parse_datetime
 import json
 import smtplib
 from email.mime.text import MIMEText
@@ -22,12 +25,50 @@ from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from .parsers import EnvelopeParser, MSGPACK_AVAILABLE, ENVELOPE_VERSIONS
+from .pagination import KeysetPagination
+from .purge import purge, plan_agent_purge, run_agent_purge, release_hostname
+from .stats import dashboard_stats, record_log_counts
+from .processes import save_process_snapshots, process_snapshot_at, expand_processes
+from .rollups import pick_resolution, bucket_start, metric_series, SERIES_AGGREGATIONS
+from .logfields import filter_logs, summarize_by_agent
+from .logstorage import stored_sessions, strip_normalized, compress_logs
+from .hostmetrics import store_samples
+from .archive import archive_horizon, archived_records, count_archived, record_to_log
+import base64
+import ipaddress
+from itertools import islice
 
 
 init(autoreset=True)
 
 logger = logging.getLogger(__name__)
 
+
+def supported_wire_formats():
+    """Upload formats advertised to agents, preferred first"""
+    formats = [f'msgpack-v{version}' for version in ENVELOPE_VERSIONS] if MSGPACK_AVAILABLE else []
+    return formats + ['json']
+
+
+def parse_query_time(value):
+    """Parse an ISO 8601 or epoch-seconds query parameter; None when it is empty"""
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'Invalid timestamp: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 class MonitoringAgentViewSet(viewsets.ModelViewSet):
     queryset = MonitoringAgent.objects.all()
     serializer_class = MonitoringAgentSerializer
@@ -38,28 +79,30 @@ class MonitoringAgentViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
     
+    def destroy(self, request, *args, **kwargs):
+        """Deactivate the agent and purge its data
+
+        The purge runs now unless AGENT_PURGE_IN_BACKGROUND is set, in which
+        case it is only queued for `enforce_retention` and this answers 202.
+        """
+        agent = self.get_object()
+        tasks = plan_agent_purge(agent)
+        if not settings.AGENT_PURGE_IN_BACKGROUND:
+            deleted = sum(task.deleted for task in run_agent_purge(agent.id))
+            logger.info(f"Deleted agent {agent.hostname} ({deleted} rows with its data)")
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        logger.info(f"Queued deletion of agent {agent.hostname} in {len(tasks)} purge tasks")
+        return Response({
+            'status': 'deleting',
+            'agent_id': agent.id,
+            'purge_task_ids': [task.id for task in tasks]
+        }, status=status.HTTP_202_ACCEPTED)
+    
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Get agent statistics"""
+        """Get agent statistics (cached for DASHBOARD_STATS_TTL seconds)"""
         try:
-            total_agents = MonitoringAgent.objects.count()
-            active_agents = MonitoringAgent.objects.filter(is_active=True, is_approved=True).count()
-            pending_registrations = AgentRegistrationRequest.objects.filter(status='pending').count()
-            
-            recent_logs_count = SystemLog.objects.filter(
-                timestamp__gte=timezone.now() - timedelta(hours=24)
-            ).count()
-            
-            alerts_count = Alert.objects.filter(resolved=False).count()
-            
-            stats = {
-                'total_agents': total_agents,
-                'active_agents': active_agents,
-                'pending_registrations': pending_registrations,
-                'recent_logs_count': recent_logs_count,
-                'alerts_count': alerts_count,
-            }
-            return Response(stats)
+            return Response(dashboard_stats())
         except Exception as e:
             return Response({
                 'total_agents': 0,
@@ -181,6 +224,7 @@ class MonitoringAgentViewSet(viewsets.ModelViewSet):
             'monitoring_scope': agent.monitoring_scope,
             'interval': 60,
             'config_version': agent.config_version,
+            'wire_formats': supported_wire_formats(),
         }
         return Response(config)
     
@@ -192,13 +236,16 @@ class MonitoringAgentViewSet(viewsets.ModelViewSet):
             return Response({'error': 'hostname parameter required'}, status=400)
         
         try:
-            agent = MonitoringAgent.objects.get(hostname=hostname)
+            agent = agent_identity_cache.get(hostname)
+            if agent is None:
+                raise MonitoringAgent.DoesNotExist
             config = {
                 'is_active': agent.is_active,
                 'is_approved': agent.is_approved,
                 'monitoring_scope': agent.monitoring_scope,
                 'interval': 60,
                 'config_version': agent.config_version,
+                'wire_formats': supported_wire_formats(),
             }
             return Response(config)
         except MonitoringAgent.DoesNotExist:
@@ -246,8 +293,8 @@ class AgentRegistrationViewSet(viewsets.ModelViewSet):
         try:
             data = serializer.validated_data
             
-            # Check if agent already exists
-            if MonitoringAgent.objects.filter(hostname=data['hostname']).exists():
+            # Check if agent already exists (a deleted one awaiting its purge is purged now)
+            if not release_hostname(data['hostname']):
                 return Response({
                     'error': 'Agent with this hostname already registered'
                 }, status=status.HTTP_400_BAD_REQUEST)
@@ -289,8 +336,8 @@ class AgentRegistrationViewSet(viewsets.ModelViewSet):
         registration = self.get_object()
         
         try:
-            # Check if agent already exists
-            if MonitoringAgent.objects.filter(hostname=registration.hostname).exists():
+            # Check if agent already exists (a deleted one awaiting its purge is purged now)
+            if not release_hostname(registration.hostname):
                 return Response({
                     'error': 'Agent with this hostname already exists'
                 }, status=status.HTTP_400_BAD_REQUEST)
@@ -334,15 +381,16 @@ class AgentRegistrationViewSet(viewsets.ModelViewSet):
         return Response({'status': 'rejected'})
 
 class SystemLogViewSet(viewsets.ModelViewSet):
-    queryset = SystemLog.objects.all().order_by('-timestamp')
+    queryset = SystemLog.objects.select_related('agent').order_by('-timestamp', '-id')
     serializer_class = SystemLogSerializer
+    pagination_class = KeysetPagination
     
     def get_permissions(self):
         """Customize permissions per action"""
         if self.action in ['upload_logs', 'create']:
             # Allow anyone to upload logs or create
             permission_classes = [AllowAny]
-        elif self.action in ['list', 'retrieve', 'update', 'partial_update', 'destroy']:
+        elif self.action in ['list', 'retrieve', 'update', 'partial_update', 'destroy', 'query']:
             # Restrict these actions to admins
             permission_classes = [IsAdminUser]
         else:
@@ -366,7 +414,66 @@ class SystemLogViewSet(viewsets.ModelViewSet):
         
         return queryset
     
-    @action(detail=False, methods=['post'])
+    def perform_create(self, serializer):
+        record_log_counts([serializer.save()])
+    
+    def _archive_window(self):
+        """(start, end, agent_id) of the archived range `hours=` reaches, or None"""
+        if self.action != 'list':
+            return None
+        horizon = archive_horizon()
+        start = timezone.now() - timedelta(hours=int(self.request.query_params.get('hours', 24)))
+        if horizon is None or start > horizon:
+            return None
+        agent_id = self.request.query_params.get('agent_id')
+        # Nothing newer than the horizon is archived
+        return start, horizon + timedelta(microseconds=1), int(agent_id) if agent_id else None
+    
+    def get_archived_rows(self, position, reverse, limit):
+        """Archived logs past a keyset position, for KeysetPagination"""
+        window = self._archive_window()
+        if window is None:
+            return []
+        start, end, agent_id = window
+        if position and reverse:
+            start = max(start, position[0])
+        elif position:
+            end = min(end, position[0] + timedelta(microseconds=1))
+        
+        records = archived_records(start, end, agent_id=agent_id, reverse=reverse)
+        if position:
+            if reverse:
+                records = (r for r in records if (parse_datetime(r['timestamp']), r['id']) > position)
+            else:
+                records = (r for r in records if (parse_datetime(r['timestamp']), r['id']) < position)
+        records = list(islice(records, limit))
+        agents = MonitoringAgent.objects.in_bulk({record['agent_id'] for record in records})
+        return [record_to_log(record, agents) for record in records]
+    
+    def count_archived_rows(self):
+        window = self._archive_window()
+        return count_archived(*window[:2], agent_id=window[2]) if window else 0
+    
+    @action(detail=False, methods=['get'])
+    def query(self, request):
+        """Logs matching predicates on the typed hot-field columns
+
+        `failed_login_attempts__gt=5&hours=168`, `firewall_active=false`,
+        `contains={"security_tools": {"antivirus_installed": false}}`;
+        `group_by=agent` returns per-host aggregates instead of rows.
+        """
+        queryset = filter_logs(self.get_queryset(), request.query_params)
+        
+        group_by = request.query_params.get('group_by')
+        if group_by == 'agent':
+            return Response({'results': summarize_by_agent(queryset)})
+        if group_by:
+            return Response({'error': 'group_by only supports "agent"'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+    
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, FormParser, MultiPartParser, EnvelopeParser])
     def upload_logs(self, request):
         """Handle encrypted log uploads from monitoring agents"""
         try:
@@ -381,9 +488,8 @@ class SystemLogViewSet(viewsets.ModelViewSet):
                 return Response({'error': 'hostname is required'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Get agent
-            try:
-                agent = MonitoringAgent.objects.get(hostname=hostname)
-            except MonitoringAgent.DoesNotExist:
+            agent = agent_identity_cache.get(hostname)
+            if agent is None:
                 return Response({
                     'error': 'Agent not registered or approved'
                 }, status=status.HTTP_403_FORBIDDEN)
@@ -396,212 +502,40 @@ class SystemLogViewSet(viewsets.ModelViewSet):
                     'is_approved': agent.is_approved
                 }, status=status.HTTP_403_FORBIDDEN)
             
-            # Determine if data is encrypted or not
-            log_entries = []
-            
-            if 'encrypted_data' in data:
-                # Decrypt the data
-                try:
-                    encryption_mgr = EncryptionManager(
-                        password=agent.get_encryption_password(),
-                        salt=agent.encryption_salt
-                    )
-                    decrypted_data = encryption_mgr.decrypt_data(data['encrypted_data'])
-                    logger.info("Successfully decrypted data")
-                    
-                    # Decrypted data should be a list or single dict
-                    if isinstance(decrypted_data, list):
-                        log_entries = decrypted_data
-                    elif isinstance(decrypted_data, dict):
-                        log_entries = [decrypted_data]
-                    else:
-                        raise ValueError(f"Unexpected decrypted data type: {type(decrypted_data)}")
-                        
-                except Exception as decryption_error:
-                    logger.error(f"Decryption failed: {decryption_error}")
-                    return Response({
-                        'error': 'Decryption failed - check encryption credentials'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                    
-            elif 'logs' in data:
-                # Unencrypted data
-                logger.info("Processing unencrypted logs")
-                logs_data = data['logs']
-                
-                if isinstance(logs_data, list):
-                    log_entries = logs_data
-                elif isinstance(logs_data, dict):
-                    log_entries = [logs_data]
-                else:
-                    return Response({
-                        'error': f'Invalid logs format, expected list or dict, got {type(logs_data)}'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-            else:
+            if 'encrypted_data' not in data and 'logs' not in data and 'token' not in data:
                 return Response({
                     'error': 'Either encrypted_data or logs field is required'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            logger.info(f"Processing {len(log_entries)} log entries")
+            # In async mode the raw payload is queued and parsed by run_ingest_workers
+            if settings.INGEST_ASYNC:
+                payload = dict(data)
+                if isinstance(payload.get('token'), bytes):
+                    # JSONField can't hold bytes; _extract_log_entries accepts either form
+                    payload['token'] = base64.b64encode(payload['token']).decode()
+                job = IngestJob.objects.create(kind='logs', agent=agent, payload=payload)
+                return Response({
+                    'status': 'queued',
+                    'job_id': job.id,
+                    'agent_id': agent.id,
+                    'agent_hostname': agent.hostname
+                }, status=status.HTTP_202_ACCEPTED)
             
-            # Process the logs
-            logs_processed = 0
-            alerts_generated = 0
-            metrics_saved = 0
-            sessions_saved = 0
+            try:
+                log_entries = self._extract_log_entries(agent, data)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
-            for log_entry in log_entries:
-                try:
-                    # Ensure log_entry is a dict
-                    if not isinstance(log_entry, dict):
-                        logger.warning(f"Skipping non-dict log entry: {type(log_entry)}")
-                        continue
-                    
-                    # Parse timestamp
-                    timestamp = log_entry.get('timestamp')
-                    if isinstance(timestamp, str):
-                        timestamp = timestamp.replace('Z', '+00:00')
-                        try:
-                            timestamp = datetime.fromisoformat(timestamp)
-                        except ValueError:
-                            timestamp = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S.%f')
-                        
-                        if timezone.is_naive(timestamp):
-                            timestamp = timezone.make_aware(timestamp)
-                    elif timestamp is None:
-                        timestamp = timezone.now()
-                    
-                    # Save system log
-                    system_log = SystemLog.objects.create(
-                        agent=agent,
-                        timestamp=timestamp,
-                        data=log_entry
-                    )
-                    logs_processed += 1
-                    
-                    # Extract and save host metrics from resource_anomalies
-                    resource_data = log_entry.get('resource_anomalies', {})
-                    if resource_data:
-                        try:
-                            # Get network data
-                            network_data = log_entry.get('network_connection', {})
-                            
-                            # Get disk usage percentage from resource_anomalies
-                            disk_percent = resource_data.get('disk_percent', 0.0)
-                            
-                            # Calculate disk totals (assuming disk_percent is accurate)
-                            disk_read_bytes = resource_data.get('disk_read_bytes', 0)
-                            disk_write_bytes = resource_data.get('disk_write_bytes', 0)
-                            
-                            # Estimate disk total and used from percentage
-                            # This is an approximation - adjust if you have actual values
-                            estimated_disk_total = 1000 * 1024 * 1024 * 1024  # 1TB default
-                            disk_used = int(estimated_disk_total * (disk_percent / 100))
-                            
-                            # Get memory data
-                            memory_percent = resource_data.get('memory_percent', 0.0)
-                            # Estimate memory total (adjust based on your systems)
-                            estimated_memory_total = 16 * 1024 * 1024 * 1024  # 16GB default
-                            memory_used = int(estimated_memory_total * (memory_percent / 100))
-                            
-                            host_metric = HostMetric.objects.create(
-                                agent=agent,
-                                timestamp=timestamp,
-                                cpu_usage=resource_data.get('cpu_percent', 0.0),
-                                memory_usage=memory_percent,
-                                memory_total=estimated_memory_total,
-                                memory_used=memory_used,
-                                disk_usage=disk_percent,
-                                disk_total=estimated_disk_total,
-                                disk_used=disk_used,
-                                network_sent=network_data.get('bytes_sent', 0),
-                                network_received=network_data.get('bytes_recv', 0)
-                            )
-                            metrics_saved += 1
-                            
-                            # Check thresholds and generate alerts if needed
-                            self._check_resource_thresholds(agent, host_metric)
-                            
-                        except Exception as metric_error:
-                            logger.error(f"Error saving host metric: {metric_error}")
-                    
-                    # Save user sessions
-                    users_data = log_entry.get('users_logged_in', {})
-                    if isinstance(users_data, dict):
-                        users_list = users_data.get('users', [])
-                        for user_data in users_list:
-                            try:
-                                login_time = user_data.get('started', 0)
-                                if isinstance(login_time, (int, float)):
-                                    if login_time > 0:
-                                        login_time = datetime.fromtimestamp(login_time, tz=timezone.utc)
-                                    else:
-                                        login_time = timestamp
-                                    
-                                    if timezone.is_naive(login_time):
-                                        login_time = timezone.make_aware(login_time)
-                                
-                                # Normalize host address
-                                host = user_data.get('host', '0.0.0.0')
-                                if host in [':1', '::1']:
-                                    host = '127.0.0.1'
-                                elif not host or host == ':0.0.0.0' or host.startswith(':'):
-                                    host = '0.0.0.0'
-                                
-                                # Check if session already exists
-                                session_exists = UserSession.objects.filter(
-                                    agent=agent,
-                                    username=user_data.get('name', 'unknown'),
-                                    pid=user_data.get('pid', 0),
-                                    login_time=login_time
-                                ).exists()
-                                
-                                if not session_exists:
-                                    UserSession.objects.create(
-                                        agent=agent,
-                                        username=user_data.get('name', 'unknown'),
-                                        terminal=user_data.get('terminal', 'unknown'),
-                                        host=host,
-                                        login_time=login_time,
-                                        pid=user_data.get('pid', 0)
-                                    )
-                                    sessions_saved += 1
-                                    
-                            except Exception as user_error:
-                                logger.warning(f"Error saving user session: {user_error}")
-                    
-                    # Save process snapshot if available
-                    process_data = log_entry.get('process_system_activity', {})
-                    if process_data:
-                        try:
-                            # Store complete process information
-                            processes_info = {
-                                'total_processes': process_data.get('total_processes', 0),
-                                'root_processes': process_data.get('root_processes', 0),
-                                'top_cpu_processes': process_data.get('top_cpu_processes', []),
-                                'top_memory_processes': process_data.get('top_memory_processes', []),
-                                'load_average': process_data.get('load_average', [])
-                            }
-                            
-                            ProcessSnapshot.objects.create(
-                                agent=agent,
-                                timestamp=timestamp,
-                                processes=processes_info
-                            )
-                        except Exception as process_error:
-                            logger.warning(f"Error saving process snapshot: {process_error}")
-                    
-                    # Generate security alerts
-                    try:
-                        alerts = self._generate_security_alerts(agent, log_entry, timestamp)
-                        alerts_generated += len(alerts)
-                    except Exception as alert_error:
-                        logger.error(f"Error generating alerts: {alert_error}")
-                    
-                except Exception as log_error:
-                    logger.error(f"Error processing log entry: {log_error}")
-                    import traceback
-                    logger.error(f"Traceback: {traceback.format_exc()}")
-                    continue
+            # Process the logs; malformed entries only surface while streaming
+            try:
+                counts = self._save_log_batch(agent, log_entries)
+            except ValueError as e:
+                logger.error(f"Malformed log batch: {e}")
+                return Response({'error': 'Malformed log batch'}, status=status.HTTP_400_BAD_REQUEST)
+            logs_processed = counts['logs_processed']
+            metrics_saved = counts['metrics_saved']
+            sessions_saved = counts['sessions_saved']
+            alerts_generated = counts['alerts_generated']
             
             logger.info(f"Successfully processed {logs_processed} logs, saved {metrics_saved} metrics, {sessions_saved} sessions, generated {alerts_generated} alerts")
             
@@ -615,6 +549,10 @@ class SystemLogViewSet(viewsets.ModelViewSet):
                 'alerts_generated': alerts_generated
             })
             
+        except (ParseError, UnsupportedMediaType):
+            # Malformed or unsupported upload envelopes are the client's
+            # fault; let DRF answer 400/415
+            raise
         except Exception as e:
             logger.error(f"Error processing log upload: {str(e)}")
             import traceback
@@ -625,6 +563,265 @@ class SystemLogViewSet(viewsets.ModelViewSet):
             )
     
 
+    def _extract_log_entries(self, agent, data):
+        """Return an iterator over the log entries of an upload payload, decrypting if needed
+        
+        Encrypted batches are decoded lazily, one entry at a time, so a large
+        buffer flush never exists in memory as a full list of dicts.
+        """
+        if 'token' in data:
+            # Binary envelope: raw Fernet token around zlib-compressed MessagePack
+            try:
+                token = data['token']
+                if isinstance(token, str):
+                    token = base64.b64decode(token)
+                encryption_mgr = EncryptionManager.for_agent(agent)
+                return encryption_mgr.iter_envelope_entries(token, data.get('codec'))
+            except Exception as decryption_error:
+                logger.error(f"Envelope decryption failed: {decryption_error}")
+                raise ValueError('Decryption failed - check encryption credentials')
+        
+        if 'encrypted_data' in data:
+            try:
+                encryption_mgr = EncryptionManager.for_agent(agent)
+                log_entries = encryption_mgr.iter_decrypted_entries(data['encrypted_data'])
+                logger.info("Authenticated encrypted batch; decrypting it while saving")
+                return log_entries
+            except Exception as decryption_error:
+                logger.error(f"Decryption failed: {decryption_error}")
+                raise ValueError('Decryption failed - check encryption credentials')
+        
+        if 'logs' in data:
+            # Unencrypted data
+            logger.info("Processing unencrypted logs")
+            logs_data = data['logs']
+            
+            if isinstance(logs_data, list):
+                return logs_data
+            elif isinstance(logs_data, dict):
+                return [logs_data]
+            
+            raise ValueError(f'Invalid logs format, expected list or dict, got {type(logs_data)}')
+        
+        raise ValueError('Either encrypted_data or logs field is required')
+    
+    def _save_log_batch(self, agent, log_entries):
+        """Save a batch of log entries in fixed-size chunks within one transaction
+        
+        Only INGEST_CHUNK_SIZE entries (and their model objects) are held at
+        a time, so memory stays flat however large the batch is.
+        """
+        counts = {
+            'logs_processed': 0,
+            'metrics_saved': 0,
+            'sessions_saved': 0,
+            'alerts_generated': 0,
+        }
+        log_entries = iter(log_entries)
+        
+        # Alerts raised for earlier chunks roll back along with a failing
+        # batch, and so does their cooldown
+        with alert_cooldown.forget_on_error(), transaction.atomic():
+            while True:
+                chunk = list(islice(log_entries, settings.INGEST_CHUNK_SIZE))
+                if not chunk:
+                    break
+                for key, value in self._save_log_chunk(agent, chunk).items():
+                    counts[key] += value
+        
+        return counts
+    
+    def _save_log_chunk(self, agent, log_entries):
+        """Save a chunk of log entries with a handful of bulk inserts"""
+        system_logs = []
+        host_metrics = []
+        process_snapshots = []
+        sessions = {}
+        parsed_entries = []
+        # (SystemLog, session keys) per entry, for stripping
+        stored_entries = []
+        
+        for log_entry in log_entries:
+            try:
+                # Ensure log_entry is a dict
+                if not isinstance(log_entry, dict):
+                    logger.warning(f"Skipping non-dict log entry: {type(log_entry)}")
+                    continue
+                
+                timestamp = self._parse_timestamp(log_entry.get('timestamp'))
+                system_log = SystemLog(agent=agent, timestamp=timestamp, data=log_entry)
+                system_log.extract_hot_fields()
+                system_logs.append(system_log)
+                parsed_entries.append((log_entry, timestamp))
+                
+                # Extract host metrics from resource_anomalies
+                try:
+                    host_metric = self._build_host_metric(agent, log_entry, timestamp)
+                    if host_metric:
+                        host_metrics.append(host_metric)
+                except Exception as metric_error:
+                    logger.error(f"Error building host metric: {metric_error}")
+                
+                # Collect user sessions, deduplicated within the batch
+                session_keys = []
+                for session in self._build_user_sessions(agent, log_entry, timestamp):
+                    key = (session.username, session.pid, session.login_time)
+                    sessions.setdefault(key, session)
+                    session_keys.append(key)
+                stored_entries.append((system_log, session_keys))
+                
+                # Process snapshot if available
+                process_data = log_entry.get('process_system_activity', {})
+                if process_data:
+                    process_snapshots.append((timestamp, {
+                        'total_processes': process_data.get('total_processes', 0),
+                        'root_processes': process_data.get('root_processes', 0),
+                        'top_cpu_processes': process_data.get('top_cpu_processes', []),
+                        'top_memory_processes': process_data.get('top_memory_processes', []),
+                        'load_average': process_data.get('load_average', [])
+                    }))
+                    
+            except Exception as log_error:
+                logger.error(f"Error processing log entry: {log_error}")
+                import traceback
+                logger.error(f"Traceback: {traceback.format_exc()}")
+                continue
+        
+        _, evaluate_metrics = store_samples(agent, host_metrics, 'logs')
+        save_process_snapshots(agent, process_snapshots)
+        
+        # Skip sessions stored by a previous upload; the unique constraint
+        # absorbs any row a concurrent upload inserted in the meantime
+        new_sessions = []
+        if sessions:
+            existing = set(UserSession.objects.filter(
+                agent=agent,
+                username__in={key[0] for key in sessions},
+                login_time__gte=min(key[2] for key in sessions)
+            ).values_list('username', 'pid', 'login_time'))
+            new_sessions = [s for key, s in sessions.items() if key not in existing]
+            UserSession.objects.bulk_create(new_sessions, ignore_conflicts=True)
+        
+        # Metrics and sessions are stored first so the logs can reference them
+        if settings.SYSTEMLOG_STRIP_NORMALIZED:
+            stored = stored_sessions(agent, set(sessions))
+            for system_log, session_keys in stored_entries:
+                strip_normalized(
+                    system_log,
+                    sessions=[stored[key] for key in session_keys] if all(key in stored for key in session_keys) else None
+                )
+        compress_logs(system_logs)
+        SystemLog.objects.bulk_create(system_logs)
+        record_log_counts(system_logs)
+        
+        # Alerting runs after the chunk is stored so a failing rule can't lose data;
+        # resource thresholds only for samples this path is authoritative for
+        for host_metric in evaluate_metrics:
+            try:
+                self._check_resource_thresholds(agent, host_metric)
+            except Exception as threshold_error:
+                logger.error(f"Error checking thresholds: {threshold_error}")
+        
+        alerts_generated = 0
+        for log_entry, timestamp in parsed_entries:
+            try:
+                alerts = self._generate_security_alerts(agent, log_entry, timestamp)
+                alerts_generated += len(alerts)
+            except Exception as alert_error:
+                logger.error(f"Error generating alerts: {alert_error}")
+        
+        return {
+            'logs_processed': len(system_logs),
+            'metrics_saved': len(host_metrics),
+            'sessions_saved': len(new_sessions),
+            'alerts_generated': alerts_generated,
+        }
+    
+    def _parse_timestamp(self, timestamp):
+        """Parse an agent timestamp into an aware datetime"""
+        if isinstance(timestamp, str):
+            timestamp = timestamp.replace('Z', '+00:00')
+            try:
+                timestamp = datetime.fromisoformat(timestamp)
+            except ValueError:
+                timestamp = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S.%f')
+            
+            if timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+        elif timestamp is None:
+            timestamp = timezone.now()
+        return timestamp
+    
+    def _build_host_metric(self, agent, log_entry, timestamp):
+        """Build an unsaved HostMetric from a log entry's resource_anomalies"""
+        resource_data = log_entry.get('resource_anomalies', {})
+        if not resource_data:
+            return None
+        
+        # Get network data
+        network_data = log_entry.get('network_connection', {})
+        
+        # Log entries carry no totals; they stay 0 unless upload_metrics fills them in
+        return HostMetric(
+            agent=agent,
+            timestamp=timestamp,
+            cpu_usage=resource_data.get('cpu_percent', 0.0),
+            memory_usage=resource_data.get('memory_percent', 0.0),
+            disk_usage=resource_data.get('disk_percent', 0.0),
+            network_sent=network_data.get('bytes_sent', 0),
+            network_received=network_data.get('bytes_recv', 0)
+        )
+    
+    def _build_user_sessions(self, agent, log_entry, timestamp):
+        """Build unsaved UserSession objects from a log entry's users_logged_in"""
+        sessions = []
+        users_data = log_entry.get('users_logged_in', {})
+        if not isinstance(users_data, dict):
+            return sessions
+        
+        for user_data in users_data.get('users', []):
+            try:
+                login_time = user_data.get('started', 0)
+                if isinstance(login_time, (int, float)):
+                    if login_time > 0:
+                        login_time = datetime.fromtimestamp(login_time, tz=timezone.utc)
+                    else:
+                        login_time = timestamp
+                else:
+                    login_time = self._parse_timestamp(login_time)
+                
+                # Normalize host address
+                host = user_data.get('host', '0.0.0.0')
+                if host in [':1', '::1']:
+                    host = '127.0.0.1'
+                elif not host or host == ':0.0.0.0' or host.startswith(':'):
+                    host = '0.0.0.0'
+                
+                # Agents may report a hostname (e.g. an X display or ssh client
+                # name); the column only takes addresses
+                try:
+                    host = str(ipaddress.ip_address(host))
+                except ValueError:
+                    host = '0.0.0.0'
+                
+                session = UserSession(
+                    agent=agent,
+                    username=user_data.get('name', 'unknown'),
+                    terminal=user_data.get('terminal', 'unknown'),
+                    host=host,
+                    login_time=login_time,
+                    pid=int(user_data.get('pid', 0))
+                )
+                # One bad session must not fail the batch's bulk insert
+                for field in ('username', 'terminal'):
+                    if len(getattr(session, field)) > UserSession._meta.get_field(field).max_length:
+                        raise ValueError(f"{field} too long")
+                sessions.append(session)
+            except Exception as user_error:
+                logger.warning(f"Error parsing user session: {user_error}")
+        
+        return sessions
+
     def _generate_security_alerts(self, agent, log_entry, timestamp):
         """Generate security alerts based on log data"""
         alerts_created = []
@@ -719,86 +916,45 @@ class SystemLogViewSet(viewsets.ModelViewSet):
 
     def _create_alert_if_not_exists(self, agent, title, description, level, alert_type='system', metadata=None, timestamp=None):
         """Create alert only if similar alert doesn't exist recently"""
-        recent_time = timezone.now() - timedelta(minutes=30)
-        
-        # Check for existing similar unresolved alerts
-        existing = Alert.objects.filter(
+        # triggered_at is auto_now_add, so the entry timestamp is informational only
+        return create_deduplicated_alert(
             agent=agent,
             title=title,
-            resolved=False,
-            triggered_at__gte=recent_time
-        ).exists()
-        
-        if not existing:
-            alert_data = {
-                'agent': agent,
-                'title': title,
-                'description': description,
-                'level': level,
-                'alert_type': alert_type,
-                'triggered_at': timestamp or timezone.now(),
-                'resolved': False
-            }
-            
-            if metadata:
-                alert_data['metadata'] = metadata
-                
-            alert = Alert.objects.create(**alert_data)
-            logger.info(f"Created alert: {title} (Level: {level}, Type: {alert_type})")
-            return alert
-        
-        return None
+            description=description,
+            level=level,
+            alert_type=alert_type,
+            metadata=metadata
+        )
     
     def _check_resource_thresholds(self, agent, metric):
         """Check resource thresholds and generate alerts"""
-        thresholds = ResourceThreshold.objects.filter(is_active=True)
-        
-        for threshold in thresholds:
+        for threshold, current_value, resource_type in exceeded_thresholds(metric):
             try:
-                should_alert = False
-                current_value = 0
-                resource_type = ''
-                
-                if threshold.resource_type == 'cpu' and metric.cpu_usage > threshold.threshold_value:
-                    should_alert = True
-                    current_value = metric.cpu_usage
-                    resource_type = 'CPU'
-                
-                elif threshold.resource_type == 'memory' and metric.memory_usage > threshold.threshold_value:
-                    should_alert = True
-                    current_value = metric.memory_usage
-                    resource_type = 'Memory'
-                
-                elif threshold.resource_type == 'disk' and metric.disk_usage > threshold.threshold_value:
-                    should_alert = True
-                    current_value = metric.disk_usage
-                    resource_type = 'Disk'
+                alert_level = 'critical' if current_value > 95 else 'high' if current_value > 85 else 'medium'
                 
-                if should_alert:
-                    alert_level = 'critical' if current_value > 95 else 'high' if current_value > 85 else 'medium'
-                    
-                    self._create_alert_if_not_exists(
-                        agent=agent,
-                        title=f"{resource_type} threshold exceeded: {threshold.name}",
-                        description=f"{resource_type} usage {current_value:.1f}% exceeds threshold {threshold.threshold_value}% on {agent.hostname}",
-                        level=alert_level,
-                        alert_type='resource',
-                        metadata={
-                            'resource_type': resource_type.lower(),
-                            'current_value': current_value,
-                            'threshold_value': threshold.threshold_value,
-                            'threshold_name': threshold.name
-                        },
-                        timestamp=metric.timestamp
-                    )
+                self._create_alert_if_not_exists(
+                    agent=agent,
+                    title=f"{resource_type} threshold exceeded: {threshold.name}",
+                    description=f"{resource_type} usage {current_value:.1f}% exceeds threshold {threshold.threshold_value}% on {agent.hostname}",
+                    level=alert_level,
+                    alert_type='resource',
+                    metadata={
+                        'resource_type': resource_type.lower(),
+                        'current_value': current_value,
+                        'threshold_value': threshold.threshold_value,
+                        'threshold_name': threshold.name
+                    },
+                    timestamp=metric.timestamp
+                )
                         
             except Exception as e:
                 logger.error(f"Error checking threshold {threshold.name}: {str(e)}")
 
 class AlertViewSet(viewsets.ModelViewSet):
-    queryset = Alert.objects.all().order_by('-triggered_at')
+    queryset = Alert.objects.select_related('agent').order_by('-triggered_at', '-id')
     serializer_class = AlertSerializer
-    # Remove pagination_class = None to enable default pagination
+    pagination_class = KeysetPagination
+    keyset_field = 'triggered_at'
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -846,7 +1002,14 @@ class AlertViewSet(viewsets.ModelViewSet):
         alert = self.get_object()
         alert.resolved = False
         alert.resolved_at = None
-        alert.save()
+        try:
+            with transaction.atomic():
+                alert.save()
+        except IntegrityError:
+            return Response(
+                {'error': 'Another open alert already exists for this rule'},
+                status=status.HTTP_409_CONFLICT
+            )
         
         serializer = self.get_serializer(alert)
         return Response({
@@ -896,10 +1059,12 @@ class AlertViewSet(viewsets.ModelViewSet):
                 )
             
             alerts = Alert.objects.filter(id__in=alert_ids)
+            fingerprints = list(alerts.filter(resolved=False).values_list('fingerprint', flat=True))
             updated_count = alerts.update(
                 resolved=True,
                 resolved_at=timezone.now()
             )
+            alert_cooldown.forget(fingerprints)
             
             logger.info(f"Bulk resolved {updated_count} alerts")
             
@@ -937,10 +1102,7 @@ class AlertViewSet(viewsets.ModelViewSet):
                 )
             
             alerts = Alert.objects.filter(id__in=alert_ids)
-            updated_count = alerts.update(
-                resolved=False,
-                resolved_at=None
-            )
+            updated_count = Alert.reopen(alerts)
             
             logger.info(f"Bulk unresolved {updated_count} alerts")
             
@@ -977,11 +1139,8 @@ class AlertViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            alerts = Alert.objects.filter(id__in=alert_ids)
-            deleted_count = alerts.count()
-            
-            # Delete alerts
-            alerts.delete()
+            # Delete alerts in short chunked transactions
+            deleted_count = purge(Alert, {'id__in': alert_ids}, reason='alert_bulk_delete').deleted
             
             logger.info(f"Bulk deleted {deleted_count} alerts")
             
@@ -1020,8 +1179,10 @@ class AlertViewSet(viewsets.ModelViewSet):
         logger.info(f"Would send Discord resolution for alert: {alert.title}")
 
 class UserSessionViewSet(viewsets.ModelViewSet):
-    queryset = UserSession.objects.all().order_by('-login_time')
+    queryset = UserSession.objects.select_related('agent').order_by('-login_time', '-id')
     serializer_class = UserSessionSerializer
+    pagination_class = KeysetPagination
+    keyset_field = 'login_time'
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -1055,62 +1216,104 @@ class HostMetricViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
     
-    # In your HostMetricViewSet, enhance the get_queryset method:
     def get_queryset(self):
-        queryset = super().get_queryset()
-
-        # Log all query parameters
-        logger.info(f"🔍 METRICS API CALL - All query params: {dict(self.request.query_params)}")
-
+        queryset = super().get_queryset().select_related('agent')
+        
         # Filter by agent
         agent_id = self.request.query_params.get('agent_id')
-        logger.info(f"🔍 Agent ID from request: '{agent_id}' (type: {type(agent_id)})")
-
         if agent_id and agent_id != 'null':
             try:
-                agent_id_int = int(agent_id)
-                initial_count = queryset.count()
-                queryset = queryset.filter(agent_id=agent_id_int)
-                filtered_count = queryset.count()
-                logger.info(f"🔍 Agent filtering - Before: {initial_count}, After: {filtered_count}")
+                queryset = queryset.filter(agent_id=int(agent_id))
             except (ValueError, TypeError) as e:
-                logger.error(f"🔍 Invalid agent ID: '{agent_id}', error: {e}")
-                pass
+                logger.error(f"Invalid agent ID: '{agent_id}', error: {e}")
             
         # Filter by time range
         hours = self.request.query_params.get('hours', 24)
-        logger.info(f"🔍 Hours parameter: '{hours}' (type: {type(hours)})")
-
         try:
-            hours_int = int(hours)
-            time_threshold = timezone.now() - timedelta(hours=hours_int)
-            initial_count = queryset.count()
-            queryset = queryset.filter(timestamp__gte=time_threshold)
-            filtered_count = queryset.count()
-            logger.info(f"🔍 Time filtering - Hours: {hours_int}, Before: {initial_count}, After: {filtered_count}")
-            logger.info(f"🔍 Time threshold: {time_threshold}")
-            logger.info(f"🔍 Current time: {timezone.now()}")
+            queryset = queryset.filter(timestamp__gte=timezone.now() - timedelta(hours=int(hours)))
         except (ValueError, TypeError) as e:
-            logger.error(f"🔍 Invalid hours parameter: '{hours}', error: {e}")
-
-        final_count = queryset.count()
-        logger.info(f"🔍 FINAL QUERYSET COUNT: {final_count}")
-
-        # Log a few sample records
-        if final_count > 0:
-            samples = queryset[:3]
-            logger.info(f"🔍 SAMPLE METRICS ({len(samples)}):")
-            for i, sample in enumerate(samples):
-                logger.info(f"🔍   {i+1}. ID: {sample.id}, Time: {sample.timestamp}, CPU: {sample.cpu_usage}%")
-        else:
-            logger.warning("🔍 NO METRICS FOUND AFTER FILTERING!")
-
-            # Debug: check what happens without time filtering
-            no_time_filter = HostMetric.objects.filter(agent_id=agent_id)
-            logger.info(f"🔍 DEBUG - Without time filter: {no_time_filter.count()} metrics")
-
+            logger.error(f"Invalid hours parameter: '{hours}', error: {e}")
+        
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """Serve long ranges for one agent from the coarsest adequate rollup tier"""
+        agent_id = request.query_params.get('agent_id')
+        try:
+            agent_id = int(agent_id)
+            hours = int(request.query_params.get('hours', 24))
+            points = int(request.query_params.get('points', settings.METRIC_CHART_POINTS))
+        except (ValueError, TypeError):
+            return super().list(request, *args, **kwargs)
+        
+        resolution = request.query_params.get('resolution') or pick_resolution(hours * 3600, points)
+        if resolution == 'raw' or resolution not in HostMetricRollup.RESOLUTION_SECONDS:
+            return super().list(request, *args, **kwargs)
+        
+        rollups = HostMetricRollup.objects.filter(
+            agent_id=agent_id,
+            resolution=resolution,
+            bucket__gte=bucket_start(
+                timezone.now() - timedelta(hours=hours),
+                HostMetricRollup.RESOLUTION_SECONDS[resolution]
+            )
+        ).select_related('agent').order_by('-bucket')
+        return Response(HostMetricRollupSerializer(rollups, many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """Time-bucketed metrics for one agent as columnar arrays
+        
+        Query params: agent_id, start, end (ISO 8601 or epoch seconds),
+        step (seconds or a rollup tier such as '5m') and aggregation
+        (avg, max, min or p95).
+        """
+        params = request.query_params
+        try:
+            agent_id = int(params['agent_id'])
+        except (KeyError, ValueError):
+            return Response({'error': 'agent_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            end = parse_query_time(params.get('end')) or timezone.now()
+            start = parse_query_time(params.get('start')) or end - timedelta(hours=24)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if start >= end:
+            return Response({'error': 'start must be before end'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        span = (end - start).total_seconds()
+        step = params.get('step')
+        try:
+            if step in HostMetricRollup.RESOLUTION_SECONDS:
+                step = HostMetricRollup.RESOLUTION_SECONDS[step]
+            elif step:
+                step = int(step)
+            else:
+                step = max(60, int(span // settings.METRIC_CHART_POINTS))
+        except ValueError:
+            return Response({'error': f'Invalid step: {step}'}, status=status.HTTP_400_BAD_REQUEST)
+        if step <= 0 or span / step > settings.METRIC_SERIES_MAX_POINTS:
+            return Response({
+                'error': f'step must give at most {settings.METRIC_SERIES_MAX_POINTS} points'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        aggregation = params.get('aggregation', 'avg')
+        if aggregation not in SERIES_AGGREGATIONS:
+            return Response({
+                'error': f'aggregation must be one of {", ".join(SERIES_AGGREGATIONS)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        series = metric_series(agent_id, start, end, step, aggregation)
+        return Response({
+            'agent_id': agent_id,
+            'start': start,
+            'end': end,
+            'step': step,
+            'aggregation': aggregation,
+            **series
+        })
+    
     @action(detail=False, methods=['post'])
     def upload_metrics(self, request):
         """Handle metric uploads from agents"""
@@ -1122,28 +1325,18 @@ class HostMetricViewSet(viewsets.ModelViewSet):
             data = serializer.validated_data
             
             # Get agent
-            try:
-                agent = MonitoringAgent.objects.get(hostname=data['hostname'])
-            except MonitoringAgent.DoesNotExist:
+            agent = agent_identity_cache.get(data['hostname'])
+            if agent is None:
                 return Response({'error': 'Agent not found'}, status=status.HTTP_404_NOT_FOUND)
             
-            # Save metric
-            metric = HostMetric.objects.create(
-                agent=agent,
-                timestamp=data['timestamp'],
-                cpu_usage=data['cpu_usage'],
-                memory_usage=data['memory_usage'],
-                memory_total=data['memory_total'],
-                memory_used=data['memory_used'],
-                disk_usage=data['disk_usage'],
-                disk_total=data['disk_total'],
-                disk_used=data['disk_used'],
-                network_sent=data['network_sent'],
-                network_received=data['network_received']
-            )
+            if settings.INGEST_ASYNC:
+                job = IngestJob.objects.create(kind='metrics', agent=agent, payload=request.data)
+                return Response({
+                    'status': 'queued',
+                    'job_id': job.id
+                }, status=status.HTTP_202_ACCEPTED)
             
-            # Check thresholds
-            self._check_thresholds(agent, metric)
+            metric = self._save_metric(agent, data)
             
             return Response({
                 'status': 'success',
@@ -1157,69 +1350,64 @@ class HostMetricViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _save_metric(self, agent, data):
+        """Merge validated metric upload data into its sample row and check thresholds"""
+        metric = HostMetric(
+            agent=agent,
+            timestamp=data['timestamp'],
+            cpu_usage=data['cpu_usage'],
+            memory_usage=data['memory_usage'],
+            memory_total=data['memory_total'],
+            memory_used=data['memory_used'],
+            disk_usage=data['disk_usage'],
+            disk_total=data['disk_total'],
+            disk_used=data['disk_used'],
+            network_sent=data['network_sent'],
+            network_received=data['network_received']
+        )
+        (metric,), evaluate = store_samples(agent, [metric], 'metrics')
+        
+        # Check thresholds
+        for sample in evaluate:
+            self._check_thresholds(agent, sample)
+        return metric
+    
     def _check_thresholds(self, agent, metric):
         """Check resource thresholds and generate alerts with cooldown"""
-        thresholds = ResourceThreshold.objects.filter(is_active=True)
-        
-        for threshold in thresholds:
+        for threshold, current_value, resource_type in exceeded_thresholds(metric):
             try:
-                should_alert = False
-                current_value = 0
-                resource_type = ''
-                
-                if (threshold.resource_type == 'cpu' and 
-                    metric.cpu_usage > threshold.threshold_value):
-                    should_alert = True
-                    current_value = metric.cpu_usage
-                    resource_type = 'CPU'
-                
-                elif (threshold.resource_type == 'memory' and 
-                      metric.memory_usage > threshold.threshold_value):
-                    should_alert = True
-                    current_value = metric.memory_usage
-                    resource_type = 'Memory'
-                
-                elif (threshold.resource_type == 'disk' and 
-                      metric.disk_usage > threshold.threshold_value):
-                    should_alert = True
-                    current_value = metric.disk_usage
-                    resource_type = 'Disk'
-                
-                if should_alert:
-                    if self._should_create_alert(agent, threshold, resource_type):
-                        self._create_threshold_alert(agent, threshold, current_value, resource_type)
+                self._create_threshold_alert(agent, threshold, current_value, resource_type)
                         
             except Exception as e:
                 logger.error(f"Error checking threshold {threshold.name}: {str(e)}")
     
-    def _should_create_alert(self, agent, threshold, resource_type):
-        """Check if we should create a new alert (cooldown logic)"""
-        recent_time = timezone.now() - timedelta(minutes=30)
-        
-        existing_alerts = Alert.objects.filter(
-            agent=agent,
-            title=f"{resource_type} threshold exceeded: {threshold.name}",
-            resolved=False,
-            triggered_at__gte=recent_time
-        )
-        
-        return not existing_alerts.exists()
-    
     def _create_threshold_alert(self, agent, threshold, current_value, resource_type):
-        """Create alert and send notifications"""
+        """Create alert (subject to the shared cooldown) for an exceeded threshold"""
         alert_level = 'critical' if current_value > 95 else 'high' if current_value > 85 else 'medium'
         
-        alert = Alert.objects.create(
+        create_deduplicated_alert(
             agent=agent,
             title=f"{resource_type} threshold exceeded: {threshold.name}",
             description=f"{resource_type} usage {current_value:.1f}% exceeds threshold {threshold.threshold_value}% on {agent.hostname}",
             level=alert_level,
-            resolved=False
+            alert_type='resource',
+            metadata={
+                'resource_type': resource_type.lower(),
+                'current_value': current_value,
+                'threshold_value': threshold.threshold_value,
+                'threshold_name': threshold.name
+            }
         )
-        
-        logger.info(f"Created alert: {alert.title} (Level: {alert.level})")
 
 class ProcessViewSet(viewsets.ViewSet):
+    # Sort keys for list_processes and the LiveProcess columns behind them
+    PROCESS_SORT_FIELDS = {
+        'cpu': 'cpu_percent',
+        'memory': 'memory_percent',
+        'pid': 'pid',
+        'name': 'name',
+    }
+    
     def get_permissions(self):
         """Allow agents to upload processes without frontend authentication"""
         if self.action == 'upload_processes':
@@ -1237,9 +1425,8 @@ class ProcessViewSet(viewsets.ViewSet):
                 return Response({'error': 'hostname is required'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Get agent
-            try:
-                agent = MonitoringAgent.objects.get(hostname=hostname)
-            except MonitoringAgent.DoesNotExist:
+            agent = agent_identity_cache.get(hostname)
+            if agent is None:
                 return Response({'error': 'Agent not found'}, status=status.HTTP_404_NOT_FOUND)
             
             # Get process data - support both field names for backward compatibility
@@ -1250,15 +1437,19 @@ class ProcessViewSet(viewsets.ViewSet):
                     'error': 'process_system_activity field is required'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            if settings.INGEST_ASYNC:
+                job = IngestJob.objects.create(kind='processes', agent=agent, payload=data)
+                return Response({
+                    'status': 'queued',
+                    'job_id': job.id
+                }, status=status.HTTP_202_ACCEPTED)
+            
             # Save process snapshot
-            snapshot = ProcessSnapshot.objects.create(
-                agent=agent,
-                processes=process_data
-            )
+            snapshot = self._save_process_snapshot(agent, process_data)
             
             return Response({
                 'status': 'success',
-                'snapshot_id': snapshot.id
+                'snapshot_id': snapshot.id if snapshot else None
             })
             
         except Exception as e:
@@ -1270,6 +1461,11 @@ class ProcessViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _save_process_snapshot(self, agent, process_data):
+        """Store a process list upload; returns its history row, or None if it was thinned out"""
+        history = save_process_snapshots(agent, [(timezone.now(), process_data)])
+        return history[0] if history else None
+    
     @action(detail=False, methods=['get'])
     def get_processes(self, request):
         """Get current processes for an agent"""
@@ -1285,9 +1481,18 @@ class ProcessViewSet(viewsets.ViewSet):
             else:
                 agent = MonitoringAgent.objects.get(hostname=hostname)
             
-            latest_snapshot = ProcessSnapshot.objects.filter(agent=agent).order_by('-timestamp').first()
+            # `at` reconstructs the list from history; default is the live snapshot
+            at = request.query_params.get('at')
+            if at:
+                try:
+                    snapshot = process_snapshot_at(agent.id, parse_query_time(at))
+                except ValueError as e:
+                    return Response({'error': str(e)}, status=400)
+            else:
+                latest = LatestProcessSnapshot.objects.filter(agent_id=agent.id).first()
+                snapshot = (latest.timestamp, expand_processes(latest.processes)) if latest else None
             
-            if not latest_snapshot:
+            if not snapshot:
                 return Response({
                     'hostname': agent.hostname,
                     'timestamp': timezone.now().isoformat(),
@@ -1301,7 +1506,7 @@ class ProcessViewSet(viewsets.ViewSet):
                     'load_average': []
                 })
             
-            processes_data = latest_snapshot.processes
+            snapshot_time, processes_data = snapshot
             
             # Extract process information
             total_processes = processes_data.get('total_processes', 0)
@@ -1320,7 +1525,7 @@ class ProcessViewSet(viewsets.ViewSet):
             
             return Response({
                 'hostname': agent.hostname,
-                'timestamp': latest_snapshot.timestamp,
+                'timestamp': snapshot_time,
                 'total_processes': total_processes,
                 'root_processes': root_processes,
                 'page': page,
@@ -1337,6 +1542,87 @@ class ProcessViewSet(viewsets.ViewSet):
             logger.error(f"Error getting processes: {str(e)}")
             return Response({'error': str(e)}, status=500)
 
+    @action(detail=False, methods=['get'])
+    def list_processes(self, request):
+        """Filter, sort and page an agent's full process list
+        
+        Query params: hostname or agent_id; sort (cpu, memory, pid or name,
+        prefix '-' for descending, default -memory); filters user, name
+        (substring), status, is_root; page and page_size.
+        """
+        params = request.query_params
+        hostname = params.get('hostname')
+        agent_id = params.get('agent_id')
+        
+        if not hostname and not agent_id:
+            return Response({'error': 'hostname or agent_id parameter required'}, status=400)
+        
+        sort = params.get('sort', '-memory')
+        descending = sort.startswith('-')
+        sort_field = self.PROCESS_SORT_FIELDS.get(sort.lstrip('-'))
+        if sort_field is None:
+            return Response({
+                'error': f"sort must be one of {', '.join(self.PROCESS_SORT_FIELDS)} (prefix '-' for descending)"
+            }, status=400)
+        
+        try:
+            page = max(1, int(params.get('page', 1)))
+            page_size = min(max(1, int(params.get('page_size', 50))), 500)
+        except ValueError:
+            return Response({'error': 'page and page_size must be integers'}, status=400)
+        
+        try:
+            if agent_id:
+                agent = MonitoringAgent.objects.get(id=agent_id)
+            else:
+                agent = MonitoringAgent.objects.get(hostname=hostname)
+        except (MonitoringAgent.DoesNotExist, ValueError):
+            return Response({'error': 'Agent not found'}, status=404)
+        
+        # Only the summary keys are read out of the stored JSON, not the process lists
+        summary = LatestProcessSnapshot.objects.filter(agent_id=agent.id).values(
+            'timestamp',
+            'processes__total_processes',
+            'processes__root_processes',
+            'processes__load_average'
+        ).first() or {}
+        
+        processes = LiveProcess.objects.filter(agent_id=agent.id)
+        if params.get('user'):
+            processes = processes.filter(user=params['user'])
+        if params.get('name'):
+            processes = processes.filter(name__icontains=params['name'])
+        if params.get('status'):
+            processes = processes.filter(status=params['status'])
+        if params.get('is_root') in ('true', 'false'):
+            processes = processes.filter(is_root=params['is_root'] == 'true')
+        
+        count = processes.count()
+        ordering = [f'-{sort_field}', '-pid'] if descending else [sort_field, 'pid']
+        fields = ['pid', 'name', 'user', 'cpu_percent', 'memory_percent', 'cmdline', 'status', 'is_root']
+        start = (page - 1) * page_size
+        page_rows = list(processes.order_by(*ordering).values(*fields)[start:start + page_size])
+        live = LiveProcess.objects.filter(agent_id=agent.id)
+        top_cpu = list(live.order_by('-cpu_percent', '-pid').values(*fields)[:10])
+        # Kept for clients of the response this endpoint used to give
+        top_memory = list(live.order_by('-memory_percent', '-pid').values(*fields)[:10])
+        
+        return Response({
+            'hostname': agent.hostname,
+            'timestamp': summary.get('timestamp'),
+            'total_processes': summary.get('processes__total_processes') or 0,
+            'root_processes': summary.get('processes__root_processes') or 0,
+            'load_average': summary.get('processes__load_average') or [],
+            'top_cpu_processes': top_cpu,
+            'top_memory_processes': top_memory,
+            'sort': sort,
+            'count': count,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (count + page_size - 1) // page_size,
+            'processes': page_rows
+        })
+
 class ResourceThresholdViewSet(viewsets.ModelViewSet):
     queryset = ResourceThreshold.objects.all()
     serializer_class = ResourceThresholdSerializer
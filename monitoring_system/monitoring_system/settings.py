@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'monitoring.middleware.RequestDecompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -158,3 +159,115 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Monitoring ingest settings
+# Max number of PBKDF2-derived agent keys kept in memory per worker process
+ENCRYPTION_KEY_CACHE_SIZE = 1024
+
+# When True, upload endpoints only queue the raw payload and return 202;
+# run `manage.py run_ingest_workers` to process the queue
+INGEST_ASYNC = os.environ.get('INGEST_ASYNC', 'false').lower() == 'true'
+# Failed jobs are retried until they reach this many attempts
+INGEST_MAX_ATTEMPTS = 3
+# Seconds before a failed job's first retry; doubles with each further attempt
+INGEST_RETRY_DELAY = 30
+# Jobs stuck in 'processing' longer than this (seconds) are handed out again
+INGEST_JOB_TIMEOUT = 300
+
+# When True, upload_logs leaves out of SystemLog.data the values already held
+# by its typed columns, HostMetric and UserSession rows (see
+# monitoring.logstorage); the API puts them back on read
+SYSTEMLOG_STRIP_NORMALIZED = os.environ.get('SYSTEMLOG_STRIP_NORMALIZED', 'false').lower() == 'true'
+
+# When True (and zstandard is installed), upload_logs stores entries
+# zstd-compressed in SystemLog.payload with the newest dictionary from
+# `manage.py train_log_dictionary`
+SYSTEMLOG_COMPRESSION = os.environ.get('SYSTEMLOG_COMPRESSION', 'false').lower() == 'true'
+SYSTEMLOG_COMPRESSION_LEVEL = 3
+
+# `manage.py archive_logs` moves SystemLog rows older than this many days into
+# compressed per-agent, per-day segment files here; the logs API reads them
+# back when `hours=` reaches that far
+SYSTEMLOG_ARCHIVE_DIR = os.environ.get('SYSTEMLOG_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+SYSTEMLOG_ARCHIVE_AFTER_DAYS = 14
+SYSTEMLOG_ARCHIVE_LEVEL = 9
+
+# A sample from one upload path is merged into the HostMetric row of the
+# nearest unmerged sample from the other path, if that is at most this many
+# seconds away; it only has to cover the gap between the two collections of
+# one agent cycle
+HOST_METRIC_MATCH_SECONDS = 30
+# Seconds a sample from the non-authoritative path waits for its authoritative
+# partner before it goes through threshold checks itself; keep it above the
+# agents' log batching delay
+HOST_METRIC_MATCH_WAIT = 600
+
+# Seconds a worker may keep its threshold rules before reloading them regardless.
+# Threshold changes reach other workers right away only if CACHES points at a
+# backend they share (Redis/Memcached); with the default per-process cache
+# they are picked up after this long
+THRESHOLD_CACHE_MAX_AGE = 300
+
+# Seconds an agent's hostname lookup is served from the cache on upload endpoints
+AGENT_IDENTITY_CACHE_TTL = 60
+
+# Upper bound for gzip/zstd request bodies once decompressed (zstd needs the
+# optional `zstandard` package)
+MAX_DECOMPRESSED_REQUEST_SIZE = 50 * 1024 * 1024
+
+# Log uploads are parsed and written this many entries at a time
+INGEST_CHUNK_SIZE = 500
+
+# Target number of points for metric charts; GET /metrics/ serves the coarsest
+# rollup tier (1m/5m/1h/1d) giving about this many. Run `manage.py build_rollups`
+# periodically to fold in late samples.
+METRIC_CHART_POINTS = 300
+# Upper bound on buckets returned by GET /metrics/series/
+METRIC_SERIES_MAX_POINTS = 5000
+
+# Range partitions on `timestamp` (Postgres only). `manage.py manage_partitions`
+# creates `premake` intervals ahead and drops partitions past the model's
+# RETENTION_POLICIES age; run it daily.
+TIME_PARTITIONS = {
+    'monitoring.SystemLog': {'interval': 'day', 'premake': 7},
+    'monitoring.HostMetric': {'interval': 'week', 'premake': 2},
+}
+
+# Per-model age limits applied by `manage.py enforce_retention`: rows whose
+# `field` is older than `days` (and match the optional `filters`) are purged
+RETENTION_POLICIES = {
+    'monitoring.SystemLog': {'field': 'timestamp', 'days': 30},
+    'monitoring.HostMetric': {'field': 'timestamp', 'days': 90},
+    'monitoring.HostMetricRollup': {'field': 'bucket', 'days': 400},
+    'monitoring.ProcessSnapshot': {'field': 'timestamp', 'days': 14},
+    'monitoring.UserSession': {'field': 'login_time', 'days': 90},
+    'monitoring.Alert': {'field': 'triggered_at', 'days': 180, 'filters': {'resolved': True}},
+    'monitoring.SystemLogHourlyCount': {'field': 'hour', 'days': 30},
+}
+
+# Purges delete at most this many rows per transaction and sleep in between
+# so they never hold locks for long; a task idle this long (seconds) in
+# 'running' is considered dead and resumed
+PURGE_CHUNK_SIZE = 5000
+PURGE_CHUNK_PAUSE = 0.1
+PURGE_STALE_AFTER = 300
+# DELETE /api/agents/{id}/ purges the agent's data before it responds. Set
+# this once `manage.py enforce_retention --resume-only` runs every few minutes
+# to only queue the purge and answer 202 right away.
+AGENT_PURGE_IN_BACKGROUND = False
+
+# The live process view reads one LatestProcessSnapshot row per agent; a
+# ProcessSnapshot history row is kept at most once per this many seconds
+PROCESS_HISTORY_INTERVAL = 300
+
+# Every this many history rows is a full keyframe; the rows in between
+# only store which processes changed since the previous row
+PROCESS_KEYFRAME_INTERVAL = 24
+
+# Interned process strings (names, users, cmdlines) each worker keeps decoded in memory
+PROCESS_STRING_CACHE_SIZE = 100000
+
+# Seconds the dashboard counters (/api/agents/stats/) are served from the cache.
+# With the default per-process cache each worker computes its own copy once per
+# TTL; point CACHES at a backend they share (Redis/Memcached) to compute it once
+DASHBOARD_STATS_TTL = 15